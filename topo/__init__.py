@@ -231,6 +231,17 @@ from topo.misc.featurecoordinators import feature_coordinators
 imagen.patterncoordinator.PatternCoordinator.feature_coordinators.update(feature_coordinators)
 
 
+# The analysis, plotting, GUI and command packages are slow to import
+# (pulling in featuremapper, matplotlib and Tk), and are not needed to
+# build and run a model, so they are only imported on first use;
+# until then e.g. topo.command is a placeholder.
+from topo.misc.util import LazyModule
+for _name in ['analysis','command','plotting','tkgui']:
+    if 'topo.'+_name not in sys.modules:
+        globals()[_name] = LazyModule('topo.'+_name)
+del _name
+
+
 def about(display=True):
     """Print release and licensing information."""
 
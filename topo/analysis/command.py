@@ -20,7 +20,7 @@ from featuremapper.command import * # pyflakes:ignore (API import)
 import topo
 from topo.base.cf import CFSheet, Projection
 from topo.base.sheet import Sheet
-from topo.base.arrayutil import centroid
+from topo.base.arrayutil import centroids, pack_cfs
 from topo.misc.attrdict import AttrDict
 from topo.analysis.featureresponses import pattern_present, pattern_response, update_activity  # pyflakes:ignore (API import)
 
@@ -121,6 +121,45 @@ class update_projectionactivity(ProjectionSheetMeasurementCommand):
 
 
 
+def cf_cogs(projections,chunk_size=1024):
+    """
+    Return a list of (xcog,ycog) arrays, one pair for each of the
+    given CFProjections, holding the center of gravity (in the sheet
+    coordinates of the projection's source) of the CF of every unit.
+
+    The weights of up to chunk_size CFs of a projection at a time are
+    packed (with pack_cfs) into a zero-padded array of the weights' own
+    type, so that
+    the weighted row and column centroids are computed for the whole
+    chunk at once rather than unit by unit; these are then offset by
+    the position of each CF's input_sheet_slice. Null CFs give a CoG
+    of NaN.
+    """
+    cogs = []
+    for proj in projections:
+        flatcfs = proj.flatcfs
+        weights = [cf.weights for cf in flatcfs if cf is not None]
+        max_rows = max([w.shape[0] for w in weights] or [0])
+        max_cols = max([w.shape[1] for w in weights] or [0])
+        dtype = weights[0].dtype if weights else np.float32
+
+        packed = np.zeros((min(chunk_size,len(flatcfs)),max_rows,max_cols),dtype=dtype)
+        row_centroids = np.empty(len(flatcfs),dtype=np.float64)
+        col_centroids = np.empty(len(flatcfs),dtype=np.float64)
+        for start in range(0,len(flatcfs),chunk_size):
+            chunk = flatcfs[start:start+chunk_size]
+            chunk_weights,shapes,offsets = pack_cfs(chunk,out=packed)
+            chunk_rows,chunk_cols = centroids(chunk_weights)
+            row_centroids[start:start+len(chunk)] = chunk_rows + offsets[:,0] + 0.5
+            col_centroids[start:start+len(chunk)] = chunk_cols + offsets[:,1] + 0.5
+
+        shape = proj.dest.activity.shape
+        xcog,ycog = proj.src.matrix2sheet(row_centroids,col_centroids)
+        cogs.append((np.reshape(xcog,shape),np.reshape(ycog,shape)))
+    return cogs
+
+
+
 class measure_cog(ParameterizedFunction):
     """
     Calculate center of gravity (CoG) for each CF of each unit in each CFSheet.
@@ -164,13 +203,14 @@ class measure_cog(ParameterizedFunction):
         # only a fixed-named plot).
         requested_proj=p.proj_name
         for sheet in measured_sheets:
-            for proj in sheet.in_connections:
-                if (proj.name == requested_proj) or \
-                   (requested_proj == '' and (proj.src != sheet)):
-                    cog_data = self._update_proj_cog(p, proj)
-                    for key, data in cog_data.items():
-                        name = proj.name[0].upper() + proj.name[1:]
-                        results.set_path((key, name), data)
+            projs = [proj for proj in sheet.in_connections
+                     if (proj.name == requested_proj) or \
+                        (requested_proj == '' and (proj.src != sheet))]
+            for proj,(xcog,ycog) in zip(projs,cf_cogs(projs)):
+                cog_data = self._update_proj_cog(p, proj, xcog, ycog)
+                for key, data in cog_data.items():
+                    name = proj.name[0].upper() + proj.name[1:]
+                    results.set_path((key, name), data)
 
 
         if p.measurement_storage_hook:
@@ -179,25 +219,10 @@ class measure_cog(ParameterizedFunction):
         return results
 
 
-    def _update_proj_cog(self, p, proj):
-        """Measure the CoG of the specified projection and register corresponding SheetViews."""
+    def _update_proj_cog(self, p, proj, xcog, ycog):
+        """Register SheetViews for the given CoG arrays of the specified projection."""
 
         sheet = proj.dest
-        rows, cols = sheet.activity.shape
-        xcog = np.zeros((rows, cols), np.float64)
-        ycog = np.zeros((rows, cols), np.float64)
-
-        for r in xrange(rows):
-            for c in xrange(cols):
-                cf = proj.cfs[r, c]
-                r1, r2, c1, c2 = cf.input_sheet_slice
-                row_centroid, col_centroid = centroid(cf.weights)
-                xcentroid, ycentroid = proj.src.matrix2sheet(
-                    r1 + row_centroid + 0.5,
-                    c1 + col_centroid + 0.5)
-
-                xcog[r][c] = xcentroid
-                ycog[r][c] = ycentroid
 
         metadata = AttrDict(precedence=sheet.precedence,
                             row_precedence=sheet.row_precedence,
@@ -146,6 +146,14 @@ class pattern_present(PatternPresentingCommand):
     return_responses = param.Boolean(default=False, doc="""
         If True, return a dictionary of the responses.""")
 
+    response_accumulator = param.Callable(default=None, doc="""
+        If set, called after each duration with the current time and
+        dictionaries of the input (GeneratorSheet) and output
+        activities, instead of storing copies of the responses.  The
+        activities are passed without copying, so the accumulator must
+        fold them into its own state before returning (see
+        ResponseAccumulator).""")
+
     __abstract = True
 
     def __call__(self, inputs={}, outputs=[], **params_to_override):
@@ -199,7 +207,16 @@ class pattern_present(PatternPresentingCommand):
             if hasattr(topo, 'guimain'):
                 update_activity(p.install_sheetview)
                 topo.guimain.refresh_activity_windows()
-            if p.return_responses:
+            if p.response_accumulator is not None:
+                stimuli = dict((name, g.activity) for name, g in generatorsheets.items())
+                activities = {}
+                for output in outputs:
+                    if output in topo.sim.objects(Sheet).keys():
+                        activities[output] = topo.sim[output].activity
+                    elif output in projection_dict:
+                        activities[output] = projection_dict[output].activity
+                p.response_accumulator(time, stimuli, activities)
+            elif p.return_responses:
 
                 for output in outputs:
                     if output in topo.sim.objects(Sheet).keys():
@@ -299,6 +316,176 @@ class pattern_response(pattern_present):
 
 
 
+class ResponseAccumulator(param.Parameterized):
+    """
+    Accumulates reverse-correlation sums from a stream of presentations.
+
+    For every (input, output, time) combination, keeps the running sum
+    of each output unit's response multiplied by the input (stimulus)
+    activity, together with the running sum of the responses, so that
+    the response-weighted stimulus average (i.e. the receptive field)
+    of every unit is available at any point.  Each presentation is
+    folded into these sums and then discarded, so memory use depends
+    only on the sheet sizes and not on the number of presentations.
+
+    To make use of matrix-matrix products, up to batch_size
+    presentations are copied into preallocated buffers before being
+    folded in; flush() folds in any presentations still buffered.
+
+    The sums cover every (output unit, input unit) pair, so they are
+    kept in single precision by default to halve their size; the
+    response totals are always kept in double precision.
+    """
+
+    batch_size = param.Integer(default=32, bounds=(1, None), doc="""
+        Number of presentations buffered before folding them into the sums.""")
+
+    dtype = param.Parameter(default=np.float32, doc="""
+        Type of the response-weighted stimulus sums and of the
+        buffered presentations.""")
+
+    inputs = param.List(default=[], doc="""
+        Names of the stimuli to correlate with; empty for all of them.""")
+
+    def __init__(self, **params):
+        super(ResponseAccumulator, self).__init__(**params)
+        self.presentations = 0
+        self._sums = {}
+        self._response_sums = {}
+        self._shapes = {}
+        self._buffers = {}
+        self._buffered = defaultdict(int)
+        self._names = {}
+
+
+    def __call__(self, time, stimuli, responses):
+        """
+        Add one presentation, given dictionaries of the input and
+        output activity arrays at the given time.
+        """
+        if self.inputs:
+            stimuli = dict((name, a) for name, a in stimuli.items() if name in self.inputs)
+        self._names[time] = (stimuli.keys(), responses.keys())
+        for name, activity in stimuli.items() + responses.items():
+            key = (name, time)
+            if key not in self._buffers:
+                self._shapes[name] = activity.shape
+                self._buffers[key] = np.zeros((self.batch_size, activity.size), dtype=self.dtype)
+            self._buffers[key][self._buffered[time]] = activity.ravel()
+        self._buffered[time] += 1
+        self.presentations += 1
+        if self._buffered[time] == self.batch_size:
+            self._fold(time)
+
+
+    def _fold(self, time):
+        n = self._buffered[time]
+        input_names, output_names = self._names[time]
+        for out_name in output_names:
+            response = self._buffers[(out_name, time)][:n]
+            for in_name in input_names:
+                key = (in_name, out_name, time)
+                stimulus = self._buffers[(in_name, time)][:n]
+                if key not in self._sums:
+                    self._sums[key] = np.zeros((response.shape[1], stimulus.shape[1]), dtype=self.dtype)
+                    self._response_sums[key] = np.zeros(response.shape[1], dtype=activity_dtype)
+                self._sums[key] += np.dot(response.T, stimulus)
+                self._response_sums[key] += response.sum(axis=0, dtype=activity_dtype)
+        self._buffered[time] = 0
+
+
+    def flush(self):
+        """Fold any buffered presentations into the sums."""
+        for time, n in self._buffered.items():
+            if n:
+                self._fold(time)
+
+
+    def keys(self):
+        """Return the (input, output, time) combinations accumulated so far."""
+        return self._sums.keys()
+
+
+    def rfs(self, input_name, output_name, time):
+        """
+        Return the response-weighted stimulus average of every output
+        unit, as an array of shape (output rows, output cols, input
+        rows, input cols), of the accumulator's dtype.  Units that
+        never responded give zeros.
+        """
+        key = (input_name, output_name, time)
+        response_sums = self._response_sums[key]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rfs = self._sums[key] / response_sums[:, np.newaxis].astype(self.dtype)
+        rfs[response_sums == 0] = 0.0
+        return rfs.reshape(self._shapes[output_name] + self._shapes[input_name])
+
+
+
+class measure_rfs_streaming(param.ParameterizedFunction):
+    """
+    Measure receptive fields by reverse correlation with random
+    stimuli, accumulating each response as it is produced.
+
+    Each of the given number of presentations installs the
+    pattern_generator on the input sheets and measures the responses
+    with pattern_response; the responses are then folded into a
+    ResponseAccumulator rather than being kept, so very long
+    white-noise measurements can be run in constant memory.  Returns
+    the ResponseAccumulator, whose rfs() method gives the receptive
+    fields of all the units of each output.
+    """
+
+    presentations = param.Integer(default=1000, bounds=(1, None), doc="""
+        Number of random stimuli to present.""")
+
+    inputs = param.List(default=[], doc="""
+        Names of the GeneratorSheets to use; empty for all of them.""")
+
+    outputs = param.List(default=[], doc="""
+        Names of the Sheets (or Projections) to measure; empty for all
+        Sheets with measure_maps enabled.""")
+
+    durations = param.List(default=[1.0], doc="""
+        Times after presentation at which to accumulate the responses.""")
+
+    pattern_generator = param.Callable(default=None, doc="""
+        Stimulus to present; each call must return a new pattern. If
+        None, uniform white noise seeded from the seed parameter.""")
+
+    seed = param.Integer(default=42, doc="""
+        Seed for the default white-noise pattern_generator.""")
+
+    batch_size = param.Integer(default=32, bounds=(1, None), doc="""
+        Number of presentations folded in together by the accumulator.""")
+
+    dtype = param.Parameter(default=np.float32, doc="""
+        Type of the sums kept by the accumulator (see ResponseAccumulator).""")
+
+    def __call__(self, **params):
+        p = ParamOverrides(self, params)
+        pattern_generator = p.pattern_generator
+        if pattern_generator is None:
+            pattern_generator = pattern.random.UniformRandom(
+                random_generator=np.random.RandomState(seed=p.seed))
+
+        input_names = p.inputs or topo.sim.objects(GeneratorSheet).keys()
+        output_names = p.outputs or [name for name, s in topo.sim.objects(Sheet).items()
+                                     if getattr(s, 'measure_maps', False)]
+
+        accumulator = ResponseAccumulator(batch_size=p.batch_size, inputs=input_names,
+                                          dtype=p.dtype)
+        presenter = pattern_response.instance(durations=p.durations,
+                                              response_accumulator=accumulator,
+                                              return_responses=False)
+        for i in range(p.presentations):
+            presenter(inputs=dict((name, pattern_generator) for name in input_names),
+                      outputs=output_names, current=i, total=p.presentations)
+        accumulator.flush()
+        return accumulator
+
+
+
 def topo_metadata_fn(input_names=[], output_names=[]):
     """
     Return the shapes of the specified GeneratorSheets and measurement
@@ -407,6 +594,8 @@ __all__ = [
     "UnitCurveCommand",
     "pattern_present",
     "pattern_response",
+    "ResponseAccumulator",
+    "measure_rfs_streaming",
     "update_activity",
     "update_sheet_activity"
 ]
@@ -1,3 +1,5 @@
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 
 import param
@@ -8,6 +10,8 @@ try:     # HoloViews <1.8
 except:  # HoloViws >=1.8
     from featuremapper.analysis import TreeOperation
 
+from topo.base.arrayutil import pack_cfs
+
 class WeightIsotropy(TreeOperation):
     """
     Computes a histogram of azimuths between the positional
@@ -179,5 +183,252 @@ class WeightDistribution(TreeOperation):
 
         return layout
 
+def _situated_percentile(sorted_weights, n_weights, n_situated, q):
+    """
+    Returns the q-th percentile of each CF's situated weights, i.e. of
+    its weights embedded in an array of n_situated otherwise zero
+    values, as np.percentile would compute it on cf.situated.
+
+    sorted_weights is an (n, N) array with the (non-negative) weights
+    of each CF sorted along the rows, padded at the end, and n_weights
+    holds the number of real weights in each row.
+    """
+    pos = q/100.0*(n_situated-1)
+    lower = int(np.floor(pos))
+    upper = min(lower+1, n_situated-1)
+    frac = pos-lower
+    n_zeros = n_situated-n_weights
+    def value(k):
+        idx = np.clip(k-n_zeros, 0, sorted_weights.shape[1]-1)
+        vals = sorted_weights[np.arange(len(sorted_weights)), idx]
+        return np.where(k<n_zeros, 0.0, vals)
+    return value(lower)*(1-frac) + value(upper)*frac
+
+
+def _row_histograms(values, weights, rows, n_rows, num_bins, bin_range):
+    """
+    Returns an (n_rows, num_bins) array of weighted histograms over
+    the given bin_range, accumulating each value into the histogram
+    of its row. Bins follow np.histogram (the last bin is closed).
+    """
+    lo, hi = bin_range
+    bins = np.floor((values-lo)*(num_bins/float(hi-lo))).astype(np.int64)
+    bins[values==hi] = num_bins-1
+    inside = (bins>=0) & (bins<num_bins)
+    counts = np.bincount(rows[inside]*num_bins+bins[inside],
+                         weights=weights[inside], minlength=n_rows*num_bins)
+    return counts.reshape(n_rows, num_bins)
+
+
+
+class ProjectionWeightStatistics(param.Parameterized):
+    """
+    Computes weight statistics for every CF of a projection directly
+    from the raw weight arrays, rather than from CF views.
+
+    The CFs of the selected units are processed in chunks: each
+    chunk's weights are packed into one zero-padded array, together
+    with the index of the presynaptic unit that every weight comes
+    from, so that the statistics of all the CFs in a chunk are
+    computed with a few vectorized operations.  Chunks can optionally
+    be processed on several threads.
+
+    Each statistic is returned as an (n_units, num_bins) array of
+    per-unit histograms plus the bin edges; the rows can be summed
+    and wrapped into a HoloViews Histogram using weight_histogram().
+
+    As in WeightIsotropy and WeightDistribution, the supplied
+    preference maps are arrays with the shape of the projection's
+    source sheet, and are indexed both by the presynaptic units and
+    by the CF units themselves, so that they are intended for use with
+    lateral projections (or between sheets of the same shape).
+    """
+
+    chunk_size = param.Integer(default=1024, bounds=(1, None), doc="""
+        Number of CFs packed and processed together in one pass.""")
+
+    threads = param.Integer(default=1, bounds=(1, None), doc="""
+        Number of threads over which the chunks are distributed.""")
+
+    units = param.Parameter(default=None, doc="""
+        Flat indices of the units for which to compute statistics,
+        or None for every unit of the destination sheet.""")
+
+    def __init__(self, projection, **params):
+        super(ProjectionWeightStatistics, self).__init__(**params)
+        self.projection = projection
+
+
+    def _unit_indices(self):
+        if self.units is None:
+            return np.arange(len(self.projection.flatcfs))
+        return np.asarray(self.units, dtype=np.int64)
+
+
+    def _pack(self, indices):
+        """
+        Returns the packed weights of the CFs of the given units, the
+        flat index into the source sheet of every packed weight, and a
+        mask of the packed entries that hold real weights.
+        """
+        flatcfs = self.projection.flatcfs
+        weights, shapes, offsets = pack_cfs([flatcfs[i] for i in indices])
+        n, max_rows, max_cols = weights.shape
+
+        src_rows, src_cols = self.projection.src.activity.shape
+        r = np.arange(max_rows)[np.newaxis, :, np.newaxis]
+        c = np.arange(max_cols)[np.newaxis, np.newaxis, :]
+        valid = ((r<shapes[:, 0, np.newaxis, np.newaxis]) &
+                 (c<shapes[:, 1, np.newaxis, np.newaxis]))
+        src_r = np.minimum(offsets[:, 0, np.newaxis, np.newaxis]+r, src_rows-1)
+        src_c = np.minimum(offsets[:, 1, np.newaxis, np.newaxis]+c, src_cols-1)
+        return weights, src_r*src_cols+src_c, valid
+
+
+    def _map_chunks(self, fn):
+        """
+        Applies fn(indices, weights, src_idx, valid) to every chunk of
+        units, returning the per-unit results stacked in unit order.
+        """
+        indices = self._unit_indices()
+        chunks = [indices[i:i+self.chunk_size]
+                  for i in range(0, len(indices), self.chunk_size)]
+        def process(chunk):
+            return fn(chunk, *self._pack(chunk))
+        if self.threads > 1 and len(chunks) > 1:
+            pool = ThreadPool(self.threads)
+            try:
+                results = pool.map(process, chunks)
+            finally:
+                pool.close()
+        else:
+            results = [process(chunk) for chunk in chunks]
+        return np.concatenate(results)
+
+
+    def isotropy(self, orientation, selectivity, xpref, ypref,
+                 num_bins=20, threshold=70, min_dist=0.1, symmetric=True):
+        """
+        Per-unit histograms of the azimuth between the position
+        preferences of pre- and post-synaptic units, relative to the
+        orientation preference of the post-synaptic unit and weighted
+        by the connection strength and the selectivities of both
+        units, as computed for a single CF by WeightIsotropy.
+        """
+        orientation, selectivity, xpref, ypref = [np.ravel(a) for a in
+            (orientation, selectivity, xpref, ypref)]
+        n_situated = selectivity.size
+        edges = np.linspace(0, 2*np.pi, num_bins+1)
+
+        def fn(units, weights, src_idx, valid):
+            n = len(units)
+            padded = np.where(valid, weights, np.inf).reshape(n, -1)
+            cutoff = _situated_percentile(np.sort(padded, axis=1),
+                                          valid.reshape(n, -1).sum(axis=1),
+                                          n_situated, threshold)
+            mask = valid & (weights>cutoff[:, np.newaxis, np.newaxis])
+            rows = np.nonzero(mask)[0]
+            pre = src_idx[mask]
+            post = units[rows]
+            weight = weights[mask] * selectivity[post] * selectivity[pre]
+            dx = xpref[pre] - xpref[post]
+            dy = ypref[pre] - ypref[post]
+            far = np.sqrt(dx**2 + dy**2) > min_dist
+            delta = np.arctan2(dy, dx) - orientation[post]
+            delta[delta<0] += np.pi*2
+            rows, delta, weight = rows[far], delta[far], weight[far]
+            hists = _row_histograms(delta, weight, rows, n, num_bins, (0, 2*np.pi))
+            if symmetric:
+                hists += _row_histograms((delta+np.pi) % (np.pi*2), weight,
+                                         rows, n, num_bins, (0, 2*np.pi))
+            return hists
+
+        return self._map_chunks(fn), edges
+
+
+    def distance_histograms(self, num_bins=10, max_distance=None,
+                            xpref=None, ypref=None):
+        """
+        Per-unit histograms of the weights over the radial distance
+        between pre- and post-synaptic units, in sheet coordinates.
+
+        Distances are computed between the unit locations on their
+        sheets, or between their position preferences if the xpref
+        and ypref maps are supplied.  By default the bins extend to
+        the largest possible distance across the source sheet.
+        """
+        proj = self.projection
+        if xpref is None or ypref is None:
+            src_x, src_y = proj.src.sheetcoords_of_idx_grid()
+            src_x, src_y = np.ravel(src_x), np.ravel(src_y)
+            dest_x, dest_y = [np.ravel(a) for a in proj.dest.sheetcoords_of_idx_grid()]
+        else:
+            src_x, src_y = np.ravel(xpref), np.ravel(ypref)
+            dest_x, dest_y = src_x, src_y
+        if max_distance is None:
+            l, b, r, t = proj.src.bounds.lbrt()
+            max_distance = np.sqrt((r-l)**2 + (t-b)**2)
+        edges = np.linspace(0, max_distance, num_bins+1)
+
+        def fn(units, weights, src_idx, valid):
+            rows = np.nonzero(valid)[0]
+            pre = src_idx[valid]
+            post = units[rows]
+            d = np.sqrt((src_x[pre]-dest_x[post])**2 + (src_y[pre]-dest_y[post])**2)
+            return _row_histograms(d, weights[valid], rows, len(units),
+                                   num_bins, (0, max_distance))
+
+        return self._map_chunks(fn), edges
+
+
+    def feature_distribution(self, preference, num_bins=10, period=None,
+                             bin_range=None):
+        """
+        Per-unit histograms of the difference in feature preference
+        between pre- and post-synaptic units, weighted by the (positive)
+        connection strength, as computed for a single CF by
+        WeightDistribution.
+
+        For cyclic features the period must be supplied, and the bins
+        then cover (0, period/2); otherwise they cover the range of
+        differences present in the preference map, unless a bin_range
+        is given.
+        """
+        preference = np.ravel(preference)
+        if bin_range is None:
+            bin_range = ((0, period/2.) if period is not None else
+                         (0, preference.max()-preference.min()))
+        edges = np.linspace(bin_range[0], bin_range[1], num_bins+1)
+
+        def fn(units, weights, src_idx, valid):
+            positive = valid & (weights>0)
+            rows = np.nonzero(positive)[0]
+            feature = preference[src_idx[positive]]
+            preferred = preference[units[rows]]
+            if period is not None:
+                delta = circular_dist(preferred, feature, period)
+            else:
+                delta = np.abs(feature-preferred)
+            return _row_histograms(delta, weights[positive], rows, len(units),
+                                   num_bins, bin_range)
+
+        return self._map_chunks(fn), edges
+
+
+
+def weight_histogram(hists, edges, normed=False, **kwargs):
+    """
+    Sums the per-unit histograms returned by ProjectionWeightStatistics
+    into a single HoloViews Histogram, optionally normalized to a
+    density as in np.histogram.  Remaining keywords (e.g. group,
+    label and kdims) are passed to the Histogram.
+    """
+    bins = np.asarray(hists).sum(axis=0)
+    if normed:
+        bins = bins / (bins.sum() * np.diff(edges))
+    return Histogram(bins, edges, **kwargs)
+
+
+
 options = Store.options(backend='matplotlib')
 options.Histogram.Weight_Isotropy = Options('plot', projection='polar', show_grid=True)
@@ -111,6 +111,60 @@ def centroid(array_2D):
     return row_centroid, col_centroid
 
 
+def centroids(stack):
+    """
+    Return arrays of the row and column centroids for each 2D array
+    in a 3D stack (i.e. centroid() applied along the first axis).
+
+    Arrays of differing shapes can be handled by zero-padding them to
+    a common shape, since padding does not alter the centroid.  Arrays
+    with no mass give a centroid of NaN.
+    """
+    row_mass = stack.sum(axis=2,dtype=np.float64)
+    col_mass = stack.sum(axis=1,dtype=np.float64)
+    mass = row_mass.sum(axis=1)
+
+    with np.errstate(divide='ignore',invalid='ignore'):
+        row_centroids = np.dot(row_mass,np.arange(stack.shape[1]))/mass
+        col_centroids = np.dot(col_mass,np.arange(stack.shape[2]))/mass
+
+    return row_centroids, col_centroids
+
+
+def pack_cfs(cfs,out=None,dtype=np.float64):
+    """
+    Return the weights of the given ConnectionFields packed into a 3D
+    stack, zero-padded to the largest CF, together with integer arrays
+    of the (rows,cols) shape of each CF's weights and of the
+    (row,col) offset of its input_sheet_slice in the source sheet.
+
+    None entries (null CFs) give all-zero weights and a zero shape and
+    offset. If out is given, the weights are packed into its first
+    len(cfs) entries (which are zeroed first) rather than into a new
+    array, so that one buffer can be reused across chunks of CFs; it
+    must be large enough for every CF.
+    """
+    n = len(cfs)
+    shapes = np.zeros((n,2),dtype=np.int64)
+    offsets = np.zeros((n,2),dtype=np.int64)
+    for i,cf in enumerate(cfs):
+        if cf is not None:
+            shapes[i] = cf.weights.shape
+            r1,r2,c1,c2 = cf.input_sheet_slice
+            offsets[i] = r1,c1
+
+    if out is None:
+        max_rows,max_cols = shapes.max(axis=0) if n else (0,0)
+        out = np.zeros((n,max(max_rows,1),max(max_cols,1)),dtype=dtype)
+    else:
+        out = out[:n]
+        out[:] = 0
+    for i,cf in enumerate(cfs):
+        if cf is not None:
+            out[i,:shapes[i,0],:shapes[i,1]] = cf.weights
+    return out,shapes,offsets
+
+
 def clip_lower(arr,lower_bound):
     """
     In-place, one-sided version of numpy.clip().
@@ -18,6 +18,7 @@ CFProjection.
 """
 
 from copy import copy
+from timeit import default_timer
 
 import numpy as np
 
@@ -33,6 +34,7 @@ from functionfamily import LearningFn,Hebbian,IdentityLF
 from functionfamily import ResponseFn,DotProduct
 from functionfamily import CoordinateMapperFn,IdentityMF
 from projection import Projection,ProjectionSheet
+from simulation import component_timings
 from sheetview import CFView
 
 
@@ -658,11 +660,8 @@ class CFProjection(Projection):
 
     def _generate_coords(self):
         X,Y = self.dest.sheetcoords_of_idx_grid()
-        vectorized_coord_mapper = simple_vectorize(self.coord_mapper,
-                                                   num_outputs=2,
-                                                   # CB: could switch to float32?
-                                                   output_type=float)
-        return vectorized_coord_mapper(X,Y)
+        # CB: could switch to float32?
+        return self.coord_mapper.map_arrays(X,Y)
 
 
     # CB: should be _initialize_cfs() since we already have 'initialize_cfs' flag?
@@ -805,15 +804,26 @@ class CFProjection(Projection):
 
     def activate(self,input_activity):
         """Activate using the specified response_fn and output_fn."""
+        timing = component_timings.enabled
+        if timing:
+            start = default_timer()
         if self.input_fns:
             input_activity = input_activity.copy()
         for iaf in self.input_fns:
             iaf(input_activity)
+        if timing:
+            component_timings.add(self,'input_fns',default_timer()-start)
+            start = default_timer()
         self.input_buffer = input_activity
         self.activity *=0.0
         self.response_fn(CFIter(self), input_activity, self.activity, self.strength)
+        if timing:
+            component_timings.add(self,'response_fn',default_timer()-start)
+            start = default_timer()
         for of in self.output_fns:
             of(self.activity)
+        if timing:
+            component_timings.add(self,'output_fns',default_timer()-start)
 
 
     # CEBALERT: should add active_units_mask to match
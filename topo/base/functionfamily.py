@@ -95,6 +95,11 @@ class CoordinateMapperFn(param.Parameterized):
 
     __abstract = True
 
+    # Subclasses whose __call__ is written entirely in terms of
+    # elementwise numpy operations, and so accepts arrays of x and y
+    # coordinates as well as single values, should set this to True.
+    vectorized = False
+
     def __call__(self,x,y):
         """
         Apply the coordinate mapping function; must be implemented by subclasses.
@@ -102,7 +107,30 @@ class CoordinateMapperFn(param.Parameterized):
         raise NotImplementedError
 
 
+    def map_arrays(self,x,y):
+        """
+        Apply the mapping to all the points given by the arrays x and
+        y, returning float arrays of new x and y coordinates with the
+        same shape.
+
+        Vectorized mappers are applied to the whole arrays at once;
+        others are called once per point, in the arrays' flat order.
+        """
+        x,y = numpy.asarray(x,dtype=float),numpy.asarray(y,dtype=float)
+        if self.vectorized:
+            xout,yout = self(x,y)
+        else:
+            mapped = [self(xi,yi) for xi,yi in zip(x.flat,y.flat)]
+            xout = [m[0] for m in mapped]
+            yout = [m[1] for m in mapped]
+        return (numpy.asarray(xout,dtype=float).reshape(x.shape),
+                numpy.asarray(yout,dtype=float).reshape(y.shape))
+
+
 class IdentityMF(CoordinateMapperFn):
     """Return the x coordinate of the given coordinate."""
+
+    vectorized = True
+
     def __call__(self,x,y):
         return x,y
@@ -3,7 +3,15 @@ GeneratorSheet: a sheet with a pattern generator.
 """
 
 
+import os
+import atexit
+import random
+import weakref
+import multiprocessing
+import multiprocessing.sharedctypes
+
 import param
+import numbergen
 from topo.base.sheet import Sheet
 from topo.base.patterngenerator import PatternGenerator,Constant
 from topo.base.simulation import FunctionEvent, PeriodicEventSequence
@@ -14,6 +22,284 @@ from holoviews import Image
 import numpy as np
 
 
+# State of a PatternPrefetcher worker process, set up by
+# _prefetch_init when the process is started.
+_prefetch_state = {}
+
+def _prefetch_init(generator,ring,shape):
+    _prefetch_state.update(generator=generator,shape=shape,
+                           ring=np.frombuffer(ring).reshape((-1,)+shape))
+
+def _prefetch_render(slot,time):
+    """
+    Render the pattern for the given simulation time into a slot of
+    the ring buffer, returning the slot and the states of the
+    generator's random streams after rendering the pattern (see
+    _random_stream_states).
+    """
+    param.Dynamic.time_fn(time)
+    _prefetch_state['ring'][slot] = _prefetch_state['generator']()
+    return slot,_random_stream_states(_prefetch_state['generator'])
+
+
+def _random_streams(obj,seen=None):
+    """
+    Return a list of the random streams used by obj (e.g. a
+    PatternGenerator, with NumberGenerators as parameter values): the
+    NumberGenerators and random number generators it refers to,
+    through attributes of Parameterized objects and lists, in an
+    order that is the same for obj and for any copy of it.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return []
+    seen.add(id(obj))
+    if isinstance(obj,(numbergen.NumberGenerator,random.Random,np.random.RandomState)):
+        return [obj]
+    elif isinstance(obj,param.Parameterized):
+        return sum([_random_streams(obj.__dict__[name],seen) for name in sorted(obj.__dict__)],[])
+    elif isinstance(obj,(list,tuple)):
+        return sum([_random_streams(value,seen) for value in obj],[])
+    return []
+
+
+def _random_stream_states(obj):
+    """
+    Return a list of the type and state of each of the random streams
+    of obj, in the order of _random_streams.
+    """
+    states = []
+    for stream in _random_streams(obj):
+        if isinstance(stream,numbergen.NumberGenerator):
+            state = stream.__getstate__()
+        elif isinstance(stream,random.Random):
+            state = stream.getstate()
+        else:
+            state = stream.get_state()
+        states.append((type(stream),state))
+    return states
+
+
+def _set_random_stream_states(obj,states):
+    """
+    Bring the random streams of obj up to date with the given states,
+    as returned by _random_stream_states for a copy of obj (e.g. by a
+    prefetching worker).
+
+    Only the state of the NumberGenerators and random number
+    generators is set, so that other changes made to obj since the
+    copy was made are kept; streams whose type no longer matches the
+    copy's are left alone.
+    """
+    for stream,(stream_type,state) in zip(_random_streams(obj),states):
+        if type(stream) is not stream_type:
+            continue
+        if isinstance(stream,numbergen.NumberGenerator):
+            stream.__setstate__(state)
+        elif isinstance(stream,random.Random):
+            stream.setstate(state)
+        else:
+            stream.set_state(state)
+
+
+# PatternPrefetchers whose worker processes are still running, so
+# that they can be stopped when the interpreter exits
+_prefetchers = weakref.WeakSet()
+
+@atexit.register
+def _close_prefetchers():
+    for prefetcher in list(_prefetchers):
+        prefetcher.close()
+
+
+
+class PatternPrefetcher(object):
+    """
+    Renders the patterns for upcoming simulation times ahead of time,
+    in a pool of worker processes, into a ring buffer of preallocated
+    arrays in shared memory.
+
+    Patterns are requested for the times start, start+period,
+    start+2*period, and so on. The workers hold copies of the
+    PatternGenerator as it was when the prefetcher was created, and
+    render each pattern with their simulation time set to the time at
+    which it will be presented, so patterns drawn from time-dependent
+    random streams are identical to those generated synchronously.
+    Random streams that are not time dependent are only reproduced
+    with a single process, which renders the patterns in order.
+
+    Each pattern comes back with the states of the random streams of
+    the worker's copy of the generator after rendering it (rather
+    than the whole generator, which may hold e.g. image data); those
+    belonging to the pattern most recently returned by pattern() are
+    kept as random_states, so that the random streams of the
+    original generator can be brought up to date when prefetching
+    stops.
+    """
+
+    def __init__(self,generator,shape,start,period,depth=4,processes=1):
+        self.period = period
+        self.random_states = None
+        self._next_time = start
+        self._pending = {}
+        # One slot more than the patterns in flight, holding the
+        # pattern most recently returned by pattern()
+        ring = multiprocessing.sharedctypes.RawArray('d',(depth+1)*shape[0]*shape[1])
+        self._ring = np.frombuffer(ring).reshape((depth+1,)+shape)
+        self._pool = multiprocessing.Pool(processes,_prefetch_init,(generator,ring,shape))
+        _prefetchers.add(self)
+        for slot in range(depth):
+            self._schedule(slot)
+        self._released = depth
+
+
+    def _schedule(self,slot):
+        self._pending[self._next_time] = self._pool.apply_async(_prefetch_render,
+                                                                (slot,self._next_time))
+        self._next_time += self.period
+
+
+    def __contains__(self,time):
+        return time in self._pending
+
+
+    def pattern(self,time):
+        """
+        Return the pattern for the given simulation time, waiting for
+        it to be rendered if necessary. The returned array is a view
+        on the ring buffer, valid until the next call.
+        """
+        self._schedule(self._released)
+        self._released,self.random_states = self._pending.pop(time).get()
+        return self._ring[self._released]
+
+
+    def close(self):
+        """Stop the worker processes, discarding any pending patterns."""
+        self._pool.terminate()
+        self._pending = {}
+        _prefetchers.discard(self)
+
+
+
+class PatternStore(param.Parameterized):
+    """
+    Memory-mapped store of precomputed input patterns, indexed by
+    sheet name and simulation time, as written by render_pattern_store.
+
+    The store is a directory holding a subdirectory for each sheet,
+    containing the patterns as a NumPy array file patterns.npy of
+    shape (len(times),rows,cols) and the simulation times at which
+    they are presented in times.npy. Patterns are returned as
+    read-only views on the memory-mapped file, without copying.
+    """
+
+    path = param.String(default=None,constant=True,doc="""
+        Directory holding the store.""")
+
+    def __init__(self,path,**params):
+        super(PatternStore,self).__init__(path=path,**params)
+        self._sheets = {}
+
+
+    def _sheet(self,sheet_name):
+        if sheet_name not in self._sheets:
+            sheet_dir = os.path.join(self.path,sheet_name)
+            times = np.load(os.path.join(sheet_dir,'times.npy'))
+            patterns = np.load(os.path.join(sheet_dir,'patterns.npy'),mmap_mode='r')
+            index = dict((t,i) for i,t in enumerate(times.tolist()))
+            self._sheets[sheet_name] = (times,index,patterns)
+        return self._sheets[sheet_name]
+
+
+    def sheet_names(self):
+        """Return the names of the sheets with patterns in this store."""
+        return sorted(name for name in os.listdir(self.path)
+                      if os.path.isfile(os.path.join(self.path,name,'times.npy')))
+
+
+    def times(self,sheet_name):
+        """Return the times at which the patterns of the given sheet are presented."""
+        return self._sheet(sheet_name)[0]
+
+
+    def __contains__(self,key):
+        sheet_name,time = key
+        return (os.path.isdir(os.path.join(self.path,sheet_name)) and
+                float(time) in self._sheet(sheet_name)[1])
+
+
+    def pattern(self,sheet_name,time):
+        """
+        Return the pattern presented on the given sheet at the given
+        simulation time, raising a KeyError if it is not stored.
+        """
+        times,index,patterns = self._sheet(sheet_name)
+        return patterns[index[float(time)]]
+
+
+    def __getstate__(self):
+        state = super(PatternStore,self).__getstate__()
+        state['_sheets'] = {}
+        return state
+
+
+
+class render_pattern_store(param.ParameterizedFunction):
+    """
+    Render the input patterns presented by the GeneratorSheets of a
+    Simulation from time zero up to the given duration into a
+    PatternStore at the given path, returning the store.
+
+    Each pattern is generated by calling the sheet's input_generator
+    with the simulation time set to the time at which the sheet would
+    present it (phase + n*period), so the patterns match those that
+    a run of the simulation would generate, without running the
+    network. Output functions are not applied; they are applied when
+    the patterns are read back by the sheet.
+    """
+
+    sheets = param.List(default=None,doc="""
+        Names of the GeneratorSheets to render, defaulting to all
+        GeneratorSheets in the simulation.""")
+
+    dtype = param.Parameter(default=np.float64,doc="""
+        Type of the stored values. Patterns can only be read back
+        without copying when this matches the type of the sheet
+        activity.""")
+
+    def __call__(self,simulation,path,duration,**params):
+        p = param.ParamOverrides(self,params)
+        sheets = simulation.objects(GeneratorSheet)
+        names = sorted(sheets) if p.sheets is None else p.sheets
+        duration = simulation.convert_to_time_type(duration)
+
+        for name in names:
+            sheet = sheets[name]
+            time = simulation.convert_to_time_type(sheet.phase)
+            period = simulation.convert_to_time_type(sheet.period)
+            times = []
+            while time < duration:
+                times.append(time)
+                time += period
+
+            sheet_dir = os.path.join(path,name)
+            if not os.path.isdir(sheet_dir):
+                os.makedirs(sheet_dir)
+            patterns = np.lib.format.open_memmap(os.path.join(sheet_dir,'patterns.npy'),mode='w+',
+                                                 dtype=p.dtype,shape=(len(times),)+sheet.activity.shape)
+            with param.Dynamic.time_fn as t:
+                for i,time in enumerate(times):
+                    t(time)
+                    patterns[i] = sheet.input_generator()
+            patterns.flush()
+            del patterns
+            np.save(os.path.join(sheet_dir,'times.npy'),np.array([float(time) for time in times]))
+
+        return PatternStore(path)
+
+
+
 # JLALERT: This sheet should have override_plasticity_state/restore_plasticity_state
 # functions that call override_plasticity_state/restore_plasticty_state on the
 # sheet output_fn and input_generator output_fn.
@@ -43,6 +329,32 @@ class GeneratorSheet(Sheet):
     input_generator = param.ClassSelector(PatternGenerator,default=Constant(),
         doc="""Specifies a particular PatternGenerator type to use when creating patterns.""")
 
+    prefetch = param.Integer(default=0,bounds=(0,None),doc="""
+        Number of upcoming patterns to render ahead of time in worker
+        processes, using a PatternPrefetcher, instead of calling the
+        input_generator synchronously; 0 disables prefetching.
+
+        Each pattern is rendered for the exact simulation time at
+        which it will be presented. Prefetching restarts whenever
+        the input_generator is replaced or a pattern is requested for
+        an unexpected time, but changes made to the parameters of the
+        current input_generator only take effect once the patterns
+        already prefetched have been used.""")
+
+    prefetch_processes = param.Integer(default=1,bounds=(1,None),doc="""
+        Number of worker processes used for prefetching. Use one
+        process if the input_generator draws from random streams
+        that are not time dependent.""")
+
+    pattern_store = param.ClassSelector(PatternStore,default=None,doc="""
+        If set, patterns are read from this PatternStore (see
+        render_pattern_store) instead of being generated. The
+        input_generator is still used for times missing from the
+        store, and whenever another generator has been pushed onto
+        the input_generator_stack, e.g. while measuring maps.""")
+
+    _prefetcher = None
+
 
     def __init__(self,**params):
         super(GeneratorSheet,self).__init__(**params)
@@ -63,6 +375,7 @@ class GeneratorSheet(Sheet):
 
         if push_existing:
             self.push_input_generator()
+        self.stop_prefetch()
 
         # CEBALERT: replaces any bounds specified for the
         # PatternGenerator with this sheet's own bounds. When
@@ -74,6 +387,7 @@ class GeneratorSheet(Sheet):
 
     def push_input_generator(self):
         """Push the current input_generator onto a stack for future retrieval."""
+        self.stop_prefetch()
         self.input_generator_stack.append(self.input_generator)
 
         # CEBALERT: would be better to reorganize code so that
@@ -94,14 +408,65 @@ class GeneratorSheet(Sheet):
         else:
             self.warning('There is no previous input generator to restore.')
 
+    def stop_prefetch(self):
+        """
+        Stop prefetching, discarding any patterns rendered ahead of
+        time. The random streams of the input_generator are left in
+        the state they would have been in had the patterns presented
+        so far been generated synchronously, so that they carry on
+        from there.
+        """
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            if self._prefetcher.random_states is not None:
+                _set_random_stream_states(self.input_generator,self._prefetcher.random_states)
+            self._prefetcher = None
+
+
+    def _prefetched_pattern(self):
+        """
+        Return the prefetched pattern for the current time, (re)starting
+        the PatternPrefetcher after generating the pattern synchronously
+        if it is not available.
+        """
+        time = self.simulation.time()
+        if self._prefetcher is not None and time in self._prefetcher:
+            try:
+                return self._prefetcher.pattern(time)
+            except Exception:
+                self.stop_prefetch()
+                raise
+
+        self.stop_prefetch()
+        ac = self.input_generator()
+        period = self.simulation.convert_to_time_type(self.period)
+        self._prefetcher = PatternPrefetcher(self.input_generator,self.activity.shape,
+                                             time+period,period,depth=self.prefetch,
+                                             processes=self.prefetch_processes)
+        return ac
+
+
+    def __getstate__(self):
+        state = super(GeneratorSheet,self).__getstate__()
+        state.pop('_prefetcher',None)
+        return state
+
+
     def generate(self):
         """
         Generate the output and send it out the Activity port.
         """
         self.verbose("Generating a new pattern")
 
+        time = self.simulation.time()
         try:
-            ac = self.input_generator()
+            if (self.pattern_store is not None and not self.input_generator_stack
+                and (self.name,time) in self.pattern_store):
+                ac = self.pattern_store.pattern(self.name,time)
+            elif self.prefetch:
+                ac = self._prefetched_pattern()
+            else:
+                ac = self.input_generator()
         except StopIteration:
             # Note that a generator may raise an exception
             # StopIteration if it runs out of patterns.  Example is if
@@ -167,6 +532,13 @@ class ChannelGeneratorSheet(GeneratorSheet):
         eg, {0:[fnc1, fnc2],3:[fnc3]}.  The dictionary isn't required
         to specify every channel, but rather only those required.""")
 
+    stack_output_fns = param.Boolean(default=True,doc="""
+        Whether to apply each of the output_fns once to the stacked
+        (channels,rows,cols) channel array, rather than separately to
+        each channel. Only suitable for output functions operating on
+        each unit independently; disable it for output functions such
+        as normalizations that must see each channel on its own.""")
+
 
     def __init__(self,**params):
         # We need to setup our datastructures before calling
@@ -189,23 +561,20 @@ class ChannelGeneratorSheet(GeneratorSheet):
 
         if( num_channels>1 ):
             if( num_channels != len(self._channel_data) ):
-                self.src_ports = ['Activity']
-                self._channel_data = []
-
-                for i in range(num_channels):
-                    # TODO: in order to add support for generic naming
-                    #       of Activity ports, it's necessary to
-                    #       implement a .get_channel_names method.
-                    #       Calling .channels() and inspecting the
-                    #       returned dictionary in fact could change
-                    #       the state of the input generator.
-                    self.src_ports.append( 'Activity'+str(i) )
-                    self._channel_data.append(self.activity.copy())
+                # TODO: in order to add support for generic naming
+                #       of Activity ports, it's necessary to
+                #       implement a .get_channel_names method.
+                #       Calling .channels() and inspecting the
+                #       returned dictionary in fact could change
+                #       the state of the input generator.
+                self.src_ports = ['Activity']+['Activity'+str(i) for i in range(num_channels)]
+                self._channel_data = np.zeros((num_channels,)+self.activity.shape,
+                                              dtype=self.activity.dtype)
 
         else: # monochrome
             # Reset channels to match single-channel inputs.
             self.src_ports = ['Activity']
-            self._channel_data = []
+            self._channel_data = np.zeros((0,)+self.activity.shape,dtype=self.activity.dtype)
 
         super(ChannelGeneratorSheet,self).set_input_generator(new_ig,push_existing=push_existing)
 
@@ -234,39 +603,40 @@ class ChannelGeneratorSheet(GeneratorSheet):
                     of(self.activity)
             self.send_output(src_port='Activity',data=self.activity)
 
+            channels = self._channel_data
+            if not len(channels):
+                return
 
-
-            ## These loops are safe: if the pattern doesn't provide
-            ## further channels, self._channel_data = []
-            for i in range(len(self._channel_data)):
-                self._channel_data[i][:] = channels_dict.items()[i+1][1]
-
+            for i,(name,channel) in enumerate(channels_dict.items()[1:len(channels)+1]):
+                channels[i] = channel
 
             if self.apply_output_fns:
                 ## Default output_fns are applied to all channels
                 for f in self.output_fns:
-                    for i in range(len(self._channel_data)):
-                        f( self._channel_data[i] )
-
-               # Channel specific output functions, defined as a
-               # dictionary {chn_number:[functions]}
-                for i in range(len(self._channel_data)):
-                    if(i in self.channel_output_fns):
-                        for f in self.channel_output_fns[i]:
-                            f( self._channel_data[i] )
-
+                    if self.stack_output_fns:
+                        f(channels)
+                    else:
+                        for channel in channels:
+                            f(channel)
+
+                # Channel specific output functions, defined as a
+                # dictionary {chn_number:[functions]}
+                for i,fns in self.channel_output_fns.items():
+                    if i < len(channels):
+                        for f in fns:
+                            f(channels[i])
 
             if self.constant_mean_total_channels_output is not None:
-                M = sum(act for act in self._channel_data).mean()/len(self._channel_data)
+                M = channels.sum(axis=0).mean()/len(channels)
                 if M>0:
-                    p = self.constant_mean_total_channels_output/M
-                    for act in self._channel_data:
-                        act *= p
-                        np.minimum(act,1.0,act)
-
+                    channels *= self.constant_mean_total_channels_output/M
+                    np.minimum(channels,1.0,channels)
 
-            for i in range(len(self._channel_data)):
-                self.send_output(src_port=self.src_ports[i+1], data=self._channel_data[i])
+            # All channel events share one read-only copy of the channels
+            shared = channels.copy()
+            shared.flags.writeable = False
+            for i in range(len(shared)):
+                self.send_output(src_port=self.src_ports[i+1],data=shared[i],deep_copy=False)
 
 
     def __getitem__(self, coords):
@@ -274,7 +644,7 @@ class ChannelGeneratorSheet(GeneratorSheet):
                             row_precedence=self.row_precedence,
                             timestamp=self.simulation.time())
 
-        if self._channel_data:
+        if len(self._channel_data):
             arr = np.dstack(self._channel_data)
         else:
             arr = self.activity.copy()
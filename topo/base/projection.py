@@ -3,6 +3,7 @@ Projection and related classes.
 """
 
 from collections import OrderedDict
+from timeit import default_timer
 
 import numpy
 from numpy import array,asarray,ones,sometrue, logical_and, logical_or
@@ -15,7 +16,7 @@ from holoviews import Image, Layout
 from holoviews.interface.collector import AttrDict
 
 from sheet import Sheet
-from simulation import EPConnection
+from simulation import EPConnection, component_timings, tracer
 from functionfamily import TransferFn
 
 
@@ -564,10 +565,19 @@ class ProjectionSheet(Sheet):
         the simulation.
         """
         if self.new_input:
-            self.activate()
+            self._traced('activate',self.activate)
             self.new_input = False
             if self.plastic:
-                self.learn()
+                self._traced('learn',self.learn)
+
+
+    def _traced(self,stage,method):
+        """Call method(), recording a span of stage if the tracer is enabled."""
+        if not tracer.enabled:
+            return method()
+        start = default_timer()
+        method()
+        tracer.add(self,stage,self.simulation.time(),start)
 
 
     def learn(self):
@@ -579,9 +589,17 @@ class ProjectionSheet(Sheet):
         Called from self.process_current_time() _after_ activity has
         been propagated.
         """
+        timing = component_timings.enabled
         for proj in self.in_connections:
             if not isinstance(proj,Projection):
                 self.debug("Skipping non-Projection "+proj.name)
+            elif timing:
+                start = default_timer()
+                proj.learn()
+                learned = default_timer()
+                proj.apply_learn_output_fns()
+                component_timings.add(proj,'learning_fn',learned-start)
+                component_timings.add(proj,'weights_output_fns',default_timer()-learned)
             else:
                 proj.learn()
                 proj.apply_learn_output_fns()
@@ -55,6 +55,13 @@ import param
 from copy import copy, deepcopy
 import time
 import bisect
+import os
+import json
+import threading
+from multiprocessing.pool import ThreadPool
+from timeit import default_timer
+
+import numpy
 
 from holoviews.interface.collector import AttrDict
 
@@ -197,22 +204,30 @@ class EventProcessor(param.Parameterized):
         pass
 
     ### JABALERT: Should change send_output to accept a list of src_ports, not a single src_port.
-    def send_output(self,src_port=None,data=None):
+    def send_output(self,src_port=None,data=None,deep_copy=True):
         """
         Send some data out to all connections on the given src_port.
         The data is deepcopied before it is sent out, to ensure that
         future changes to the data are not reflected in events from
-        the past.
+        the past, unless deep_copy is False (in which case the caller
+        must ensure the data is never modified afterwards).
         """
 
+        timing = component_timings.enabled
+        if timing:
+            start = default_timer()
+
         out_conns_on_src_port = [conn for conn in self.out_connections
                                  if self._port_match(conn.src_port,[src_port])]
 
-        data=deepcopy(data)
+        if deep_copy:
+            data=deepcopy(data)
         for conn in out_conns_on_src_port:
             #self.verbose("Sending output on src_port %s via connection %s to %s" % (str(src_port), conn.name, conn.dest.name))
-            e=EPConnectionEvent(self.simulation.convert_to_time_type(conn.delay)+self.simulation.time(),conn,data,deep_copy=False)
-            self.simulation.enqueue_event(e)
+            self.simulation.enqueue_connection_event(conn,data,deep_copy=False)
+
+        if timing:
+            component_timings.add(self,'send_output',default_timer()-start)
 
 
     def input_event(self,conn,data):
@@ -323,6 +338,10 @@ class EPConnection(param.Parameterized):
     private = param.Boolean(default=False,doc=
        """Set to true if this connection is for internal use only, not to be manipulated by a user.""")
 
+    # Cached (delay,time_resolution,ticks) conversion of the delay,
+    # used by Simulations with an integer time_resolution.
+    _delay_ticks = None
+
 
     # CEBALERT: should be reimplemented. It's difficult to understand,
     # and contains the same code twice. But it does work.
@@ -579,14 +598,17 @@ class PeriodicEventSequence(EventSequence):
         # Find the timed length of the sequence
         seq_length = sum(e.time for e in self.sequence)
 
+        # Rescheduled relative to sim.time() (the time of this event)
+        # rather than self.time, which is held in ticks on the queue
+        # of a Simulation with a time_resolution.
         if seq_length < self.period:
             # If the sequence is shorter than the period, then reschedule
             # the sequence to occur again after the period
-            self.time += self.period
+            self.time = sim.time() + self.period
         else:
             # If the sequence is longer than the period, then
             # reschedule to start after the sequence ends.
-            self.time += seq_length
+            self.time = sim.time() + seq_length
         sim.enqueue_event(self)
 
     def __repr__(self):
@@ -771,6 +793,280 @@ class SomeTimer(param.Parameterized):
 
 
 
+class ComponentTimings(object):
+    """
+    Accumulated wall-clock time and call counts for the stages of the
+    simulation's components, for finding where the time of a training
+    step goes.
+
+    Timing is off by default, in which case the instrumented code only
+    tests the enabled flag.  When enabled, Simulation.run() records
+    the time taken by each EventProcessor to handle its input events
+    ('input_event') and its process_current_time() call, and the
+    remaining time of the event loop as the 'event_queue' stage of
+    'Simulation'; EventProcessors record their 'send_output'
+    calls, CFProjections their 'input_fns', 'response_fn' and
+    'output_fns', and ProjectionSheets the 'learning_fn' and
+    'weights_output_fns' stages of each of their Projections.
+
+    The stages nest (e.g. a Sheet's process_current_time includes its
+    Projections' learning), so the totals of different rows should
+    not be added together.
+
+    There is a single instance, topo.base.simulation.component_timings,
+    which is also available as Simulation.timings.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self.clear()
+
+
+    def clear(self):
+        """Discard all the times recorded so far."""
+        self._totals = {}
+
+
+    def add(self,component,stage,duration):
+        """
+        Add duration (in seconds) to the time recorded for the given
+        stage of component (an EventProcessor, EPConnection, or name).
+        """
+        key = (self.label(component),stage)
+        with self._lock:
+            total = self._totals.get(key)
+            if total is None:
+                self._totals[key] = [duration,1]
+            else:
+                total[0] += duration
+                total[1] += 1
+
+
+    @staticmethod
+    def label(component):
+        """Name used for component in the table; Projections are prefixed by their dest."""
+        if isinstance(component,str):
+            return component
+        elif isinstance(component,EPConnection):
+            return "%s.%s" % (component.dest.name,component.name)
+        return component.name
+
+
+    def rows(self):
+        """
+        Return a list of (component,stage,calls,total_seconds) tuples,
+        sorted by decreasing total time.
+        """
+        return sorted([(component,stage,calls,total)
+                       for (component,stage),(total,calls) in self._totals.items()],
+                      key=lambda row: -row[3])
+
+
+    def table(self):
+        """Return the recorded times formatted as a table."""
+        lines = ["%-40s %-20s %10s %12s %12s" % ("Component","Stage","Calls","Total (s)","Mean (ms)")]
+        for component,stage,calls,total in self.rows():
+            lines.append("%-40s %-20s %10d %12.4f %12.4f" % (component,stage,calls,total,
+                                                             1000.0*total/calls))
+        return "\n".join(lines)
+
+
+component_timings = ComponentTimings()
+
+
+
+class Tracer(object):
+    """
+    Optional log of timestamped spans, recording when each stage of
+    each component ran over the course of a simulation, for seeing
+    how the cost of training changes over time.
+
+    Each span holds the simulation time, the wall-clock start time
+    (in seconds since start() was called) and duration, and the
+    component and stage names, and is stored as one fixed-size
+    record in a ring buffer. If a path was given to start(), the
+    buffer is appended to that file whenever it fills up or
+    flush_interval seconds have passed, together with a path+'.json'
+    file listing the names; otherwise only the most recent spans are
+    kept. export() writes the spans in the Chrome trace-event JSON
+    format, which can be viewed with chrome://tracing, Perfetto, or
+    speedscope.
+
+    Tracing is off by default, in which case the instrumented code
+    only tests the enabled flag. When enabled, spans are recorded for
+    Simulation.run(), for ProjectionSheet activate and learn calls,
+    and for SettlingCFSheet.process_current_time().
+
+    There is a single instance, topo.base.simulation.tracer, which is
+    also available as Simulation.tracer.
+    """
+
+    record_type = numpy.dtype([('sim_time','<f8'),('start','<f8'),('duration','<f8'),
+                               ('component','<u2'),('stage','<u2')])
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.flush_interval = 10.0
+        self._buffer = numpy.zeros(0,dtype=self.record_type)
+        self._names = []
+        self._name_ids = {}
+        self._next = 0
+        self._pending = 0
+        self._start = self._last_flush = default_timer()
+        self._lock = threading.Lock()
+
+
+    def start(self,path=None,capacity=65536,flush_interval=10.0):
+        """
+        Discard any recorded spans and start recording, keeping up to
+        capacity spans in memory. If path is given, any existing
+        trace there is replaced, and spans are flushed to it.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self._buffer = numpy.zeros(capacity,dtype=self.record_type)
+        self._names = []
+        self._name_ids = {}
+        self._next = 0
+        self._pending = 0
+        self._start = self._last_flush = default_timer()
+        if path is not None:
+            open(path,'wb').close()
+            self._write_names()
+        self.enabled = True
+
+
+    def stop(self):
+        """Stop recording, flushing any spans not yet written."""
+        self.flush()
+        self.enabled = False
+
+
+    def _name_id(self,name):
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self._names)
+            self._names.append(name)
+        return name_id
+
+
+    def add(self,component,stage,sim_time,start):
+        """
+        Record a span of the given stage of component (an
+        EventProcessor, EPConnection, or name) at simulation time
+        sim_time, which began at wall-clock time start (as returned by
+        timeit.default_timer) and ends now.
+        """
+        end = default_timer()
+        with self._lock:
+            self._buffer[self._next] = (float(sim_time),start-self._start,end-start,
+                                        self._name_id(ComponentTimings.label(component)),
+                                        self._name_id(stage))
+            self._next = (self._next+1) % len(self._buffer)
+            self._pending = min(self._pending+1,len(self._buffer))
+            if self.path is not None and (self._pending==len(self._buffer) or
+                                          end-self._last_flush>self.flush_interval):
+                self.flush()
+
+
+    def _pending_records(self):
+        idx = numpy.arange(self._next-self._pending,self._next) % max(len(self._buffer),1)
+        return self._buffer[idx]
+
+
+    def _write_names(self):
+        # Written to a temporary file first, so that a reader never
+        # sees a partial list.
+        tmp = self.path+'.json.tmp'
+        with open(tmp,'w') as f:
+            json.dump({'names':self._names,'record_type':self.record_type.descr},f)
+        os.rename(tmp,self.path+'.json')
+
+
+    def flush(self):
+        """Append the spans recorded since the last flush to the trace file."""
+        if self.path is None or self._pending==0:
+            return
+        self._write_names()
+        with open(self.path,'ab') as f:
+            self._pending_records().tofile(f)
+        self._pending = 0
+        self._last_flush = default_timer()
+
+
+    def records(self):
+        """
+        Return the recorded spans as an array of record_type, together
+        with the list of names their component and stage fields index.
+        """
+        if self.path is None:
+            return self._pending_records(),list(self._names)
+        self.flush()
+        return read_trace(self.path)
+
+
+    def export(self,filename):
+        """Write the recorded spans to filename as Chrome trace-event JSON."""
+        records,names = self.records()
+        write_chrome_trace(records,names,filename)
+
+
+tracer = Tracer()
+
+
+
+# Thread pools used by Simulation.parallel_threads, by number of threads
+_thread_pools = {}
+
+# The list of events held back for the EventProcessor being processed
+# in the current thread (see Simulation._parallel_process_current_time),
+# as (method, args) for the Simulation method that enqueues each one
+_held_events = threading.local()
+
+
+def _process_group(eps):
+    """
+    Call process_current_time() on each of eps in turn, holding back
+    the events each sends; returns a list of (ep, events, duration),
+    where events are as in _held_events.
+    """
+    results = []
+    for ep in eps:
+        _held_events.events = events = []
+        start = default_timer()
+        ep.process_current_time()
+        results.append((ep,events,default_timer()-start))
+    return results
+
+
+def read_trace(path):
+    """
+    Read a trace file written by a Tracer, returning the array of
+    spans and the list of names (as for Tracer.records()).
+    """
+    with open(path+'.json') as f:
+        names = json.load(f)['names']
+    return numpy.fromfile(path,dtype=Tracer.record_type),names
+
+
+def write_chrome_trace(records,names,filename):
+    """
+    Write spans (as returned by Tracer.records() or read_trace()) to
+    filename in the Chrome trace-event JSON format, as complete events
+    with times in microseconds.
+    """
+    events = [{'name':"%s %s" % (names[r['component']],names[r['stage']]),
+               'cat':names[r['stage']],'ph':'X','pid':0,'tid':0,
+               'ts':1e6*float(r['start']),'dur':1e6*float(r['duration']),
+               'args':{'component':names[r['component']],'sim_time':float(r['sim_time'])}}
+              for r in records]
+    with open(filename,'w') as f:
+        json.dump({'traceEvents':events,'displayTimeUnit':'ms'},f)
+
+
+
 # CEBALERT: This singleton-producing mechanism is pretty complicated,
 # and it would be great if someone could simplify it. Getting all of
 # the behavior we want for e.g. Simulation is tricky, but there are
@@ -891,8 +1187,56 @@ class Simulation(param.Parameterized,OptionalSingleton):
         'timestr'.
         """)
 
+    time_resolution = param.Integer(default=None,allow_None=True,bounds=(1,None),doc="""
+        If not None, the number of ticks per unit of simulation time,
+        which switches the event queue to exact integer-tick times.
+
+        The time() seen by the rest of the simulation keeps its
+        time_type and is updated only when the clock advances, but the
+        queue holds the time of each event as an integer number of
+        ticks, connection delays are converted to ticks once (at
+        connect time or when the delay changes), and the event loop
+        compares and adds only integers, which removes time_type
+        arithmetic from the per-event cost of run().  All event times
+        and delays are rounded to the nearest tick, so the resolution
+        must be fine enough to represent them exactly (e.g. 1000 for
+        delays of 0.05).  Events read directly from the queue then
+        have their time in ticks; see next_event_time().""")
+
+    parallel_threads = param.Integer(default=None,allow_None=True,bounds=(1,None),doc="""
+        If not None, the number of threads on which to call the
+        EventProcessors' process_current_time() methods concurrently.
+
+        EventProcessors connected by zero-delay connections are kept
+        together and processed in order, while otherwise independent
+        ones (e.g. the sheets of separate pathways in a hierarchical
+        model) run at the same time, which speeds up models whose
+        numeric kernels release the GIL.  The events they send are
+        held back and enqueued in the same order as if they had been
+        processed one after another, so the results match serial
+        processing exactly, as long as the EventProcessors do not
+        share any other state (such as a common random number
+        generator).""")
+
     eps_to_start = []
 
+    # Ticks per unit time of the times currently on the event queue
+    # (None while they are held in time_type).
+    _queue_resolution = None
+
+    # Time spent in events and process_current_time() during the
+    # current run(), while component_timings are enabled.
+    _timed_duration = 0.0
+
+    # True while the events enqueued by EventProcessors are being held
+    # back by _parallel_process_current_time().
+    _holding_events = False
+
+    # If not None, called as forward_event(conn,time,data) instead of
+    # enqueueing the event for a connection whose dest is not one of
+    # this Simulation's EventProcessors (see topo.misc.distributed).
+    forward_event = None
+
     name = param.Parameter(constant=False)
 
     forever = param.Infinity()
@@ -992,6 +1336,39 @@ class Simulation(param.Parameterized,OptionalSingleton):
         """
         return (self.forever if time == self.forever else self.time.time_type(time))
 
+
+    def _to_ticks(self,time,resolution=None):
+        """Convert the supplied time to the nearest integer number of ticks."""
+        if resolution is None:
+            resolution = self.time_resolution
+        return int(round(float(time*resolution)))
+
+
+    def _from_ticks(self,ticks,resolution=None):
+        """Convert the supplied number of ticks to the Simulation's time_type."""
+        if resolution is None:
+            resolution = self.time_resolution
+        return self.time.time_type(ticks)/resolution
+
+
+    def _sync_ticks(self):
+        """
+        Bring the event queue and the tick clock into line with the
+        current time_resolution and time(), converting the times of
+        queued events if the resolution has changed.
+        """
+        resolution = self.time_resolution
+        if self._queue_resolution != resolution:
+            for event in self.events:
+                if self._queue_resolution is not None:
+                    event.time = self._from_ticks(event.time,self._queue_resolution)
+                if resolution is not None:
+                    event.time = self._to_ticks(event.time,resolution)
+            self._queue_resolution = resolution
+        if resolution is not None:
+            self._ticks = self._to_ticks(self.time())
+            self._event_ticks = [event.time for event in self.events]
+
     # Note that __init__ can still be called after the
     # Simulation(register=True) instance has been created. E.g. with
     # Simulation.register is True,
@@ -1024,6 +1401,8 @@ class Simulation(param.Parameterized,OptionalSingleton):
 
         self.events = [] # CB: consider collections.deque? (PEP 290)
         self._events_stack = []
+        self._ticks = 0
+        self._event_ticks = []
         self.eps_to_start = []
         self.item_scale=1.0 # this variable determines the size of each item in a diagram
 
@@ -1300,6 +1679,9 @@ class Simulation(param.Parameterized,OptionalSingleton):
         # pattern_present(), Test Pattern's Present button, and
         # save_input_generators, but future code may need such calls
         # as well.)
+        if self.time_resolution is not None or self._queue_resolution is not None:
+            self._sync_ticks()
+
         for e in self.eps_to_start:
             e.start()
 
@@ -1313,6 +1695,35 @@ class Simulation(param.Parameterized,OptionalSingleton):
         # Stops time going backward if until less than current time.
         stop_time = self.time() if stop_time < self.time() else stop_time
 
+        # Time not spent inside events or process_current_time() is
+        # attributed to the event loop itself (saving the outer
+        # run()'s total if this call is nested inside an event).
+        timing = component_timings.enabled
+        if timing:
+            run_start = default_timer()
+            outer_timed_duration,self._timed_duration = self._timed_duration,0.0
+        tracing = tracer.enabled
+        if tracing:
+            trace_start,trace_time = default_timer(),self.time()
+
+        if self.time_resolution is not None:
+            self._run_ticks(stop_time,timing)
+        else:
+            self._run(stop_time,timing)
+
+        if timing:
+            component_timings.add('Simulation','event_queue',
+                                  default_timer()-run_start-self._timed_duration)
+            self._timed_duration = outer_timed_duration
+        if tracing:
+            tracer.add('Simulation','run',trace_time,trace_start)
+
+
+    def _run(self,stop_time,timing=False):
+        """
+        The event loop of run(), for a Simulation without a
+        time_resolution; timing enables the component_timings.
+        """
         did_event = False
 
         while self.events and (stop_time == self.forever or self.time() <= stop_time):
@@ -1331,8 +1742,13 @@ class Simulation(param.Parameterized,OptionalSingleton):
                 if did_event:
                     did_event = False
                     #self.debug("Time to sleep; next event time: %s",self.timestr(self.events[0].time))
-                    for ep in self._event_processors.values():
-                        ep.process_current_time()
+                    if self.parallel_threads is not None:
+                        self._parallel_process_current_time(timing)
+                    elif timing:
+                        self._timed_process_current_time()
+                    else:
+                        for ep in self._event_processors.values():
+                            ep.process_current_time()
 
                 # Set the time to the frontmost event.  Bear in mind
                 # that the front event may have been changed by the
@@ -1344,7 +1760,10 @@ class Simulation(param.Parameterized,OptionalSingleton):
                 # Pop and call the event at the head of the queue.
                 event = self.events.pop(0)
                 self.debug("Delivering %s",event)
-                event(self)
+                if timing:
+                    self._timed_event(event)
+                else:
+                    event(self)
                 did_event=True
 
         # The time needs updating if the events have not done it.
@@ -1353,6 +1772,169 @@ class Simulation(param.Parameterized,OptionalSingleton):
         if stop_time != self.forever:
             self.time(stop_time)
 
+
+    def _run_ticks(self,stop_time,timing=False):
+        """
+        The event loop of run(), for a Simulation with a time_resolution.
+
+        Equivalent to the loop in run(), but comparing the integer
+        tick times held in _event_ticks (kept in step with the events
+        list); time() is set only when the clock advances.
+        """
+        stop = None if stop_time == self.forever else self._to_ticks(stop_time)
+
+        did_event = False
+
+        # The attributes are looked up on every iteration, because
+        # events can nest calls to run() or event_pop()
+        while self.events and (stop is None or self._ticks <= stop):
+            next_ticks = self._event_ticks[0]
+
+            if next_ticks < self._ticks:
+                self.warning('Discarding stale (unprocessed) event %s',repr(self.events[0]))
+                self.events.pop(0)
+                self._event_ticks.pop(0)
+
+            elif next_ticks > self._ticks:
+                if did_event:
+                    did_event = False
+                    if self.parallel_threads is not None:
+                        self._parallel_process_current_time(timing)
+                    elif timing:
+                        self._timed_process_current_time()
+                    else:
+                        for ep in self._event_processors.values():
+                            ep.process_current_time()
+
+                next_ticks = self._event_ticks[0]
+                if next_ticks > self._ticks:
+                    self.sleep(self._from_ticks(next_ticks) - self.time())
+                    self._ticks = next_ticks
+
+            else:
+                event = self.events.pop(0)
+                self._event_ticks.pop(0)
+                self.debug("Delivering %s",event)
+                if timing:
+                    self._timed_event(event)
+                else:
+                    event(self)
+                did_event=True
+
+        if stop is not None:
+            self.time(self._from_ticks(stop))
+            self._ticks = stop
+
+
+    def _timed_event(self,event):
+        """
+        Call event, recording the time taken against the dest of an
+        EPConnectionEvent (or against 'Simulation' for other events).
+        """
+        start = default_timer()
+        event(self)
+        duration = default_timer()-start
+        if isinstance(event,EPConnectionEvent):
+            component_timings.add(event.conn.dest,'input_event',duration)
+        else:
+            component_timings.add('Simulation',type(event).__name__,duration)
+        self._timed_duration += duration
+
+
+    def _timed_process_current_time(self):
+        """Call process_current_time() on each EP, recording the time taken."""
+        for ep in self._event_processors.values():
+            start = default_timer()
+            ep.process_current_time()
+            duration = default_timer()-start
+            component_timings.add(ep,'process_current_time',duration)
+            self._timed_duration += duration
+
+
+    def _independent_groups(self):
+        """
+        Return the EventProcessors as a list of groups, such that no
+        zero-delay connection links EventProcessors in different
+        groups; each group keeps the order of _event_processors.
+        """
+        eps = self._event_processors.values()
+        index = dict((ep.name,i) for i,ep in enumerate(eps))
+        group = range(len(eps))
+        def root(i):
+            while group[i]!=i:
+                i = group[i]
+            return i
+        for i,ep in enumerate(eps):
+            for conn in ep.out_connections:
+                if conn.delay == 0 and conn.dest.name in index:
+                    a,b = root(i),root(index[conn.dest.name])
+                    group[max(a,b)] = min(a,b)
+
+        groups = {}
+        for i,ep in enumerate(eps):
+            groups.setdefault(root(i),[]).append(ep)
+        return [groups[i] for i in sorted(groups)]
+
+
+    def _parallel_process_current_time(self,timing=False):
+        """
+        Call process_current_time() on each EP, running independent
+        groups of EPs on parallel_threads threads, then enqueue the
+        events they sent in _event_processors order.
+        """
+        groups = self._independent_groups()
+        if len(groups)<2:
+            if timing:
+                self._timed_process_current_time()
+            else:
+                for ep in self._event_processors.values():
+                    ep.process_current_time()
+            return
+
+        pool = _thread_pools.get(self.parallel_threads)
+        if pool is None:
+            pool = _thread_pools[self.parallel_threads] = ThreadPool(self.parallel_threads)
+
+        start = default_timer()
+        self._holding_events = True
+        try:
+            results = pool.map(_process_group,groups)
+        finally:
+            self._holding_events = False
+
+        held = {}
+        for result in results:
+            for ep,events,duration in result:
+                held[ep.name] = events
+                if timing:
+                    component_timings.add(ep,'process_current_time',duration)
+        for ep in self._event_processors.values():
+            for enqueue,args in held[ep.name]:
+                enqueue(*args)
+        if timing:
+            self._timed_duration += default_timer()-start
+
+
+    @property
+    def timings(self):
+        """
+        The ComponentTimings recording where the time of run() goes;
+        set timings.enabled to True to start recording, and print
+        timings.table() to see the results.
+        """
+        return component_timings
+
+
+    @property
+    def tracer(self):
+        """
+        The Tracer recording a log of timestamped spans; call
+        tracer.start() to start recording and tracer.export() to
+        write the spans out for viewing.
+        """
+        return tracer
+
+
     def sleep(self,delay):
         """
         Advance the simulator time by the specified amount.
@@ -1369,6 +1951,18 @@ class Simulation(param.Parameterized,OptionalSingleton):
         """
         assert isinstance(event,Event)
 
+        if self._holding_events:
+            _held_events.events.append((self.enqueue_event,(event,)))
+            return
+
+        if self._queue_resolution != self.time_resolution:
+            self._sync_ticks()
+
+        if self.time_resolution is not None:
+            event.time = self._to_ticks(event.time)
+            self._insert_ticks(event)
+            return
+
         if not self.events or event >= self.events[-1]:
             # The new event goes at the end of the event queue if there
             # isn't a queue right now, or if it's later than the last
@@ -1385,6 +1979,60 @@ class Simulation(param.Parameterized,OptionalSingleton):
             # are executed FIFO.
             bisect.insort_right(self.events,event)
 
+
+    def _insert_ticks(self,event):
+        """
+        Insert an event whose time is already in ticks into the event
+        queue, after any events at the same time (as for enqueue_event).
+        """
+        i = bisect.bisect_right(self._event_ticks,event.time)
+        self._event_ticks.insert(i,event.time)
+        self.events.insert(i,event)
+
+
+    def enqueue_connection_event(self,conn,data=None,deep_copy=True):
+        """
+        Enqueue an EPConnectionEvent carrying the given data over the
+        given connection, for delivery after the connection's delay.
+        """
+        if self._holding_events:
+            # Copied now, as the EventProcessor may change the data
+            # before the event is enqueued
+            _held_events.events.append((self.enqueue_connection_event,
+                                        (conn,deepcopy(data) if deep_copy else data,False)))
+            return
+
+        if self.forward_event is not None and conn.dest.name not in self._event_processors:
+            self.forward_event(conn,self.convert_to_time_type(conn.delay)+self.time(),
+                               deepcopy(data) if deep_copy else data)
+            return
+
+        if self.time_resolution is None:
+            self.enqueue_event(EPConnectionEvent(self.convert_to_time_type(conn.delay)+self.time(),
+                                                 conn,data,deep_copy=deep_copy))
+            return
+
+        delay_ticks = conn._delay_ticks
+        if delay_ticks is None or delay_ticks[0] != conn.delay or delay_ticks[1] != self.time_resolution:
+            delay_ticks = conn._delay_ticks = (conn.delay,self.time_resolution,
+                                               self._to_ticks(conn.delay))
+        if self._queue_resolution != self.time_resolution:
+            self._sync_ticks()
+        self._insert_ticks(EPConnectionEvent(self._ticks+delay_ticks[2],conn,data,deep_copy=deep_copy))
+
+
+    def next_event_time(self):
+        """
+        Return the time (in the Simulation's time_type) of the next
+        event on the queue, or None if the queue is empty.
+        """
+        if not self.events:
+            return None
+        elif self._queue_resolution is not None:
+            return self._from_ticks(self.events[0].time,self._queue_resolution)
+        else:
+            return self.events[0].time
+
     def schedule_command(self,times,command_string):
         """
         Add a command to execute in __main__.__dict__ at the
@@ -1451,6 +2099,9 @@ class Simulation(param.Parameterized,OptionalSingleton):
         """
         time, self.events = self._events_stack.pop()
         self.time(time)
+        if self._queue_resolution is not None:
+            self._event_ticks = [event.time for event in self.events]
+            self._ticks = self._to_ticks(time,self._queue_resolution)
 
 
     def event_clear(self,event_type=EPConnectionEvent):
@@ -1468,6 +2119,8 @@ class Simulation(param.Parameterized,OptionalSingleton):
             if not isinstance(e,event_type):
                 events_temp = events_temp + [e]
         self.events = events_temp
+        if self._queue_resolution is not None:
+            self._event_ticks = [event.time for event in self.events]
 
 
 
@@ -1490,6 +2143,8 @@ class Simulation(param.Parameterized,OptionalSingleton):
 
         # Looks up src and dest in our dictionary of objects
         conn = connection_type(src=self[src],dest=self[dest],**conn_params)
+        if self.time_resolution is not None:
+            conn._delay_ticks = (conn.delay,self.time_resolution,self._to_ticks(conn.delay))
         self[src]._src_connect(conn)
         self[dest]._dest_connect(conn)
         return conn
@@ -18,6 +18,7 @@ import string
 import time
 import platform
 import tarfile, zipfile
+import json
 
 import __main__
 
@@ -576,6 +577,126 @@ def load_kwargs(fname, glob, loc, fail_exception=False):
     else:                        return kwargs
 
 
+class BatchStatus(object):
+    """
+    Live metrics of a batch run, written atomically to a small status
+    file so that monitoring tools can follow many concurrent runs
+    without parsing their output.
+
+    The metrics are the simulation time and progress towards the
+    final time, the iterations (units of simulation time) per second
+    since the last update and overall, the estimated time remaining,
+    the number of connections and the connections updated per second
+    (assuming every connection is updated once per iteration), the
+    process's current and peak memory use, the length of the event
+    queue, and the time of the last checkpoint (the end of the last
+    of run_batch's times, when the analysis and saving is done).
+
+    The file is written either as a JSON dictionary or in the
+    Prometheus text exposition format, with every metric labelled
+    with the name of the run.
+    """
+
+    def __init__(self,filename,run_name,target_time,format='json'):
+        self.filename = filename
+        self.run_name = run_name
+        self.target_time = float(target_time)
+        self.format = format
+        self.start_wall = self._last_wall = time.time()
+        self.start_sim = self._last_sim = float(topo.sim.time())
+        self.last_checkpoint = None
+        self.last_checkpoint_sim_time = None
+        self.connections = n_conns()
+
+
+    def checkpoint(self):
+        """Record that a checkpoint was just completed, and update the status."""
+        self.last_checkpoint = time.time()
+        self.last_checkpoint_sim_time = float(topo.sim.time())
+        # Connections may have been added or pruned (e.g. by sparse sprouting)
+        self.connections = n_conns()
+        self.update()
+
+
+    @staticmethod
+    def _memory():
+        """Return the current and peak resident memory of this process in bytes (None if unknown)."""
+        import os
+        rss = max_rss = None
+        try:
+            import resource
+            # ru_maxrss is in kilobytes on Linux
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+        except ImportError:
+            pass
+        try:
+            with open('/proc/self/statm') as f:
+                rss = int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+        except (IOError,ValueError,OSError):
+            pass
+        return rss,max_rss
+
+
+    def metrics(self,state='running'):
+        """Return an OrderedDict of the current metrics."""
+        now,sim_time = time.time(),float(topo.sim.time())
+        interval = now-self._last_wall
+        rate = (sim_time-self._last_sim)/interval if interval>0 else 0.0
+        elapsed = now-self.start_wall
+        mean_rate = (sim_time-self.start_sim)/elapsed if elapsed>0 else 0.0
+        self._last_wall,self._last_sim = now,sim_time
+        remaining = max(self.target_time-sim_time,0.0)
+        rss,max_rss = self._memory()
+        return OrderedDict([
+            ('run',self.run_name),
+            ('state',state),
+            ('updated',now),
+            ('sim_time',sim_time),
+            ('target_time',self.target_time),
+            ('progress',sim_time/self.target_time if self.target_time>0 else 1.0),
+            ('elapsed_seconds',elapsed),
+            ('iterations_per_second',rate),
+            ('mean_iterations_per_second',mean_rate),
+            ('eta_seconds',remaining/mean_rate if mean_rate>0 else None),
+            ('connections',self.connections),
+            ('connections_per_second',rate*self.connections),
+            ('memory_rss_bytes',rss),
+            ('memory_max_rss_bytes',max_rss),
+            ('event_queue_length',len(topo.sim.events)),
+            ('last_checkpoint',self.last_checkpoint),
+            ('last_checkpoint_sim_time',self.last_checkpoint_sim_time)])
+
+
+    def _prometheus(self,metrics):
+        labels = '{run="%s"}' % metrics['run'].replace('\\','\\\\').replace('"','\\"')
+        lines = []
+        for name,value in metrics.items():
+            if name=='run' or value is None:
+                continue
+            elif name=='state':
+                name,value = 'state_'+value,1
+            lines.append("# TYPE topographica_%s gauge" % name)
+            lines.append("topographica_%s%s %r" % (name,labels,float(value)))
+        return "\n".join(lines)+"\n"
+
+
+    def update(self,state='running'):
+        """Write the current metrics to the status file."""
+        import os
+        metrics = self.metrics(state)
+        if self.format=='prometheus':
+            text = self._prometheus(metrics)
+        else:
+            text = json.dumps(metrics,indent=1)
+        # Replace the file in one step, so that readers never see a
+        # partially written status
+        tmp = self.filename+'.tmp'
+        with open(tmp,'w') as f:
+            f.write(text)
+        os.rename(tmp,self.filename)
+
+
+
 # ALERT: Need to move docs into params.
 class run_batch(ParameterizedFunction):
     """
@@ -714,6 +835,27 @@ class run_batch(ParameterizedFunction):
       Interval between updates of the progress bar (if enabled) in
       units of topo.sim.time.""")
 
+    timings = param.Boolean(default=False, doc="""
+      Whether to record where the time of the run goes, using
+      topo.sim.timings.  If True, the table of times per component and
+      stage is written to a .timings file alongside the .out file
+      after each of the times.""")
+
+    trace = param.Boolean(default=False, doc="""
+      Whether to record a trace of timestamped spans, using
+      topo.sim.tracer.  If True, the spans are written to a .trace
+      file alongside the .out file as the run proceeds, and exported
+      to a .trace.json file (in Chrome trace-event format) after each
+      of the times.""")
+
+    status_format = param.ObjectSelector(default=None,
+                    objects=[None, 'json', 'prometheus'], doc="""
+      Whether to write live metrics of the run (see BatchStatus) to a
+      status file in the output directory, and if so, in which
+      format: 'json' writes status.json, and 'prometheus' writes
+      status.prom in the Prometheus text format.  The file is updated
+      every progress_interval units of simulation time.""")
+
     def _truncate(self,p,s):
         """
         If s is greater than the max_name_length parameter, truncate it
@@ -834,6 +976,7 @@ class run_batch(ParameterizedFunction):
         # Run script in main
         error_count = 0
         initial_warning_count = param.parameterized.warning_count
+        status = None
         try:
             execfile(script_file,__main__.__dict__) #global_params.context
             global_params.check_for_unused_names()
@@ -845,7 +988,17 @@ class run_batch(ParameterizedFunction):
             from holoviews.ipython.widgets import ProgressBar, RunProgress
             import numpy as np
             ProgressBar.display = p.progress_bar
-            progress_bar = RunProgress(run_hook = topo.sim.run,
+            if p.status_format is not None:
+                status = BatchStatus(os.path.join(dirpath,"status.json" if p.status_format=='json'
+                                                  else "status.prom"),
+                                     simname,max(times),p.status_format)
+                def run_hook(duration):
+                    topo.sim.run(duration)
+                    status.update()
+            else:
+                run_hook = topo.sim.run
+
+            progress_bar = RunProgress(run_hook = run_hook,
                                        display  = p.progress_bar,
                                        interval = p.progress_interval)
 
@@ -856,11 +1009,23 @@ class run_batch(ParameterizedFunction):
                 completion = 100 * (times - times.min()) / (times.max() - times.min())
                 completion = np.array([0] + list(completion))
 
+            if p.timings:
+                topo.sim.timings.clear()
+                topo.sim.timings.enabled = True
+            if p.trace:
+                topo.sim.tracer.start(normalize_path(simpath+".trace"))
+
             # Run each segment, doing the analysis and saving the script state each time
             for i, run_to in enumerate(times):
                 progress_bar.percent_range = (completion[i], completion[i+1])
                 progress_bar(run_to - topo.sim.time())
 
+                if p.timings:
+                    with open(normalize_path(simpath+".timings"),'w') as f:
+                        f.write("Times up to %s\n\n%s\n" % (topo.sim.timestr(),topo.sim.timings.table()))
+                if p.trace:
+                    topo.sim.tracer.export(normalize_path(simpath+".trace.json"))
+
                 p.analysis_fn()
                 normalize_path.prefix = metadata_dir
                 if p.save_script_repr == 'first'  and run_to == times[0]:
@@ -870,18 +1035,29 @@ class run_batch(ParameterizedFunction):
                 elif p.save_script_repr == 'all':
                     save_script_repr()
                 normalize_path.prefix = dirpath
+                if status is not None:
+                    status.checkpoint()
                 elapsedtime=time.time()-starttime
                 param.Parameterized(name="run_batch").message(
                     "Elapsed real time %02d:%02d." % (int(elapsedtime/60),int(elapsedtime%60)))
 
             if p.snapshot:
                save_snapshot()
+            if status is not None:
+                status.update('finished')
 
         except:
             error_count+=1
             import traceback
             traceback.print_exc(file=sys.stdout)
             sys.stderr.write("Warning -- Error detected: execution halted.\n")
+            if status is not None:
+                status.update('error')
+
+        if p.timings:
+            topo.sim.timings.enabled = False
+        if p.trace:
+            topo.sim.tracer.stop()
 
         if p.metadata_dir != '' and p.compress_metadata == 'tar.gz':
             _, name = os.path.split(metadata_dir)
@@ -9,11 +9,16 @@ retinal magnification using a CFProjection.  A CoordinateMapperFn
 (x,y) pair.  To apply a mapping to a CF projection, set the
 CFProjection's coord_mapper parameter to an instance of the desired
 CoordinateMapperFn.
+
+Most of the mappers here are written in terms of elementwise numpy
+operations, and so also accept arrays of x and y coordinates; these
+are marked as vectorized, allowing projections to map the positions
+of all their units in one call (see CoordinateMapperFn.map_arrays).
 """
 
-from math import atan,pi,atan2
+from math import pi
 
-from numpy import exp,log,sqrt,sin,cos,ones,dot
+from numpy import exp,log,sqrt,sin,cos,ones,arctan,arctan2,trunc,full,shape,isscalar,asarray
 from numpy.matlib import matrix
 
 import param
@@ -36,9 +41,13 @@ class ConstantMapper(CoordinateMapperFn):
     y_cons = param.Number(default=0.0, doc="""
        Constant y value returned by the mapping.""")
 
+    vectorized = True
+
     def __call__(self, x, y):
         # Ignores all (x,y), always returning (x_cons,y_cons)
-        return self.x_cons, self.y_cons
+        if isscalar(x):
+            return self.x_cons, self.y_cons
+        return full(shape(x),self.x_cons), full(shape(y),self.y_cons)
 
 
 class Pipeline(CoordinateMapperFn):
@@ -49,6 +58,10 @@ class Pipeline(CoordinateMapperFn):
     mappers=param.List(default=[],
         doc="The sequence of mappers to apply.")
 
+    @property
+    def vectorized(self):
+        return all(m.vectorized for m in self.mappers)
+
     def __call__(self,x,y):
         return reduce( lambda args,f: apply(f,args),
                        [(x,y)] + self.mappers )
@@ -92,12 +105,14 @@ class Grid(CoordinateMapperFn):
     ydensity = param.Number(default=1, bounds=(0,None), doc="""
         Number of rows per 1.0 input sheet distance vertically.""")
 
+    vectorized = True
+
     def __call__(self,x,y):
         xd=self.xdensity
         yd=self.ydensity
 
-        xquant=(1.0/xd)*(int(xd*(x+0.5))-(0.5*(xd-1)))
-        yquant=(1.0/yd)*(int(yd*(y+0.5))-(0.5*(yd-1)))
+        xquant=(1.0/xd)*(trunc(xd*(x+0.5))-(0.5*(xd-1)))
+        yquant=(1.0/yd)*(trunc(yd*(y+0.5))-(0.5*(yd-1)))
 
         return  xquant,yquant
 
@@ -110,12 +125,14 @@ class Polar2Cartesian(CoordinateMapperFn):
     degrees=param.Boolean(default=True,
         doc="Indicates whether the input angle is in degrees or radians.")
 
+    vectorized = True
+
     def __call__(self, r, theta):
 
         if self.degrees:
             theta = theta * pi/180
 
-            return r*cos(theta), r*sin(theta)
+        return r*cos(theta), r*sin(theta)
 
 
 class Cartesian2Polar(CoordinateMapperFn):
@@ -131,18 +148,20 @@ class Cartesian2Polar(CoordinateMapperFn):
         given negative radii, and angles between -90 and 90
         degrees. (useful for mapping to saccade amplitude/direction space)""")
 
+    vectorized = True
+
     def __call__(self, x, y):
 
         if self.negative_radii:
             xsgn,xabs = signabs(x)
             radius = xsgn * sqrt(x*x+y*y)
-            angle = atan2(y,xabs)
+            angle = arctan2(y,xabs)
         else:
             radius = sqrt(x*x+y*y)
-            angle = atan2(y,x)
+            angle = arctan2(y,x)
 
         if self.degrees:
-            angle *= 180/pi
+            angle = angle * 180/pi
 
         return radius,angle
 
@@ -170,33 +189,14 @@ class AffineTransform(CoordinateMapperFn):
        will shift points to the right by 3 units and rotate them around
        the origin by 90 degrees.""")
 
-    def __init__(self, **kw):
-        super(AffineTransform,self).__init__(**kw)
-
-        # This buffer prevents having to allocate memory for each point.
-        self._op_buf = matrix([[0.0],
-                               [0.0],
-                               [1.0]])
+    vectorized = True
 
     def __call__(self, x, y):
-
-        ## JPHACKALERT: If the coordmapper interface took a matrix of
-        ## x/y column vectors, instead of x and y separately, affine
-        ## transforms could be applied to all the points in a single
-        ## matrix operation.  This would probably require revision of
-        ## some of the other coordmapper functions, but it might allow
-        ## some optimization in, e.g., CFProjection intialization by
-        ## allowing all the CF positions to be computed at once.
-
-        ## JPALERT: This is the easy way, but it allocates a matrix
-        ## for the result.  It might be faster to unroll the
-        ## computation.
-
-        self._op_buf[0] = x
-        self._op_buf[1] = y
-        result = dot(self.matrix,self._op_buf)
-
-        return result[0,0],result[1,0]
+        # The product of the matrix with the column vector (x,y,1),
+        # unrolled so that x and y can equally be arrays of points.
+        m = asarray(self.matrix)
+        return (m[0,0]*x + m[0,1]*y + m[0,2],
+                m[1,0]*x + m[1,1]*y + m[1,2])
 
 
 def Translate2dMat(xoff,yoff):
@@ -283,12 +283,13 @@ class SingleDimensionMapper(CoordinateMapperFn):
         objects=['radius','x','y','xy'],doc="""
         The dimension to remap. ('xy' remaps x and y independently.)""")
 
+    vectorized = True
 
     def __call__(self,x,y):
 
         if self.remap_dimension == 'radius':
             r = sqrt(x**2 + y**2)
-            a = atan2(x,y)
+            a = arctan2(x,y)
             new_r = self._map_fn(r)
             xout = new_r * sin(a)
             yout = new_r * cos(a)
@@ -377,6 +378,7 @@ class OttesSCMapper(CoordinateMapperFn):
         degrees per unit of sheet.  Indicates what direction of saccade
         is represented by the y-component of the command input.""")
 
+    vectorized = True
 
     def __call__(self,x,y):
         raise NotImplementedError
@@ -451,9 +453,9 @@ def ottes_mapping(R,phi,A,Bu,Bv):
     medial/lateral.
     """
 
-    phi *= pi/180
+    phi = phi * pi/180
     u = Bu * (log(sqrt(R**2 + A**2 + 2*A*R*cos(phi))) - log(A))
-    v = Bv * atan((R*sin(phi))/(R*cos(phi)+A))
+    v = Bv * arctan((R*sin(phi))/(R*cos(phi)+A))
     return u,v
 
 
@@ -471,7 +473,7 @@ def ottes_inverse_mapping(u,v,A,Bu,Bv):
     rads = pi/180
     R   = A * sqrt(exp(2*u/Bu) - 2*exp(u/Bu)*cos(rads*v/Bv) + 1)
     #phi = atan( (exp(u/Bu)*sin(rads*v/Bv)) / (exp(u/Bu)*cos(rads*v/Bv) -1) )
-    phi = atan2( (exp(u/Bu)*sin(rads*v/Bv)), (exp(u/Bu)*cos(rads*v/Bv) -1) ) * 180/pi
+    phi = arctan2( (exp(u/Bu)*sin(rads*v/Bv)), (exp(u/Bu)*cos(rads*v/Bv) -1) ) * 180/pi
 
     # JPALERT: Don't know why we have to multiply by 180/pi twice, but the answers
     # are way off without it.  Is the bug in my code, or in the original formula?
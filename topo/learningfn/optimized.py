@@ -5,19 +5,19 @@ written in C to optimize performance.
 Requires the weave package; without it unoptimized versions are used.
 """
 
-from numpy import zeros, ones
+from numpy import zeros, ones, where
 
 import param
 
 from topo.base.sheet import activity_type
 from topo.base.cf import CFPLearningFn,CFPLF_Plugin
-from topo.learningfn.projfn import CFPLF_PluginScaled
+from topo.learningfn.projfn import CFPLF_PluginScaled, HomeoSynaptic
 from topo.base.functionfamily import Hebbian,LearningFn
 from topo.misc.inlinec import inline,provide_unoptimized_equivalent,\
      c_header,c_decorators
 from topo.learningfn import BCMFixed
 
-from projfn import CFPLF_Trace  # pyflakes:ignore (optimized version provided)
+from projfn import CFPLF_Trace, CFPLF_OutstarHebbian  # pyflakes:ignore (optimized version provided)
 
 
 
@@ -324,21 +324,24 @@ class CFPLF_Trace_opt(CFPLearningFn):
         doc="LearningFn that will be applied to each CF individually.")
 
     def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
-        cfs = iterator.flatcfs  # pyflakes:ignore (passed to weave C code)
         single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
         irows,icols = input_activity.shape
+        sheet_mask = iterator.get_sheet_mask()
+
+        ##Initialise traces to zero if they don't already exist
+        if not hasattr(self,'traces'):
+            self.traces=zeros(output_activity.shape,activity_type)
+
+        # Like CFPLF_Trace, update the traces only of units in the sheet mask
+        self.traces = where(sheet_mask!=0,
+                            (self.trace_strength*output_activity)+((1-self.trace_strength)*self.traces),
+                            self.traces)
 
         if single_connection_learning_rate==0:
             return
 
         cfs = iterator.flatcfs
         num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
-
-        ##Initialise traces to zero if they don't already exist
-        if not hasattr(self,'traces'):
-            self.traces=zeros(output_activity.shape,activity_type)
-
-        self.traces = (self.trace_strength*output_activity)+((1-self.trace_strength)*self.traces)
         traces = self.traces  # pyflakes:ignore (passed to weave C code)
         cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
         code = c_header + """
@@ -351,7 +354,7 @@ class CFPLF_Trace_opt(CFPLearningFn):
             %(cfs_loop_pragma)s
             for (int r=0; r<num_cfs; ++r) {
                 double load = traces[r];
-                if (load != 0) {
+                if (load != 0 && sheet_mask[r] != 0) {
                     load *= single_connection_learning_rate;
                     PyObject *cf = PyList_GetItem(cfs,r);
 
@@ -363,7 +366,7 @@ class CFPLF_Trace_opt(CFPLearningFn):
 
                     double total = 0.0;
 
-                    // modify non-masked weights
+                    // modify non-masked weights, with the decay term
                     npfloat *inpj = input_activity+icols*rr1+cc1;
                     for (int i=rr1; i<rr2; ++i) {
                         npfloat *inpi = inpj;
@@ -372,8 +375,8 @@ class CFPLF_Trace_opt(CFPLearningFn):
                             // use a robust comparison instead of testing
                             // against exactly 0.0.
                             if (*(mask++) >= MASK_THRESHOLD) {
-                                *weights += load * *inpi;
-                                total += fabs(*weight);
+                                *weights += load * (*inpi - *weights);
+                                total += fabs(*weights);
                             }
                             ++weights;
                             ++inpi;
@@ -389,10 +392,193 @@ class CFPLF_Trace_opt(CFPLearningFn):
             }
         """%c_decorators
 
-        inline(code, ['input_activity', 'traces','num_cfs', 'icols',
+        inline(code, ['input_activity', 'traces','sheet_mask','num_cfs', 'icols',
                       'cfs', 'single_connection_learning_rate','cf_type'],
                local_dict=locals(),
                headers=['<structmember.h>'])
 
 
 provide_unoptimized_equivalent("CFPLF_Trace_opt","CFPLF_Trace",locals())
+
+
+
+class HomeoSynaptic_opt(HomeoSynaptic):
+    """
+    Optimized version of HomeoSynaptic (with a Hebbian
+    single_cf_fn); see projfn.py for more info.
+
+    As a side effect, sets the norm_total attribute on every cf in the
+    sheet mask, to speed up later operations that might depend on it.
+    """
+
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        activity_norm = self._activity_norm(iterator,output_activity)  # pyflakes:ignore (passed to weave C code)
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+
+        cfs = iterator.flatcfs
+        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        irows,icols = input_activity.shape
+        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
+        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
+
+        # Unlike for Hebbian learning, the weights of inactive units
+        # change too (by the homeostatic scaling)
+        code = c_header + """
+            DECLARE_SLOT_OFFSET(weights,cf_type);
+            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+            DECLARE_SLOT_OFFSET(mask,cf_type);
+            DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+            DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+            %(cfs_loop_pragma)s
+            for (int r=0; r<num_cfs; ++r) {
+                if (sheet_mask[r] != 0) {
+                    double load = output_activity[r]*single_connection_learning_rate;
+                    double norm = activity_norm[r];
+
+                    PyObject *cf = PyList_GetItem(cfs,r);
+
+                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                    double total = 0.0;
+
+                    // modify non-masked weights
+                    npfloat *inpj = input_activity+icols*rr1+cc1;
+                    for (int i=rr1; i<rr2; ++i) {
+                        npfloat *inpi = inpj;
+                        for (int j=cc1; j<cc2; ++j) {
+                            if (*(mask++) >= MASK_THRESHOLD) {
+                                *weights += load * *inpi;
+                                *weights /= norm;
+                                total += fabs(*weights);
+                            }
+                            ++weights;
+                            ++inpi;
+                        }
+                        inpj += icols;
+                    }
+                    // store the sum of the cf's weights
+                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                    _norm_total[0]=total;
+                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                    _has_norm_total[0]=1;
+                }
+            }
+        """%c_decorators
+
+        inline(code, ['input_activity', 'output_activity','activity_norm','sheet_mask',
+                      'num_cfs', 'icols', 'cfs', 'single_connection_learning_rate','cf_type'],
+               local_dict=locals(),
+               headers=['<structmember.h>'])
+
+        self._record_history(iterator)
+
+
+provide_unoptimized_equivalent("HomeoSynaptic_opt","HomeoSynaptic",locals())
+
+
+
+class CFPLF_OutstarHebbian_opt(CFPLearningFn):
+    """
+    Optimized version of CFPLF_OutstarHebbian (with a Hebbian
+    single_cf_fn); see projfn.py for more info.
+
+    As a side effect, sets the norm_total attribute on any cf whose
+    weights are updated during learning, to speed up later operations
+    that might depend on it.
+    """
+
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    outstar_wsum = None
+
+    def __call__(self, iterator, input_activity, output_activity, learning_rate, **params):
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+
+        cfs = iterator.flatcfs
+        num_cfs = len(cfs)  # pyflakes:ignore (passed to weave C code)
+        irows,icols = input_activity.shape
+        cf_type = iterator.cf_type  # pyflakes:ignore (passed to weave C code)
+        sheet_mask = iterator.get_sheet_mask()  # pyflakes:ignore (passed to weave C code)
+        outstar_wsum = zeros(input_activity.shape)
+
+        # The CFs overlap, so the weights are summed in a separate,
+        # serial loop after the (parallel) learning
+        code = c_header + """
+            DECLARE_SLOT_OFFSET(weights,cf_type);
+            DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+            DECLARE_SLOT_OFFSET(mask,cf_type);
+            DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+            DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+            %(cfs_loop_pragma)s
+            for (int r=0; r<num_cfs; ++r) {
+                double load = output_activity[r]*single_connection_learning_rate;
+                if (load != 0 && sheet_mask[r] != 0) {
+                    PyObject *cf = PyList_GetItem(cfs,r);
+
+                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                    double total = 0.0;
+
+                    // modify non-masked weights
+                    npfloat *inpj = input_activity+icols*rr1+cc1;
+                    for (int i=rr1; i<rr2; ++i) {
+                        npfloat *inpi = inpj;
+                        for (int j=cc1; j<cc2; ++j) {
+                            if (*(mask++) >= MASK_THRESHOLD) {
+                                *weights += load * *inpi;
+                                total += fabs(*weights);
+                            }
+                            ++weights;
+                            ++inpi;
+                        }
+                        inpj += icols;
+                    }
+                    // store the sum of the cf's weights
+                    LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+                    _norm_total[0]=total;
+                    LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+                    _has_norm_total[0]=1;
+                }
+            }
+
+            // Outstar sum, indexed by position within the weights matrix
+            for (int r=0; r<num_cfs; ++r) {
+                if (sheet_mask[r] != 0) {
+                    PyObject *cf = PyList_GetItem(cfs,r);
+
+                    LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+                    LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+
+                    UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+                    for (int i=0; i<rr2-rr1; ++i) {
+                        double *wsum = outstar_wsum+icols*i;
+                        for (int j=0; j<cc2-cc1; ++j) {
+                            *(wsum++) += *(weights++);
+                        }
+                    }
+                }
+            }
+        """%c_decorators
+
+        inline(code, ['input_activity', 'output_activity','sheet_mask','outstar_wsum',
+                      'num_cfs', 'icols', 'cfs', 'single_connection_learning_rate','cf_type'],
+               local_dict=locals(),
+               headers=['<structmember.h>'])
+
+        self.outstar_wsum = outstar_wsum
+
+
+provide_unoptimized_equivalent("CFPLF_OutstarHebbian_opt","CFPLF_OutstarHebbian",locals())
@@ -159,14 +159,14 @@ class CFPLF_OutstarHebbian(CFPLearningFn):
         for cf,i in iterator():
             single_cf_fn(cf.get_input_matrix(input_activity),
                          output_activity.flat[i], cf.weights, single_connection_learning_rate)
+            # CEBHACKALERT: see ConnectionField.__init__()
+            cf.weights *= cf.mask
+
             # Outstar normalization
             wrows,wcols = cf.weights.shape
-            for wr in xrange(wrows):
-                for wc in xrange(wcols):
-                    outstar_wsum[wr][wc] += cf.weights[wr][wc]
+            outstar_wsum[:wrows,:wcols] += cf.weights
 
-            # CEBHACKALERT: see ConnectionField.__init__()
-            cf.weights *= cf.mask
+        self.outstar_wsum = outstar_wsum
 
 
 
@@ -207,6 +207,32 @@ class HomeoSynaptic(CFPLearningFn):
         and the response of this unit (the unit_activity), governed by
         a per-connection learning rate.
         """
+        activity_norm = self._activity_norm(iterator,output_activity)
+
+        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+
+        # avoid evaluating these references each time in the loop
+        single_cf_fn = self.single_cf_fn
+        for cf,i in iterator():
+            single_cf_fn(cf.get_input_matrix(input_activity),
+                         output_activity.flat[i], cf.weights, single_connection_learning_rate)
+
+            # homeostatic normalization
+            cf.weights /= activity_norm.flat[i]
+
+            # CEBHACKALERT: see ConnectionField.__init__()
+            cf.weights *= cf.mask
+
+        self._record_history(iterator)
+
+
+    def _activity_norm(self, iterator, output_activity):
+        """
+        Update the recent average activity of each unit, returning the
+        factor by which each unit's weights are to be divided.
+
+        The first time, also normalizes the initial weights to 1.0.
+        """
         if not hasattr(self,'averages'):
             self.averages = np.ones(output_activity.shape, dtype=np.float) * 0.1
 
@@ -220,23 +246,11 @@ class HomeoSynaptic(CFPLearningFn):
 
         # compute recent average of output activity
         self.averages = self.beta_c * output_activity + (1.0-self.beta_c) * self.averages
-        activity_norm = 1.0 + self.beta_n * \
+        return 1.0 + self.beta_n * \
            ((self.averages - self.activity_target)/self.activity_target)
 
-        single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
-
-        # avoid evaluating these references each time in the loop
-        single_cf_fn = self.single_cf_fn
-        for cf,i in iterator():
-            single_cf_fn(cf.get_input_matrix(input_activity),
-                         output_activity.flat[i], cf.weights, single_connection_learning_rate)
-
-            # homeostatic normalization
-            cf.weights /= activity_norm.flat[i]
-
-            # CEBHACKALERT: see ConnectionField.__init__()
-            cf.weights *= cf.mask
 
+    def _record_history(self, iterator):
         # For analysis only; can be removed (in which case also remove the initializations above)
 # CEBALERT: I changed [0][7] to [0]!
         self.ave_hist.append(self.averages.flat[0])
@@ -24,9 +24,11 @@ from param.parameterized import Parameterized
 from topo.base.simulation import OptionalSingleton
 
 try:
-    # By default, use a non-GUI backend for matplotlib.
-    from matplotlib import pyplot as plt
-    plt.switch_backend('agg')
+    # By default, use a non-GUI backend for matplotlib. Only the
+    # backend is selected here; pyplot itself is slow to import, so
+    # it is left until something actually plots.
+    import matplotlib
+    matplotlib.use('agg')
 
     matplotlib_imported=True
 except ImportError:
@@ -459,6 +461,7 @@ def gui(start=True,exit_on_quit=True):
     """Start the GUI as if -g were supplied in the command used to launch Topographica."""
     if matplotlib_imported:
         from holoviews.plotting import mpl
+        from matplotlib import pyplot as plt
         plt.switch_backend('TkAgg')
     auto_import_commands()
     if start:
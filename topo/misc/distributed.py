@@ -0,0 +1,225 @@
+"""
+Running one simulation across several processes.
+
+The EventProcessors (e.g. sheets) of a model are divided into groups,
+and each group is simulated by a separate worker process, which may
+be on another machine. Every worker builds the whole model but runs
+only its own group; the data sent over connections to EventProcessors
+of other groups is passed on to their workers instead of being
+enqueued locally.
+
+Synchronization is conservative: the lookahead is the shortest delay
+of the connections between groups, so that nothing sent at time t
+can arrive at another worker before t+lookahead. A coordinator lets
+all the workers run for one lookahead at a time, and in between
+passes on the events each worker sent, which are all for delivery in
+a later window. The results are therefore the same as when running
+in a single process, except that events arriving at one
+EventProcessor at the same time from different workers are delivered
+in order of worker rather than of sending.
+
+An EventProcessor with a group_with attribute (the name of another
+EventProcessor) is simulated by the same worker as that one, without
+being listed in the groups; a connection with a select(data) method
+sends only the part of the data that method returns to another
+worker. Both are used by topo.misc.rowstripes.
+
+Because every worker builds the whole model, each needs enough memory
+to create all of it, even though it keeps running only its own group
+(see topo.misc.rowstripes for how this applies to a decomposed sheet).
+
+Typical use, with a new local process for each worker:
+
+  from topo.misc.distributed import run_distributed
+  results = run_distributed(build,[['Retina','LGNOn','LGNOff'],['V1']],10.0)
+
+where build is a function that creates the model in topo.sim without
+running it, and that the workers can import (i.e. it must be defined
+in a module rather than in __main__). To use other machines, start
+the coordinator with processes=0, an address the other machines can
+reach and an authkey, then start a worker on each machine:
+
+  ./topographica -c "from topo.misc.distributed import worker; worker(('coordinator.host',7000),'secret')"
+"""
+
+import os
+import sys
+import subprocess
+import traceback
+
+from multiprocessing.connection import Listener, Client
+
+import topo
+from topo.base.simulation import Event, EPConnectionEvent
+
+
+# The names in this worker's group, while the model is being built
+# (None when not in a worker)
+current_group = None
+
+
+class _Idle(Event):
+    """
+    Event that does nothing; one is kept on a worker's queue after
+    the end of the run, so that process_current_time() is called
+    even when no other event follows (see Simulation.run()).
+    """
+    def __call__(self,sim):
+        pass
+
+
+def _connection_key(conn):
+    return (conn.src.name,conn.dest.name,conn.name)
+
+
+def _serve(coordinator):
+    global current_group
+    build,group,groups = coordinator.recv()
+    current_group = group
+    try:
+        build()
+    finally:
+        current_group = None
+    sim = topo.sim
+
+    missing = set(name for g in groups for name in g)-set(sim.objects())
+    if missing:
+        raise ValueError("Unknown EventProcessors %s"%sorted(missing))
+    group = list(group)+[name for name,ep in sim.objects().items()
+                         if getattr(ep,'group_with',None) in group]
+
+    # Drop the other groups' EventProcessors (but not their
+    # connections), so that they are neither started nor processed
+    for name in sim.objects().keys():
+        if name not in group:
+            del sim._event_processors[name]
+    sim.eps_to_start = [ep for ep in sim.eps_to_start if ep.name in group]
+
+    connections = {}
+    delays = []
+    for ep in sim.objects().values():
+        for conn in ep.in_connections:
+            connections[_connection_key(conn)] = conn
+            if conn.src.name not in group:
+                delays.append(conn.delay)
+        delays += [conn.delay for conn in ep.out_connections if conn.dest.name not in group]
+
+    sent = []
+    def forward(conn,time,data):
+        if hasattr(conn,'select'):
+            data = conn.select(data)
+        sent.append((time,)+_connection_key(conn)+(data,))
+    sim.forward_event = forward
+    coordinator.send(('ready',sim.time(),min(delays) if delays else None,group))
+
+    idle = None
+    while True:
+        message = coordinator.recv()
+        if message[0]=='run':
+            until,end,events = message[1:]
+            if idle is None:
+                idle = _Idle(end)
+                sim.enqueue_event(idle)
+            for event in events:
+                sim.enqueue_event(EPConnectionEvent(event[0],connections[event[1:4]],
+                                                    event[4],deep_copy=False))
+            sim.run(until-sim.time())
+            coordinator.send(('sent',sent[:]))
+            del sent[:]
+        elif message[0]=='finish':
+            collect = message[1]
+            activities = dict((name,ep.activity.copy()) for name,ep in sim.objects().items()
+                              if hasattr(ep,'activity'))
+            coordinator.send(('results',activities,collect(sim) if collect else None))
+            return
+
+
+def worker(address,authkey):
+    """
+    Connect to the coordinator (see run_distributed()) at address, and
+    simulate the group of EventProcessors it assigns.
+    """
+    coordinator = Client(address,authkey=authkey)
+    try:
+        _serve(coordinator)
+    except Exception:
+        coordinator.send(('error',traceback.format_exc()))
+        raise
+    finally:
+        coordinator.close()
+
+
+def _receive(conn,expected):
+    message = conn.recv()
+    if message[0]=='error':
+        raise RuntimeError("Worker failed:\n"+message[1])
+    assert message[0]==expected
+    return message[1:]
+
+
+def run_distributed(build,groups,duration,collect=None,address=('localhost',0),
+                    authkey=None,processes=None):
+    """
+    Simulate the model created by build for the given duration, with
+    each of the groups (lists of EventProcessor names) simulated by a
+    separate worker.
+
+    The coordinator listens for workers at address; the given number
+    of processes (by default one per group) are started as workers
+    on this machine, and any others must be started separately (see
+    worker()). The connections between groups must all have a
+    positive delay.
+
+    Returns a list with the results of each group's worker: a
+    dictionary of the activity of each of its EventProcessors, and
+    the result of calling collect(topo.sim) in the worker (if collect
+    is given; like build, it must be importable by the workers).
+    """
+    if authkey is None:
+        authkey = os.urandom(16).encode('hex')
+    if processes is None:
+        processes = len(groups)
+    listener = Listener(address,authkey=authkey)
+    env = dict(os.environ,PYTHONPATH=os.pathsep.join(
+        [topo._root_path]+[p for p in os.environ.get('PYTHONPATH','').split(os.pathsep) if p]))
+    command = "from topo.misc.distributed import worker; worker(%r,%r)"%(listener.address,authkey)
+    local_workers = [subprocess.Popen([sys.executable,'-c',command],env=env)
+                     for i in range(processes)]
+    workers = []
+    try:
+        for group in groups:
+            workers.append(listener.accept())
+            workers[-1].send((build,group,groups))
+        ready = [_receive(w,'ready') for w in workers]
+
+        start = ready[0][0]
+        delays = [delay for time,delay,group in ready if delay is not None]
+        owner = dict((name,rank) for rank,(time,delay,group) in enumerate(ready)
+                     for name in group)
+        lookahead = topo.sim.convert_to_time_type(min(delays) if delays else duration)
+        if lookahead<=0:
+            raise ValueError("Connections between groups must have a positive delay.")
+        stop = start+topo.sim.convert_to_time_type(duration)
+
+        # Run one lookahead at a time, passing on the events sent
+        # during each window at the start of the next
+        time = start
+        events = [[] for w in workers]
+        while time<stop:
+            time = min(time+lookahead,stop)
+            for w,e in zip(workers,events):
+                w.send(('run',time,stop+lookahead,e))
+            events = [[] for w in workers]
+            for w in workers:
+                for event in _receive(w,'sent')[0]:
+                    events[owner[event[2]]].append(event)
+
+        for w in workers:
+            w.send(('finish',collect))
+        return [_receive(w,'results') for w in workers]
+    finally:
+        for w in workers:
+            w.close()
+        listener.close()
+        for p in local_workers:
+            p.wait()
@@ -22,9 +22,10 @@ function names to be overwritten, as in these simple examples:
 In this file, inline() is overwritten to call inline_weave() if Weave
 is available.  If Weave is not available, inline() will raise a
 NotImplementedError exception.  For a program to be usable without
-Weave, just test inlinec.optimized after defining each optimized
-component, replacing it with a non-optimized equivalent if
-inlinec.optimized is False.
+Weave, just call provide_unoptimized_equivalent() after defining each
+optimized component, which replaces it with a non-optimized equivalent
+if inlinec.optimized is False, or if its own code later turns out not
+to compile (or load).
 
 For more information on weave, see:
 http://old.scipy.org/documentation/weave/weaveusersguide.html
@@ -46,7 +47,10 @@ bypassing the GIL.
 """
 
 import collections
+import functools
+import inspect
 import os
+import threading
 from copy import copy
 
 # If import_weave is not defined, or is set to True, will attempt to
@@ -73,17 +77,36 @@ c_decorators = collections.defaultdict(lambda:'')
 # Elver's report at http://homepages.inf.ed.ac.uk/s0787712/stuff/melver_project-report.pdf.
 openmp_threads = __main__.__dict__.get('openmp_threads',False)
 
+# Directory holding kernels compiled in advance by
+# topo.misc.precompile. Weave also looks for compiled code there, so
+# that processes on machines without a compiler (or sharing one
+# installation) can still use the optimized components without
+# compiling anything. The directory is only read: code compiled at
+# run time goes to the usual per-user catalog (below). Set
+# precompiled_kernels in the main namespace before importing this
+# file to use a different directory.
+precompiled_kernels = __main__.__dict__.get('precompiled_kernels',os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'optimized','kernels'))
+
+# Code compiled to check that weave works (below).
+compilation_test_code = 'double x=1.0;'
+
 # Variable that will be used to report whether weave was successfully
 # imported (below).
 weave_imported = False
 
 # Variable that will be used to report whether simple compilation test
-# was successful.
-compiled = False
+# was successful; None until the test is run, by the first optimized
+# component to be used (see compilation_works()).
+compiled = None
 
 def inline(*params,**nparams): raise NotImplementedError
 
 
+class CompilationError(Exception):
+    """Raised by inline() when Weave cannot compile or load the given code."""
+
+
 
 ##########
 # Windows: hack to allow weave to work when a user name contains a
@@ -116,6 +139,14 @@ try:
 
         weave_imported = True
 
+        # Weave writes newly compiled code to the first writable
+        # catalog on its search path, so the per-user catalog is put
+        # before the precompiled kernels, which are then only searched
+        if os.path.isdir(precompiled_kernels):
+            os.environ['PYTHONCOMPILED'] = os.pathsep.join(
+                [p for p in os.environ.get('PYTHONCOMPILED','').split(os.pathsep) if p]+
+                [weave.catalog.default_dir(),precompiled_kernels])
+
     # Default parameters to add to the inline_weave() call.
     inline_named_params = {
         'extra_compile_args':['-O2','-Wno-unused-variable -fomit-frame-pointer','-funroll-loops'],
@@ -133,10 +164,23 @@ try:
         inline_named_params['extra_link_args'].append('-fopenmp')
 
 
-    def inline_weave(*params,**nparams):
+    # Errors from compiling or loading code (distutils reports some
+    # build errors by exiting)
+    from distutils.errors import CCompilerError, DistutilsError
+    compilation_errors = (CCompilerError,DistutilsError,ImportError,SystemExit)
+
+    def _inline_weave(*params,**nparams):
         named_params = copy(inline_named_params) # Make copy of defaults.
         named_params.update(nparams)             # Add newly passed named parameters.
-        weave.inline(*params,**named_params)
+        try:
+            weave.inline(*params,**named_params)
+        except compilation_errors, e:
+            raise CompilationError(str(e))
+
+    def inline_weave(*params,**nparams):
+        if not compilation_works():
+            raise CompilationError("Weave is unable to compile code.")
+        _inline_weave(*params,**nparams)
 
     # Overwrites stub definition with full Weave definition
     inline = inline_weave # pyflakes:ignore (try/except import)
@@ -147,21 +191,76 @@ except ImportError:
     print 'Caution: Unable to import Weave.  Will use non-optimized versions of most components.'
 
 
-if weave_imported:
-    import random
-    try:
-        # to force recompilation each time
-        inline('double x=%s;'%random.random())
-        compiled = True
-    except Exception, e:
-        print "Caution: Unable to use Weave to compile: \"%s\". Will use non-optimized versions of most components."%str(e)
-
 # Flag available for all to use to test whether to use the inline
-# versions or not.
-optimized = weave_imported and compiled
+# versions or not. Becomes False if the compilation test fails.
+optimized = weave_imported
+
+_compilation_lock = threading.Lock()
+
+def compilation_works():
+    """
+    Return whether weave can compile code, compiling the test code the
+    first time this is called.
+
+    This is done only when the first optimized component is run, so
+    that processes not using any (or using only kernels already
+    compiled) start without running the compiler. The test code is
+    always the same, so that weave afterwards just loads it from its
+    catalog.
+    """
+    global compiled, optimized
+    if not weave_imported:
+        return False
+    with _compilation_lock:
+        if compiled is None:
+            try:
+                _inline_weave(compilation_test_code)
+                compiled = True
+            except Exception, e:
+                compiled = optimized = False
+                print "Caution: Unable to use Weave to compile: \"%s\". Will use non-optimized versions of most components."%str(e)
+    return compiled
 
 warn_for_each_unoptimized_component = False
 
+# All optimized components, as name: (optimized, unoptimized), where
+# name is module.optimized_name; used by topo.misc.precompile to find
+# the kernels to compile.
+optimized_components = collections.OrderedDict()
+
+# Names of the optimized components whose code could not be compiled
+# or loaded, and which have been replaced by their unoptimized
+# equivalents.
+unavailable_components = set()
+
+
+def _with_fallback(name, optimized_fn, unoptimized_fn, method=False):
+    """
+    Return a function calling optimized_fn, or unoptimized_fn instead
+    once the code of the component with the given name has failed to
+    compile or load.
+
+    For a method, the attributes of the instance are restored before
+    calling unoptimized_fn, so that it starts from the same state as
+    optimized_fn did (for instance, before a learning function's
+    traces were updated).
+    """
+    @functools.wraps(optimized_fn)
+    def component(*args,**kw):
+        if name not in unavailable_components:
+            state = dict(args[0].__dict__) if method else None
+            try:
+                return optimized_fn(*args,**kw)
+            except CompilationError, e:
+                unavailable_components.add(name)
+                print 'Caution: Unable to compile %s: "%s". Will use its unoptimized equivalent instead.' \
+                      % (name, str(e))
+                if method:
+                    args[0].__dict__.clear()
+                    args[0].__dict__.update(state)
+        return unoptimized_fn(*args,**kw)
+    return component
+
 
 # JABALERT: I can't see any reason why this function accepts names rather
 # than the more pythonic option of accepting objects, from which names
@@ -186,12 +285,31 @@ def provide_unoptimized_equivalent(optimized_name, unoptimized_name, local_dict)
       if not optimized:
         sort_opt = sort
         print 'module: Inline-optimized components not available; using sort instead of sort_opt.'
+
+    Otherwise, the optimized component switches to the unoptimized one
+    if its code turns out not to compile or load when it is first run
+    (e.g. on a machine without a compiler, for a kernel missing from
+    the precompiled_kernels). For a class, this applies to each method
+    (other than __init__) that it defines and the unoptimized class
+    also has, which then runs on the same instance.
     """
+    name = local_dict['__name__']+'.'+optimized_name
+    optimized_component = local_dict[optimized_name]
+    unoptimized_component = local_dict[unoptimized_name]
+    optimized_components[name] = (optimized_component,unoptimized_component)
     if not optimized:
-        local_dict[optimized_name] = local_dict[unoptimized_name]
+        local_dict[optimized_name] = unoptimized_component
         if warn_for_each_unoptimized_component:
             print '%s: Inline-optimized components not available; using %s instead of %s.' \
                   % (local_dict['__name__'], optimized_name, unoptimized_name)
+    elif isinstance(optimized_component,type):
+        for attr,value in optimized_component.__dict__.items():
+            if inspect.isfunction(value) and attr!='__init__' and hasattr(unoptimized_component,attr):
+                unoptimized_method = getattr(unoptimized_component,attr)
+                setattr(optimized_component,attr,_with_fallback(
+                    name,value,getattr(unoptimized_method,'im_func',unoptimized_method),method=True))
+    else:
+        local_dict[optimized_name] = _with_fallback(name,optimized_component,unoptimized_component)
 
 if not optimized and not warn_for_each_unoptimized_component:
     print "Note: Inline-optimized components are currently disabled; see topo.misc.inlinec"
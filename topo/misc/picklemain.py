@@ -12,6 +12,8 @@ from StringIO import StringIO
 
 import copy
 
+from topo.misc.util import LazyModule
+
 def _name_is_main(obj):
     # CEBALERT: see IPython hack in commandline.py
     return obj.__module__ == "__main__" or obj.__module__ == "__mynamespace__"
@@ -51,6 +53,7 @@ class PickleMain(object):
         self.pickler.dispatch[new.classobj] = save_classobj
         self.pickler.dispatch[new.instancemethod] = save_instancemethod
         self.pickler.dispatch[new.module] = save_module
+        self.pickler.dispatch[LazyModule] = save_module
         self.pickler.dispatch[type] = save_type
 
         # CB: maybe this should be registered from elsewhere
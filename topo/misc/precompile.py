@@ -0,0 +1,147 @@
+"""
+Compile all of the weave-optimized components in advance.
+
+Normally weave compiles the C code of each optimized (_opt) component
+the first time it runs, so every process started on a new machine or
+container pays the compilation cost, and needs a working compiler.
+Running
+
+  ./topographica -c "from topo.misc.precompile import precompile; precompile()"
+
+once (e.g. when installing Topographica) instead compiles every
+component registered with inlinec.provide_unoptimized_equivalent into
+the directory inlinec.precompiled_kernels (topo/optimized/kernels by
+default). Later processes load the compiled kernels from there
+directly, so worker nodes need no compiler; any component whose
+kernel cannot be compiled or loaded there (e.g. because it was
+precompiled with other settings) switches to its unoptimized
+equivalent when first run. Code compiled at run time is stored in
+the per-user weave catalog, never in inlinec.precompiled_kernels.
+
+Weave compiles a separate kernel for each combination of argument
+types, and the code depends on settings such as openmp_threads, so
+the kernels should be precompiled with the same settings (and the
+same array types) as the simulations that will use them.
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy
+
+import param
+from holoviews import BoundingBox
+import imagen
+
+from topo.misc import inlinec
+
+
+# Modules defining optimized components
+OPTIMIZED_MODULES = ['topo.responsefn.optimized',
+                     'topo.learningfn.optimized',
+                     'topo.transferfn.optimized',
+                     'topo.sheet.optimized',
+                     'topo.misc.color']
+
+
+
+def _projections(n=2,seed=0):
+    """Return n small CFProjections between two new sheets, with random activity."""
+    from topo.base.simulation import Simulation
+    from topo.base.cf import CFSheet, CFProjection
+
+    sim = Simulation()
+    rs = numpy.random.RandomState(seed)
+    for name in ('Src','Dest'):
+        sim[name] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        sim[name].activity[:] = rs.uniform(size=sim[name].activity.shape)
+    projs = [sim.connect('Src','Dest',name='Precompile%d'%i,connection_type=CFProjection,
+                         nominal_bounds_template=BoundingBox(radius=0.2),
+                         weights_generator=imagen.Constant(),learning_rate=1.0,
+                         apply_output_fns_init=False)
+             for i in range(n)]
+    for proj in projs:
+        proj.input_buffer = proj.src.activity
+    return projs
+
+
+def _run(name,component):
+    """
+    Run the component registered under the given name once on
+    synthetic data, so that weave compiles its code. Returns False if
+    the component is not of a type that can be run here.
+    """
+    from topo.base.cf import CFPResponseFn, CFPLearningFn, CFPOutputFn
+    from topo.base.projection import NeighborhoodMask
+
+    if isinstance(component,type):
+        proj = _projections(1)[0]
+        if issubclass(component,CFPResponseFn):
+            proj.response_fn = component()
+            proj.activate(proj.src.activity)
+        elif issubclass(component,CFPLearningFn):
+            proj.learning_fn = component()
+            proj.learn()
+        elif issubclass(component,CFPOutputFn):
+            proj.weights_output_fns = [component()]
+            proj.apply_learn_output_fns()
+        elif issubclass(component,NeighborhoodMask):
+            component(sheet=proj.dest).calculate()
+        else:
+            return False
+    elif name.endswith('.compute_joint_norm_totals_opt'):
+        for active_units_mask in (True,False):
+            component(_projections(2),active_units_mask)
+    elif name.endswith(('._rgb_to_hsv_array_opt','._hsv_to_rgb_array_opt')):
+        component(numpy.random.RandomState(0).uniform(size=(4,4,3)))
+    else:
+        return False
+    return True
+
+
+def precompile(path=None):
+    """
+    Compile every optimized component into path (by default
+    inlinec.precompiled_kernels), returning an OrderedDict of each
+    component's name and whether it was 'compiled', 'skipped'
+    (because it has no code of its own, e.g. a sheet built from other
+    optimized components) or 'failed'.
+    """
+    if not inlinec.weave_imported:
+        raise ImportError("Precompiling the optimized components requires weave.")
+
+    path = os.path.abspath(path or inlinec.precompiled_kernels)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    # Weave stores new compiled code in the first writable directory
+    # of PYTHONCOMPILED
+    original_path = os.environ.get('PYTHONCOMPILED')
+    os.environ['PYTHONCOMPILED'] = path
+    try:
+        for module in OPTIMIZED_MODULES:
+            __import__(module)
+        inlinec.inline(inlinec.compilation_test_code)
+
+        results = OrderedDict()
+        for name,(component,unoptimized) in inlinec.optimized_components.items():
+            try:
+                if not _run(name,component):
+                    results[name] = 'skipped'
+                # Classes switch to their unoptimized methods instead of raising
+                elif name in inlinec.unavailable_components:
+                    results[name] = 'failed'
+                else:
+                    results[name] = 'compiled'
+            except Exception as e:
+                results[name] = 'failed'
+                param.main.warning("Unable to compile %s: %s"%(name,e))
+            print "%-55s %s"%(name,results[name])
+    finally:
+        if original_path is None:
+            del os.environ['PYTHONCOMPILED']
+        else:
+            os.environ['PYTHONCOMPILED'] = original_path
+
+    print "Precompiled kernels are in %s"%path
+    return results
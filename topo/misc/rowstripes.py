@@ -0,0 +1,267 @@
+"""
+Splitting one large CFSheet into horizontal stripes.
+
+A single sheet with large lateral projections (e.g. V1 at a high
+cortex_density) can be too much for one process. decompose_rows()
+replaces such a sheet with a number of stripe sheets, each holding
+only some of the rows of units (and hence only those units' CFs), so
+that the stripes can be simulated by different workers with
+topo.misc.distributed:
+
+  from topo.misc.distributed import run_distributed
+  from topo.misc.rowstripes import decompose_rows, stripe_names, gather_rows
+
+  def build():
+      ...                    # create the model as usual, then
+      decompose_rows('V1',4)
+
+  results = run_distributed(build,[['Retina','LGNOn','LGNOff']]+
+                                  [[name] for name in stripe_names('V1',4)],10.0)
+  activity = gather_rows('V1',results)
+
+For each stripe and each sheet projecting to the original sheet
+(including the sheet itself, for lateral projections), a HaloSheet
+collects just the rows of the source's activity that the stripe's CFs
+can see, and the stripe's projections take their input from the halo
+instead of from the source. Over each settling step the stripes thus
+exchange only the halo rows of their lateral activity, and receive
+only the rows of afferent input they need. The halos are simulated by
+the worker of their stripe.
+
+Because the stripes use the original sheet's CFs, each seeing exactly
+the same input as before, the decomposed model
+computes the same activity as the original one, provided that:
+
+ - the sheet's output_fns work on each unit independently (e.g.
+   HomeostaticResponse, but not a normalization over the sheet);
+ - the sheet has no outgoing connections other than its lateral
+   projections (read its activity with gather_rows() instead);
+ - all projections from any one source to the sheet have the same
+   delay; and
+ - the model has not yet been run.
+
+Known restriction: every worker's build() still creates the whole
+original sheet and all of its CFs before decompose_rows() is called,
+so that the weights drawn from the (seeded) weights_generator are the
+same as in a single process. Only afterwards are the other stripes'
+CFs dropped. The peak memory and the CF creation time of each worker
+are therefore those of the undecomposed model; the decomposition
+reduces only the memory held, and the work done, while running. A
+sheet too large to be built at all in one process cannot be split
+this way.
+"""
+
+import copy
+
+import numpy
+
+import param
+from holoviews import BoundingBox
+
+import topo
+from topo.base.sheet import Sheet
+from topo.base.simulation import EPConnection
+from topo.base.cf import CFProjection
+from topo.misc import distributed
+
+
+
+class HaloSheet(Sheet):
+    """
+    Sheet assembling the rows of another sheet's activity needed by
+    one stripe, from the RowConnections coming in from that sheet (or
+    from each of its stripes).
+
+    Whenever any input has arrived, the assembled activity is sent out
+    once all events for the current time have been processed.
+    """
+
+    src_ports=['Activity']
+
+    group_with = param.String(default=None,doc="""
+        Name of the stripe using this halo, which is simulated by the
+        same worker (see topo.misc.distributed).""")
+
+    def __init__(self,**params):
+        super(HaloSheet,self).__init__(**params)
+        self.new_input = False
+
+
+    def input_event(self,conn,data):
+        data = conn.select(data)
+        self.activity[conn.offset:conn.offset+len(data)] = data
+        self.new_input = True
+
+
+    def process_current_time(self):
+        if self.new_input:
+            self.new_input = False
+            self.send_output(src_port='Activity',data=self.activity)
+
+
+
+class RowConnection(EPConnection):
+    """
+    Connection carrying only some rows of the source's activity, to
+    the given offset in a HaloSheet's activity.
+    """
+
+    rows = param.NumericTuple(default=(0,0),length=2,doc="""
+        The first and (one past the) last rows of the activity to send.""")
+
+    offset = param.Integer(default=0,bounds=(0,None),doc="""
+        The row of the destination's activity where the first row is placed.""")
+
+    def select(self,data):
+        """
+        Return the rows to be sent; data that has already been
+        selected (which is shorter than the source) is returned as it is.
+        """
+        start,stop = self.rows
+        return data[start:stop] if len(data)>stop-start else data
+
+
+
+def stripe_names(name,n):
+    """Return the names of the n stripes of the sheet with the given name."""
+    return ['%sStripe%d'%(name,i) for i in range(n)]
+
+
+def _row_bounds(sheet,start,stop):
+    """Return the BoundingBox of the given rows of the sheet."""
+    l,b,r,t = sheet.lbrt
+    return BoundingBox(points=((l,t-stop/sheet.ydensity),(r,t-start/sheet.ydensity)))
+
+
+def _copied_params(obj,exclude,objects):
+    """
+    Return deep copies of obj's parameter values, other than those
+    named in exclude. References to any of the given objects are
+    replaced with None.
+    """
+    memo = dict((id(o),None) for o in objects)
+    return dict((k,copy.deepcopy(v,memo)) for k,v in obj.get_param_values()
+                if k not in exclude)
+
+
+def _rows_needed(proj,start,stop):
+    """Return the range of the source's rows seen by the CFs of the given rows of units."""
+    slices = [cf.input_sheet_slice for cf in proj.cfs[start:stop].flat if cf is not None]
+    return int(min(s[0] for s in slices)),int(max(s[1] for s in slices))
+
+
+def decompose_rows(name,n,sim=None):
+    """
+    Replace the CFSheet with the given name in sim (topo.sim by
+    default) with n stripes of (nearly) equal numbers of rows, named
+    as by stripe_names(), plus the HaloSheets feeding them (see the
+    module docstring).
+
+    When called while building the model in a worker of
+    topo.misc.distributed, only the stripes of that worker's group
+    get CFs.
+    """
+    if sim is None:
+        sim = topo.sim
+    sheet = sim[name]
+
+    projs = sheet.in_connections
+    for conn in projs:
+        if not isinstance(conn,CFProjection):
+            raise NotImplementedError("%s: only CFProjections can be decomposed, not %s."
+                                      %(name,conn.name))
+    for conn in sheet.out_connections:
+        if conn.dest is not sheet:
+            raise NotImplementedError("%s: cannot decompose a sheet projecting to "
+                                      "other sheets (%s)."%(name,conn.dest.name))
+    sources = []
+    for proj in projs:
+        if proj.src not in sources:
+            sources.append(proj.src)
+        if len(set(p.delay for p in projs if p.src is proj.src))>1:
+            raise ValueError("%s: projections from %s must all have the same delay."
+                             %(name,proj.src.name))
+
+    rows,cols = sheet.shape
+    if not 1<=n<=rows:
+        raise ValueError("%s has %d rows, so cannot be split into %d stripes."%(name,rows,n))
+    edges = [i*rows//n for i in range(n+1)]
+    names = stripe_names(name,n)
+    group = distributed.current_group
+    owned = [group is None or s in group for s in names]
+
+    # The stripes themselves
+    params = _copied_params(sheet,['name','nominal_bounds','nominal_density'],[sheet])
+    for i,stripe_name in enumerate(names):
+        sim[stripe_name] = type(sheet)(nominal_bounds=_row_bounds(sheet,edges[i],edges[i+1]),
+                                       nominal_density=sheet.xdensity,**copy.deepcopy(params))
+        if sim[stripe_name].shape!=(edges[i+1]-edges[i],cols):
+            raise ValueError("%s: stripe %d does not line up with the rows of the sheet."%(name,i))
+
+    # A halo of each source for each stripe, receiving the rows it
+    # needs from the source (or from each overlapping stripe)
+    halos = {}
+    for i,stripe_name in enumerate(names):
+        for src in sources:
+            from_src = [p for p in projs if p.src is src]
+            needed = [_rows_needed(p,edges[i],edges[i+1]) for p in from_src]
+            start,stop = min(r[0] for r in needed),max(r[1] for r in needed)
+            halo_name = stripe_name+src.name+'Halo'
+            sim[halo_name] = HaloSheet(nominal_bounds=_row_bounds(src,start,stop),
+                                       nominal_density=src.xdensity,group_with=stripe_name)
+            halos[i,src.name] = start,halo_name
+            if src is sheet:
+                senders = [(names[j],edges[j],edges[j+1]) for j in range(n)]
+            else:
+                senders = [(src.name,0,src.shape[0])]
+            for sender,first,last in senders:
+                if first<stop and start<last:
+                    sim.connect(sender,halo_name,connection_type=RowConnection,
+                                src_port='Activity',delay=from_src[0].delay,
+                                rows=(max(start,first)-first,min(stop,last)-first),
+                                offset=max(start,first)-start)
+
+    # Each stripe's projections, from its halos, in the original
+    # order, taking over the original CFs (whose slices are moved
+    # from the source to the halo)
+    for i,stripe_name in enumerate(names):
+        if not owned[i]:
+            continue
+        for proj in projs:
+            start,halo_name = halos[i,proj.src.name]
+            params = _copied_params(proj,['name','src','dest','delay','apply_output_fns_init'],
+                                    [sheet,proj.src])
+            stripe_proj = sim.connect(halo_name,stripe_name,connection_type=type(proj),
+                                      name=proj.name,delay=0.0,initialize_cfs=False,
+                                      apply_output_fns_init=False,**params)
+            # The templates depend on the size of the source
+            for attr in ('_slice_template','bounds_template','mask_template','n_units'):
+                setattr(stripe_proj,attr,getattr(proj,attr))
+            stripe_proj.cfs = proj.cfs[edges[i]:edges[i+1]].copy()
+            stripe_proj.flatcfs = list(stripe_proj.cfs.flat)
+            for cf in stripe_proj.flatcfs:
+                if cf is not None:
+                    cf.input_sheet_slice.translate(-start,0)
+
+    del sim[name]
+
+
+def gather_rows(name,activities=None):
+    """
+    Return the full activity of the decomposed sheet with the given
+    name, by stacking the activities of its stripes.
+
+    activities is a dictionary of the activity of each stripe, or the
+    results returned by run_distributed(); by default, the stripes'
+    current activities in topo.sim are used.
+    """
+    if activities is None:
+        activities = dict((k,ep.activity) for k,ep in topo.sim.objects().items())
+    elif isinstance(activities,list):
+        activities = dict(item for result in activities for item in result[0].items())
+    n = 0
+    while stripe_names(name,n+1)[-1] in activities:
+        n += 1
+    if n==0:
+        raise KeyError("No stripes of %s found."%name)
+    return numpy.vstack([activities[s] for s in stripe_names(name,n)])
@@ -286,9 +286,13 @@ def signabs(x):
     Split x into its sign and absolute value.
 
     Returns a tuple (sign(x),abs(x)).  Note: sign(0) = 1, unlike
-    numpy.sign.
+    numpy.sign.  If x is an array, the sign is returned as an array of
+    the same shape.
     """
 
+    if isinstance(x,numpy.ndarray):
+        return numpy.where(x<0,-1,1),abs(x)
+
     if x < 0:
         sgn = -1
     else:
@@ -386,7 +390,7 @@ class MultiFile(object):
 # Alternative module faking using import hooks (see
 # http://www.python.org/dev/peps/pep-0302/).
 # Based on http://orestis.gr/blog/2008/12/20/python-import-hooks/.
-import sys,imp
+import sys,imp,types
 class ModuleFaker(object):
     def load_module(self,name):
         if name not in sys.modules:
@@ -436,6 +440,28 @@ class gmpyImporter(ModuleImporter):
         return None
 
 
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module that is only imported when it is first
+    used.
+
+    E.g. after topo.command = LazyModule('topo.command'), getting or
+    setting any attribute of topo.command imports the real module
+    (which then replaces the placeholder in its parent package) and
+    acts on that instead. Importing the module explicitly works as
+    usual.
+    """
+    def _load(self):
+        __import__(self.__name__)
+        return sys.modules[self.__name__]
+
+    def __getattr__(self,name):
+        return getattr(self._load(),name)
+
+    def __setattr__(self,name,value):
+        setattr(self._load(),name,value)
+
+
 def unit_value(str):
     m = re.match(r'([^\d]*)(\d*\.?\d+)([^\d]*)', str)
     if m:
@@ -297,9 +297,9 @@ void bcm_fixed(double input_activity[], double output_activity[], int num_cfs,
 
 
 
-void trace_learning(double input_activity[], double traces[], int num_cfs,
-                    int icols, PyObject* cfs, double single_connection_learning_rate,
-                    PyObject* cf_type) {
+void trace_learning(double input_activity[], double traces[], double sheet_mask[],
+                    int num_cfs, int icols, PyObject* cfs,
+                    double single_connection_learning_rate, PyObject* cf_type) {
     DECLARE_SLOT_OFFSET(weights,cf_type);
     DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
     DECLARE_SLOT_OFFSET(mask,cf_type);
@@ -311,7 +311,7 @@ void trace_learning(double input_activity[], double traces[], int num_cfs,
     #pragma omp parallel for schedule(guided, 8)
     for (r=0; r<num_cfs; ++r) {
         double load = traces[r];
-        if (load != 0) {
+        if (load != 0 && sheet_mask[r] != 0) {
             load *= single_connection_learning_rate;
             PyObject *cf = PyList_GetItem(cfs,r);
 
@@ -324,7 +324,7 @@ void trace_learning(double input_activity[], double traces[], int num_cfs,
             double total = 0.0;
             int i, j;
 
-            // modify non-masked weights
+            // modify non-masked weights, with the decay term
             double *inpj = input_activity+icols*rr1+cc1;
             for (i=rr1; i<rr2; ++i) {
                 double *inpi = inpj;
@@ -332,8 +332,64 @@ void trace_learning(double input_activity[], double traces[], int num_cfs,
                     // The mask is floating point, so we have to
                     // use a robust comparison instead of testing
                     // against exactly 0.0.
+                    if (*(mask++) >= MASK_THRESHOLD) {
+                        *weights += load * (*inpi - *weights);
+                        total += fabs(*weights);
+                    }
+                    ++weights;
+                    ++inpi;
+                }
+                inpj += icols;
+            }
+            // store the sum of the cf's weights
+            LOOKUP_FROM_SLOT_OFFSET(double,_norm_total,cf);
+            _norm_total[0]=total;
+            LOOKUP_FROM_SLOT_OFFSET(int,_has_norm_total,cf);
+            _has_norm_total[0]=1;
+        }
+    }
+}
+
+
+void homeosynaptic(double input_activity[], double output_activity[],
+                   double activity_norm[], double sheet_mask[], int num_cfs,
+                   int icols, PyObject* cfs, double single_connection_learning_rate,
+                   PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+    DECLARE_SLOT_OFFSET(mask,cf_type);
+    DECLARE_SLOT_OFFSET(_norm_total,cf_type);
+    DECLARE_SLOT_OFFSET(_has_norm_total,cf_type);
+
+    int r;
+
+    // Unlike for Hebbian learning, the weights of inactive units
+    // change too (by the homeostatic scaling)
+    #pragma omp parallel for schedule(guided, 8)
+    for (r=0; r<num_cfs; ++r) {
+        if (sheet_mask[r] != 0) {
+            double load = output_activity[r]*single_connection_learning_rate;
+            double norm = activity_norm[r];
+
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+            LOOKUP_FROM_SLOT_OFFSET(float,mask,cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            double total = 0.0;
+            int i, j;
+
+            // modify non-masked weights
+            double *inpj = input_activity+icols*rr1+cc1;
+            for (i=rr1; i<rr2; ++i) {
+                double *inpi = inpj;
+                for (j=cc1; j<cc2; ++j) {
                     if (*(mask++) >= MASK_THRESHOLD) {
                         *weights += load * *inpi;
+                        *weights /= norm;
                         total += fabs(*weights);
                     }
                     ++weights;
@@ -351,6 +407,40 @@ void trace_learning(double input_activity[], double traces[], int num_cfs,
 }
 
 
+void outstar_hebbian(double input_activity[], double output_activity[],
+                     double sheet_mask[], double outstar_wsum[], int num_cfs,
+                     int icols, PyObject* cfs, double single_connection_learning_rate,
+                     PyObject* cf_type) {
+    DECLARE_SLOT_OFFSET(weights,cf_type);
+    DECLARE_SLOT_OFFSET(input_sheet_slice,cf_type);
+
+    int r, i, j;
+
+    hebbian(input_activity, output_activity, sheet_mask, num_cfs, icols, cfs,
+            single_connection_learning_rate, cf_type);
+
+    // The CFs overlap, so the outstar sum (indexed by position
+    // within the weights matrix) is computed serially
+    for (r=0; r<num_cfs; ++r) {
+        if (sheet_mask[r] != 0) {
+            PyObject *cf = PyList_GetItem(cfs,r);
+
+            LOOKUP_FROM_SLOT_OFFSET(float,weights,cf);
+            LOOKUP_FROM_SLOT_OFFSET(int,input_sheet_slice,cf);
+
+            UNPACK_FOUR_TUPLE(int,rr1,rr2,cc1,cc2,input_sheet_slice);
+
+            for (i=0; i<rr2-rr1; ++i) {
+                double *wsum = outstar_wsum+icols*i;
+                for (j=0; j<cc2-cc1; ++j) {
+                    *(wsum++) += *(weights++);
+                }
+            }
+        }
+    }
+}
+
+
 void divisive_normalize_l1(double sheet_mask[], double active_units_mask[],
                            PyObject* cfs, PyObject* cf_type, int num_cfs) {
     DECLARE_SLOT_OFFSET(weights,cf_type);
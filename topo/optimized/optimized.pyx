@@ -6,6 +6,7 @@ import param
 from topo.base.cf import CFPResponseFn, CFPLearningFn, CFPOutputFn, CFIter
 from topo.base.functionfamily import ResponseFn, DotProduct, LearningFn, Hebbian
 from topo.base.sheet import activity_type
+from topo.learningfn.projfn import HomeoSynaptic
 
 cdef extern from "optimized.h":
     void dot_product(double*, double*, np.float64_t, np.int64_t,
@@ -20,9 +21,15 @@ cdef extern from "optimized.h":
     void bcm_fixed(double*, double*, np.int64_t, np.int64_t,
                    cfs, np.float64_t, np.float64_t, cf_type)
 
-    void trace_learning(double*, double*, np.int64_t, np.int64_t, cfs,
+    void trace_learning(double*, double*, double*, np.int64_t, np.int64_t, cfs,
                         np.float64_t, cf_type)
 
+    void homeosynaptic(double*, double*, double*, double*, np.int64_t,
+                       np.int64_t, cfs, np.float64_t, cf_type)
+
+    void outstar_hebbian(double*, double*, double*, double*, np.int64_t,
+                         np.int64_t, cfs, np.float64_t, cf_type)
+
     void divisive_normalize_l1(double*, double*, cfs, cf_type,
                                np.int64_t)
 
@@ -81,6 +88,8 @@ class CFPRF_EuclideanDistance_cython(CFPResponseFn):
 
 class CFPLF_Hebbian_cython(CFPLearningFn):
 
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
     def __call__(self, iterator, np.ndarray[np.float64_t, ndim=2] input_activity,
                  np.ndarray[np.float64_t, ndim=2] output_activity,
                  np.float64_t learning_rate, **params):
@@ -159,12 +168,11 @@ class CFPLF_Trace_cython(CFPLearningFn):
                  np.float64_t learning_rate, **params):
 
         cdef np.float64_t single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
-        if single_connection_learning_rate==0:
-            return
 
         cfs = iterator.flatcfs
         cdef np.int64_t num_cfs = len(cfs)
         cf_type = iterator.cf_type
+        cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
 
         ##Initialise traces to zero if they don't already exist
         cdef np.int64_t orows = output_activity.shape[0]
@@ -174,13 +182,82 @@ class CFPLF_Trace_cython(CFPLearningFn):
             traces = np.zeros((orows, ocols), activity_type)
             self.traces = traces
 
-        self.traces = (self.trace_strength*output_activity)+((1-self.trace_strength)*self.traces)
+        # Like CFPLF_Trace, update the traces only of units in the sheet mask
+        self.traces = np.where(sheet_mask!=0,
+                               (self.trace_strength*output_activity)+((1-self.trace_strength)*self.traces),
+                               self.traces)
         traces = self.traces
 
+        if single_connection_learning_rate==0:
+            return
+
         cdef np.int64_t icols = input_activity.shape[1]
 
         trace_learning(<double*> input_activity.data, <double*> traces.data,
-                       num_cfs, icols, cfs, single_connection_learning_rate, cf_type)
+                       <double*> sheet_mask.data, num_cfs, icols, cfs,
+                       single_connection_learning_rate, cf_type)
+
+
+
+class HomeoSynaptic_cython(HomeoSynaptic):
+    """
+    Optimized version of HomeoSynaptic (with a Hebbian
+    single_cf_fn); see projfn.py for more info.
+    """
+
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    def __call__(self, iterator, np.ndarray[np.float64_t, ndim=2] input_activity,
+                 np.ndarray[np.float64_t, ndim=2] output_activity,
+                 np.float64_t learning_rate, **params):
+
+        cdef np.ndarray[np.float64_t, ndim=2] activity_norm = self._activity_norm(iterator,output_activity)
+        cdef np.float64_t single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+
+        cfs = iterator.flatcfs
+        cdef np.int64_t num_cfs = len(cfs)
+        cdef np.int64_t icols = input_activity.shape[1]
+        cf_type = iterator.cf_type
+
+        cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
+
+        homeosynaptic(<double*> input_activity.data, <double*> output_activity.data,
+                      <double*> activity_norm.data, <double*> sheet_mask.data,
+                      num_cfs, icols, cfs, single_connection_learning_rate, cf_type)
+
+        self._record_history(iterator)
+
+
+
+class CFPLF_OutstarHebbian_cython(CFPLearningFn):
+    """
+    Optimized version of CFPLF_OutstarHebbian (with a Hebbian
+    single_cf_fn); see projfn.py for more info.
+    """
+
+    single_cf_fn = param.ClassSelector(LearningFn,default=Hebbian(),readonly=True)
+
+    outstar_wsum = None
+
+    def __call__(self, iterator, np.ndarray[np.float64_t, ndim=2] input_activity,
+                 np.ndarray[np.float64_t, ndim=2] output_activity,
+                 np.float64_t learning_rate, **params):
+
+        cdef np.float64_t single_connection_learning_rate = self.constant_sum_connection_rate(iterator.proj_n_units,learning_rate)
+
+        cfs = iterator.flatcfs
+        cdef np.int64_t num_cfs = len(cfs)
+        cdef np.int64_t icols = input_activity.shape[1]
+        cf_type = iterator.cf_type
+
+        cdef np.ndarray[np.float64_t, ndim=2] sheet_mask = iterator.get_sheet_mask()
+        cdef np.ndarray[np.float64_t, ndim=2] outstar_wsum = np.zeros((input_activity.shape[0],icols))
+
+        outstar_hebbian(<double*> input_activity.data, <double*> output_activity.data,
+                        <double*> sheet_mask.data, <double*> outstar_wsum.data,
+                        num_cfs, icols, cfs, single_connection_learning_rate, cf_type)
+
+        self.outstar_wsum = outstar_wsum
 
 
 
@@ -20,9 +20,9 @@ from topo.base.boundingregion import BoundingBox
 from topo.base.sheet import activity_type
 from topo.base.sheetcoords import Slice
 from topo.base.cf import CFProjection,ConnectionField,\
-     CFPLearningFn,CFPLF_Identity,CFPOutputFn,CFIter,ResizableCFProjection
+     CFPLearningFn,CFPLF_Identity,CFPLF_Plugin,CFPOutputFn,CFIter,ResizableCFProjection
 from topo.base.patterngenerator import PatternGenerator,Constant
-from topo.base.functionfamily import CoordinateMapperFn,IdentityMF
+from topo.base.functionfamily import CoordinateMapperFn,IdentityMF,DotProduct,Hebbian
 from topo.misc.util import rowcol2idx
 from topo.transferfn import TransferFn,IdentityTF
 from topo.learningfn import LearningFn,IdentityLF
@@ -173,6 +173,12 @@ class SharedWeightCFProjection(CFProjection):
         pass
 
 
+    @property
+    def shared_cf(self):
+        """The ConnectionField holding the weights shared by all units."""
+        return self.__sharedcf
+
+
     def n_bytes(self):
         return self.activity.nbytes + self.__sharedcf.weights.nbytes + \
                sum([cf.input_sheet_slice.nbytes
@@ -180,6 +186,219 @@ class SharedWeightCFProjection(CFProjection):
 
 
 
+def _correlate_valid(a,b,fft=False):
+    """
+    Return the 'valid' 2D correlation of array a with the smaller
+    array b, i.e. out[i,j] = sum(b*a[i:i+b_rows,j:j+b_cols]).
+
+    The direct method sums shifted copies of a weighted by each
+    element of b if b is smaller than the output, and otherwise
+    takes the tensor product of b with a strided view of all the
+    windows of a; fft=True computes the correlation from the product
+    of the Fourier transforms instead.
+    """
+    (a_rows,a_cols),(b_rows,b_cols) = a.shape,b.shape
+    out_rows,out_cols = a_rows-b_rows+1,a_cols-b_cols+1
+
+    if fft:
+        shape = (a_rows+b_rows-1,a_cols+b_cols-1)
+        full = np.fft.irfft2(np.fft.rfft2(a,shape)*np.fft.rfft2(b[::-1,::-1],shape),shape)
+        return full[b_rows-1:a_rows,b_cols-1:a_cols]
+
+    if b.size <= out_rows*out_cols:
+        out = np.zeros((out_rows,out_cols),dtype=np.float64)
+        for (m,n),w in np.ndenumerate(b):
+            if w != 0:
+                out += w*a[m:m+out_rows,n:n+out_cols]
+        return out
+
+    windows = np.lib.stride_tricks.as_strided(a,shape=(out_rows,out_cols,b_rows,b_cols),
+                                              strides=a.strides+a.strides)
+    return np.tensordot(windows,b,axes=((2,3),(0,1)))
+
+
+
+class ConvolutionCFProjection(SharedWeightCFProjection):
+    """
+    A SharedWeightCFProjection computed as a single 2D correlation.
+
+    Instead of taking the dot product of each CF with its part of the
+    input, the input activity is correlated with the shared weights
+    as a whole (directly, or via FFT for large kernels), and each
+    unit's response is read off at the location of its CF center.
+    The input is zero-padded, so CFs cropped at the edges of the
+    input sheet give the same response as the cropped dot product.
+    The response_fn is therefore only used to check that it computes
+    a dot product (i.e. that its single_cf_fn is a DotProduct).
+
+    Unlike SharedWeightCFProjection, learning is supported: the
+    Hebbian updates of all the units (each unit's activity times its
+    part of the input) are accumulated into the shared weights, using
+    the same per-connection learning rate as a CFProjection, and the
+    single_cf_fn of each of the weights_output_fns is then applied
+    once to the shared weights.  Only Hebbian learning is performed,
+    so the learning_fn must be a Hebbian one (with a Hebbian
+    single_cf_fn), or CFPLF_Identity to disable learning.
+
+    Since only the shared CF and the CF centers are needed, the
+    per-unit SharedWeightCFs are not created with the projection, but
+    only if the cfs (or flatcfs) are accessed, e.g. to plot them.
+    """
+
+    learning_fn = param.ClassSelector(CFPLearningFn,default=CFPLF_Plugin(),doc="""
+        Function for computing changes to the weights; must apply
+        Hebbian learning, or be CFPLF_Identity for no learning.""")
+
+    convolution_method = param.ObjectSelector(default='auto',
+        objects=['auto','direct','fft'],doc="""
+        How to compute the correlation: 'direct' sums shifted copies
+        of the input, 'fft' multiplies Fourier transforms, and 'auto'
+        uses 'fft' for kernels with more than fft_threshold weights.""")
+
+    fft_threshold = param.Integer(default=100,bounds=(0,None),doc="""
+        Number of weights above which the 'auto' convolution_method
+        uses FFT.""")
+
+    _conv_rows = None
+    _conv_cols = None
+
+    _cfs = None
+    _flatcfs = None
+
+    def __init__(self,**params):
+        super(ConvolutionCFProjection,self).__init__(**params)
+
+        # Index of each unit's CF center in the correlation of the
+        # input zero-padded by the kernel size less one on each side.
+        # The shared CF is centered on the middle unit of the src
+        # sheet, which fixes the position of the kernel's center.
+        sheet_rows,sheet_cols = self.src.shape
+        r1,r2,c1,c2 = self.shared_cf.input_sheet_slice
+        kernel_rows,kernel_cols = self.shared_cf.weights.shape
+        X,Y = self._generate_coords()
+        cf_rows,cf_cols = self.src.sheet2matrixidx(X,Y)
+        self._conv_rows = cf_rows - (sheet_rows/2 - r1) + kernel_rows-1
+        self._conv_cols = cf_cols - (sheet_cols/2 - c1) + kernel_cols-1
+
+
+    def _create_cfs(self):
+        # Created on first access instead (see _get_cfs)
+        self._cfs = self._flatcfs = None
+
+
+    def _get_cfs(self):
+        if self._cfs is None:
+            super(ConvolutionCFProjection,self)._create_cfs()
+        return self._cfs
+
+    def _set_cfs(self,cfs):
+        self._cfs = cfs
+
+    cfs = property(_get_cfs,_set_cfs,doc="""
+        The SharedWeightCF of each unit, created when first accessed.""")
+
+
+    def _get_flatcfs(self):
+        self._get_cfs()
+        return self._flatcfs
+
+    def _set_flatcfs(self,flatcfs):
+        self._flatcfs = flatcfs
+
+    flatcfs = property(_get_flatcfs,_set_flatcfs)
+
+
+    def _cleanup(self):
+        if self._cfs is not None:
+            super(ConvolutionCFProjection,self)._cleanup()
+
+
+    def n_bytes(self):
+        return self.activity.nbytes + self.shared_cf.weights.nbytes + \
+               self._conv_rows.nbytes + self._conv_cols.nbytes
+
+
+    def n_conns(self):
+        # As for the SharedWeightCFs, each of which has the whole mask_template
+        return np.count_nonzero(self.dest.mask.data) * \
+               len(self.mask_template.ravel().nonzero()[0])
+
+
+    def _use_fft(self):
+        if self.convolution_method == 'auto':
+            return self.shared_cf.weights.size > self.fft_threshold
+        return self.convolution_method == 'fft'
+
+
+    def _padded_input(self,input_activity):
+        kernel_rows,kernel_cols = self.shared_cf.weights.shape
+        return np.pad(input_activity,((kernel_rows-1,kernel_rows-1),
+                                      (kernel_cols-1,kernel_cols-1)),'constant')
+
+
+    def activate(self,input_activity):
+        """Activate by correlating the input with the shared weights."""
+        if not isinstance(getattr(self.response_fn,'single_cf_fn',None),DotProduct):
+            raise ValueError("%s: ConvolutionCFProjection only computes a dot product, "
+                             "so cannot use response_fn %s."%(self.name,self.response_fn))
+        if self.input_fns:
+            input_activity = input_activity.copy()
+        for iaf in self.input_fns:
+            iaf(input_activity)
+        self.input_buffer = input_activity
+
+        response = _correlate_valid(self._padded_input(input_activity),
+                                    self.shared_cf.weights,self._use_fft())
+        self.activity[:] = response[self._conv_rows,self._conv_cols]
+        self.activity *= self.strength
+        for of in self.output_fns:
+            of(self.activity)
+
+
+    def learn(self):
+        """
+        Accumulate the Hebbian updates for every unit into the shared
+        weights.
+        """
+        single_cf_fn = getattr(self.learning_fn,'single_cf_fn',None)
+        if not isinstance(single_cf_fn,(Hebbian,IdentityLF)):
+            raise ValueError("%s: ConvolutionCFProjection only performs Hebbian learning, "
+                             "so cannot use learning_fn %s."%(self.name,self.learning_fn))
+        if (self.input_buffer is None or self.learning_rate == 0 or
+            isinstance(single_cf_fn,IdentityLF)):
+            return
+
+        padded = self._padded_input(self.input_buffer)
+        # Activity placed at the CF centers; np.add.at sums the
+        # activities of units sharing a center (when the dest sheet
+        # is denser than the src sheet).
+        centers = np.zeros((padded.shape[0]-self.shared_cf.weights.shape[0]+1,
+                            padded.shape[1]-self.shared_cf.weights.shape[1]+1))
+        np.add.at(centers,(self._conv_rows,self._conv_cols),self.dest.activity)
+
+        weights = self.shared_cf.weights
+        single_connection_learning_rate = self.learning_fn.constant_sum_connection_rate(
+            self.n_units,self.learning_rate)
+        weights += single_connection_learning_rate * \
+                   _correlate_valid(padded,centers,self._use_fft())
+        weights *= self.shared_cf.mask
+
+
+    def apply_learn_output_fns(self,active_units_mask=True):
+        """
+        Apply the single_cf_fn of each of the weights_output_fns to the
+        shared weights.
+        """
+        # Called by CFProjection.__init__ before the shared CF exists;
+        # its output_fns have already been applied on creation.
+        if self._conv_rows is None:
+            return
+        for wof in self.weights_output_fns:
+            if type(wof.single_cf_fn) is not IdentityTF:
+                wof.single_cf_fn(self.shared_cf.weights)
+
+
+
 
 
 # JABALERT: Can this be replaced with a CFProjection with a Hysteresis output_fn?
@@ -338,31 +557,21 @@ class OneToOneProjection(Projection):
                                               ydensity=self.dest.ydensity)
 
 
-        # JPALERT: CoordMapperFns should really be made to take
-        # matrices of x/y points and apply their mapping to all.  This
-        # could give great speedups, esp for AffineTransform mappings,
-        # which can be applied to many points with a single matrix
-        # multiplication.
-        srccoords = [self.coord_mapper(x,y)
-                     for y in reversed(self.dest.sheet_rows())
-                     for x in self.dest.sheet_cols()]
-
-        self.src_idxs = np.array([rowcol2idx(r,c,self.src.activity.shape)
-                               for r,c in (self.src.sheet2matrixidx(u,v)
-                                           for u,v in srccoords)])
+        # The mapped src location of every dest unit, computed for
+        # all the units at once when the coord_mapper is vectorized.
+        X,Y = self.dest.sheetcoords_of_idx_grid()
+        src_x,src_y = self.coord_mapper.map_arrays(X,Y)
+        src_r,src_c = self.src.sheet2matrixidx(src_x.ravel(),src_y.ravel())
 
         # dest_idxs contains the indices of the dest units whose weights project
         # in bounds on the src sheet.
         src_rows,src_cols = self.src.activity.shape
-        def in_bounds(x,y):
-            r,c = self.src.sheet2matrixidx(x,y)
-            return (0 <= r < src_rows) and (0 <= c < src_cols)
-        destmask = [in_bounds(x,y) for x,y in srccoords]
+        destmask = (src_r>=0) & (src_r<src_rows) & (src_c>=0) & (src_c<src_cols)
 
         # The [0] is required because numpy.nonzero returns the
         # nonzero indices wrapped in a one-tuple.
         self.dest_idxs = np.nonzero(destmask)[0]
-        self.src_idxs = self.src_idxs.take(self.dest_idxs)
+        self.src_idxs = rowcol2idx(src_r,src_c,self.src.activity.shape).take(self.dest_idxs)
         assert len(self.dest_idxs) == len(self.src_idxs)
 
         self.activity = np.zeros(self.dest.shape,dtype=float)
@@ -19,6 +19,7 @@ from topo.base.boundingregion import BoundingBox  # pyflakes:ignore (API import)
 from topo.base.sheet import activity_type  # pyflakes:ignore (API import)
 
 import numpy
+from timeit import default_timer
 
 import topo
 
@@ -26,7 +27,7 @@ import param
 
 from topo.base.cf import CFIter
 from topo.base.projection import Projection
-from topo.base.simulation import FunctionEvent, PeriodicEventSequence, EPConnectionEvent
+from topo.base.simulation import FunctionEvent, PeriodicEventSequence, component_timings, tracer
 
 
 class ActivityCopy(Sheet):
@@ -151,17 +152,22 @@ class JointNormalizingCFSheet(CFSheet):
         If active_units_mask is True, only active units will have
         their weights normalized.
         """
+        timing = component_timings.enabled
         for key,projlist in self._grouped_in_projections('JointNormalize').items():
             if key == None:
                 normtype='Individually'
             else:
                 normtype='Jointly'
+                if timing: start = default_timer()
                 self.joint_norm_fn(projlist,active_units_mask)
+                if timing: component_timings.add(self,'joint_norm_fn',default_timer()-start)
 
             self.debug(normtype + " normalizing:")
 
             for p in projlist:
+                if timing: start = default_timer()
                 p.apply_learn_output_fns(active_units_mask=active_units_mask)
+                if timing: component_timings.add(p,'weights_output_fns',default_timer()-start)
                 self.debug('  %s',p.name)
 
 
@@ -171,9 +177,14 @@ class JointNormalizingCFSheet(CFSheet):
         call the output functions (jointly if necessary).
         """
         # Ask all projections to learn independently
+        timing = component_timings.enabled
         for proj in self.in_connections:
             if not isinstance(proj,Projection):
                 self.debug("Skipping non-Projection "+proj.name)
+            elif timing:
+                start = default_timer()
+                proj.learn()
+                component_timings.add(proj,'learning_fn',default_timer()-start)
             else:
                 proj.learn()
 
@@ -330,6 +341,9 @@ class SettlingCFSheet(JointNormalizingCFSheet):
         send it out on the default output port.
         """
         if self.new_input:
+            tracing = tracer.enabled
+            if tracing:
+                start = default_timer()
             self.new_input = False
 
             if self.activation_count == self.mask_init_time:
@@ -337,8 +351,8 @@ class SettlingCFSheet(JointNormalizingCFSheet):
 
             if self.tsettle == 0:
                 # Special case: behave just like a CFSheet
-                self.activate()
-                self.learn()
+                self._traced('activate',self.activate)
+                self._traced('learn',self.learn)
 
             elif self.activation_count == self.tsettle:
                 # Once we have been activated the required number of times
@@ -350,12 +364,15 @@ class SettlingCFSheet(JointNormalizingCFSheet):
                 self.activation_count = 0
                 self.new_iteration = True # used by input_event when it is called
                 if (self.plastic and not self.continuous_learning):
-                    self.learn()
+                    self._traced('learn',self.learn)
             else:
-                self.activate()
+                self._traced('activate',self.activate)
                 self.activation_count += 1
                 if (self.plastic and self.continuous_learning):
-                   self.learn()
+                   self._traced('learn',self.learn)
+
+            if tracing:
+                tracer.add(self,'process_current_time',self.simulation.time(),start)
 
 
     # print the weights of a unit
@@ -387,8 +404,7 @@ class SettlingCFSheet(JointNormalizingCFSheet):
                        continue
             self.verbose("Sending output on src_port %s via connection %s to %s",
                          src_port, conn.name, conn.dest.name)
-            e=EPConnectionEvent(self.simulation.convert_to_time_type(conn.delay)+self.simulation.time(),conn,data)
-            self.simulation.enqueue_event(e)
+            self.simulation.enqueue_connection_event(conn,data)
 
 
 
@@ -11,13 +11,21 @@ in Cython.
 #include <omp.h>
 #include <Eigen/Sparse>
 #include <vector>
+#include <algorithm>
 #define EIGEN_DONT_PARALLELIZE
 
 using Eigen::SparseMatrix;
 
+// Number of threads for a kernel; 0 selects the OpenMP default
+inline int omp_threads(int threads) {
+  return threads > 0 ? threads : omp_get_max_threads();
+}
+
 template <class T, int S=Eigen::ColMajor>
   class SparseMatrixExt:public SparseMatrix<T, S> {
   public:
+  std::vector<int> rowStart, rowCols, rowValues;
+
   SparseMatrixExt<T, S>():
 		SparseMatrix<T, S>(){
 		}
@@ -76,8 +84,8 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void DotProduct(unsigned int num_cfs, double strength, double* input, double* activity) {
-    #pragma omp parallel
+  void DotProduct(unsigned int num_cfs, double strength, double* input, double* activity, int threads=0) {
+    #pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k, j;
       #pragma omp for schedule(guided, 8)
@@ -93,9 +101,9 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void DotProduct_opt(unsigned int num_cfs, double strength, double* input, double* activity) {
+  void DotProduct_opt(unsigned int num_cfs, double strength, double* input, double* activity, int threads=0) {
     double epsilon = 0.000001;
-    #pragma omp parallel
+    #pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k, j;
 	  double src;
@@ -115,8 +123,8 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void Hebbian(double* src_act,double* dest_act, double* norm_total, const double lr) {
-	#pragma omp parallel
+  void Hebbian(double* src_act,double* dest_act, double* norm_total, const double lr, int threads=0) {
+	#pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k, y;
       #pragma omp for schedule(guided, 8)
@@ -130,9 +138,9 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void Hebbian_opt(double* src_act,double* dest_act, double* norm_total, const double lr) {
+  void Hebbian_opt(double* src_act,double* dest_act, double* norm_total, const double lr, int threads=0) {
 	double epsilon = 0.000001;
-	#pragma omp parallel
+	#pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k, y;
 	  double src, dest;
@@ -151,8 +159,87 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void CFWeightTotals(double* norm_total) {
-	#pragma omp parallel
+  void HebbianColumns(const int* cols, const int n, double* src_act, double* dest_act,
+					  double* norm_total, const double lr, int threads=0) {
+	//Only visits the listed columns; their weight totals are written
+	//into norm_total, leaving the other entries untouched
+	#pragma omp parallel num_threads(omp_threads(threads))
+	{
+	  int i, y;
+	  double dest, total;
+	  #pragma omp for schedule(guided, 8)
+	  for (i=0; i<n; ++i) {
+		y = cols[i];
+		dest = dest_act[y] * lr;
+		total = 0.0;
+		for (typename SparseMatrixExt<T>::InnerIterator it(*this,y); it; ++it) {
+		  it.valueRef() += dest * src_act[it.row()];
+		  total += it.value();
+		}
+		norm_total[y] = total;
+	  }
+	}
+  }
+
+  void DivisiveNormalizeL1Columns(const int* cols, const int n, double* norm_total, int threads=0) {
+	#pragma omp parallel num_threads(omp_threads(threads))
+	{
+	  int i;
+	  double factor;
+	  #pragma omp for schedule(guided, 8)
+	  for (i=0; i<n; ++i) {
+		factor = 1.0/norm_total[cols[i]];
+		for (typename SparseMatrixExt<T>::InnerIterator it(*this,cols[i]); it; ++it) {
+		  it.valueRef() *= factor;
+		}
+	  }
+	}
+  }
+
+  void buildRowIndex() {
+	//Row-major (CSR) index of the column-major storage, holding the
+	//column and the position in the value array of each nonzero.
+	//Stays valid until the sparsity structure changes.
+	rowStart.assign(this->rows()+1,0);
+	for (int k=0; k<this->outerSize(); ++k) {
+	  for (typename SparseMatrixExt<T>::InnerIterator it(*this,k); it; ++it) {
+		rowStart[it.row()+1]++;
+	  }
+	}
+	for (int i=0; i<this->rows(); ++i) {
+	  rowStart[i+1] += rowStart[i];
+	}
+	std::vector<int> next(rowStart.begin(),rowStart.end()-1);
+	rowCols.resize(rowStart.back());
+	rowValues.resize(rowStart.back());
+	int pos;
+	for (int k=0; k<this->outerSize(); ++k) {
+	  for (typename SparseMatrixExt<T>::InnerIterator it(*this,k); it; ++it) {
+		pos = next[it.row()]++;
+		rowCols[pos] = k;
+		rowValues[pos] = &it.valueRef() - this->valuePtr();
+	  }
+	}
+  }
+
+  void DotProductRows(const int* rows, const int n, double strength, double* input, double* activity) {
+	//Dot product visiting only the listed (active) input rows, using
+	//the index built by buildRowIndex
+	const T* values = this->valuePtr();
+	double src;
+	for (int i=0; i<n; ++i) {
+	  src = input[rows[i]];
+	  for (int pos=rowStart[rows[i]]; pos<rowStart[rows[i]+1]; ++pos) {
+		activity[rowCols[pos]] += src * values[rowValues[pos]];
+	  }
+	}
+	for (int j=0; j<this->outerSize(); ++j) {
+	  activity[j] *= strength;
+	}
+  }
+
+  void CFWeightTotals(double* norm_total, int threads=0) {
+	#pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k;
 	  #pragma omp for schedule(guided, 8)
@@ -164,8 +251,8 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void DivisiveNormalizeL1(double* norm_total) {
-	#pragma omp parallel
+  void DivisiveNormalizeL1(double* norm_total, int threads=0) {
+	#pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k;
 	  double factor;
@@ -179,9 +266,9 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
-  void DivisiveNormalizeL1_opt(double* norm_total, double* dest_act) {
+  void DivisiveNormalizeL1_opt(double* norm_total, double* dest_act, int threads=0) {
 	double epsilon = 0.000001;
-    #pragma omp parallel
+    #pragma omp parallel num_threads(omp_threads(threads))
 	{
 	  unsigned int k, y;
 	  double factor;
@@ -209,6 +296,71 @@ template <class T, int S=Eigen::ColMajor>
 	}
   }
 
+  void CFBlocks(const int* cols, const int n, const int* slices, const int src_cols,
+				const int height, const int width, T* blocks) {
+	//Scatters column cols[i] into the zero-padded dense block i,
+	//using the (r1,r2,c1,c2) source slice given in slices[4*i]
+	#pragma omp parallel
+	{
+	  int i, r, c;
+	  T* block;
+	  #pragma omp for schedule(guided, 8)
+	  for (i=0; i<n; ++i) {
+		block = blocks + (long)i*height*width;
+		std::fill(block,block+height*width,T(0));
+		for (typename SparseMatrixExt<T>::InnerIterator it(*this,cols[i]); it; ++it) {
+		  r = it.row()/src_cols - slices[4*i];
+		  c = it.row()%src_cols - slices[4*i+2];
+		  block[r*width+c] = it.value();
+		}
+	  }
+	}
+  }
+
+  void RetractColumns(const int* counts, T* thresholds) {
+	#pragma omp parallel
+	{
+	  std::vector<T> values;
+	  int k, n;
+	  T threshold;
+	  #pragma omp for schedule(guided, 8)
+	  for (k=0; k<this->outerSize(); ++k) {
+		values.clear();
+		for (typename SparseMatrixExt<T>::InnerIterator it(*this,k); it; ++it) {
+		  values.push_back(it.value());
+		}
+		if (values.empty()) {
+		  thresholds[k] = 0;
+		  continue;
+		}
+		// Always keep at least the strongest connection
+		n = std::min(std::max(counts[k],0),(int)values.size()-1);
+		std::nth_element(values.begin(),values.begin()+n,values.end());
+		threshold = values[n];
+		thresholds[k] = threshold;
+		for (typename SparseMatrixExt<T>::InnerIterator it(*this,k); it; ++it) {
+		  if (it.value() < threshold) {
+			it.valueRef() = 0;
+		  }
+		}
+	  }
+	}
+	this->prune(T(0),0);
+  }
+
+  void insertTriplets(const int* is, const int* js, const T* vs, const int n) {
+	//Entries must not already be present in the matrix
+	Eigen::VectorXi sizes = Eigen::VectorXi::Zero(this->outerSize());
+	for (int i = 0; i < n; i++) {
+	  sizes[js[i]]++;
+	}
+	this->reserve(sizes);
+	for (int i = 0; i < n; i++) {
+	  this->insert(is[i],js[i]) = vs[i];
+	}
+	this->makeCompressed();
+  }
+
   void setTriplets(const int* is, const int* js, const float* vs, const int n) {
 	  typedef Eigen::Triplet<float> Tr;
 	  std::vector<Tr> tripletList;
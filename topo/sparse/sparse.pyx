@@ -30,14 +30,21 @@ cdef extern from "SparseMatrixExt.cpp":
         void insertVal(int, int, T)
         void makeCompressed()
         void iterNonZero(int*, int*, float*)
-        void DotProduct(int,double,double*,double*)
-        void DotProduct_opt(int,double,double*,double*)
-        void Hebbian(double*,double*,double*,double)
-        void Hebbian_opt(double*,double*,double*,double)
-        void DivisiveNormalizeL1(double*)
-        void DivisiveNormalizeL1_opt(double*,double*)
-        void CFWeightTotals(double*)
+        void DotProduct(int,double,double*,double*,int) nogil
+        void DotProduct_opt(int,double,double*,double*,int) nogil
+        void Hebbian(double*,double*,double*,double,int) nogil
+        void Hebbian_opt(double*,double*,double*,double,int) nogil
+        void DivisiveNormalizeL1(double*,int) nogil
+        void DivisiveNormalizeL1_opt(double*,double*,int) nogil
+        void CFWeightTotals(double*,int) nogil
+        void HebbianColumns(int*,int,double*,double*,double*,double,int) nogil
+        void DivisiveNormalizeL1Columns(int*,int,double*,int) nogil
+        void buildRowIndex()
+        void DotProductRows(int*,int,double,double*,double*) nogil
         void setTriplets(int*,int*,float*,int)
+        void insertTriplets(int*,int*,float*,int)
+        void RetractColumns(int*,float*)
+        void CFBlocks(int*,int,int*,int,int,int,float*)
         void reserve(int)
         void slice(int*, int, int*, int, SparseMatrixExt[T]*)
         void prune(float,float)
@@ -46,6 +53,9 @@ cdef class csarray_float:
     cdef SparseMatrixExt[float] *thisPtr
     cdef tuple src_dim, dest_dim
     cdef int x,y
+    # Whether the row-major index used by DotProduct_rows matches the
+    # current sparsity structure; reset by every structural change
+    cdef bint row_index_valid
 
 
     def __cinit__(self, src_dim, dest_dim):
@@ -115,6 +125,7 @@ cdef class csarray_float:
                 raise ValueError("Invalid col index " + str(j))
 
             self.thisPtr.insertVal(i, j, val)
+            self.row_index_valid = False
 
     def __add__(csarray_float self, csarray_float A):
         """
@@ -135,6 +146,7 @@ cdef class csarray_float:
         nonzero entries below a specified value.
         """
         self.thisPtr.prune(0.0001,0.000001)
+        self.row_index_valid = False
 
 
     def nonzero(self):
@@ -226,6 +238,7 @@ cdef class csarray_float:
         """
         cdef unsigned int ix
         self.reserve(len(rowInds))
+        self.row_index_valid = False
         if isinstance(val,numpy.ndarray):
             for ix in range(len(rowInds)):
                 self.thisPtr.insertVal(rowInds[ix], colInds[ix], val[ix])
@@ -267,6 +280,7 @@ cdef class csarray_float:
         space in the buffer.
         """
         self.thisPtr.makeCompressed()
+        self.row_index_valid = False
 
 
     def reserve(self, int n):
@@ -274,6 +288,7 @@ cdef class csarray_float:
         Reserve n nonzero entries and turns the matrix into uncompressed mode.
         """
         self.thisPtr.reserve(n)
+        self.row_index_valid = False
 
 
     def getTriplets(self):
@@ -292,69 +307,182 @@ cdef class csarray_float:
         Calls C method, which sets nonzero value in the sparse matrix based on coordinate and value triplets.
         """
         self.thisPtr.setTriplets(&rows[0],&cols[0],&vals[0],int(vals.shape[0]))
+        self.row_index_valid = False
 
 
-    def Hebbian(self,numpy.ndarray[double, ndim=2, mode="c"] src_act, numpy.ndarray[double, ndim=2, mode="c"] dest_act, numpy.ndarray[double, ndim=2, mode="c"] norm_total, double lr):
+    def insertTriplets(self, numpy.ndarray[int, ndim=1, mode="c"] rows, numpy.ndarray[int, ndim=1, mode="c"] cols, numpy.ndarray[float, ndim=1, mode="c"] vals):
+        """
+        Calls C method, which inserts new nonzero values into the
+        sparse matrix in place, keeping the existing entries. The
+        coordinates must not already be present in the matrix.
+        """
+        if vals.shape[0]:
+            self.thisPtr.insertTriplets(&rows[0],&cols[0],&vals[0],int(vals.shape[0]))
+            self.row_index_valid = False
+
+
+    def CFBlocks(self, numpy.ndarray[int, ndim=1, mode="c"] cols, numpy.ndarray[int, ndim=2, mode="c"] slices, int src_cols, numpy.ndarray[float, ndim=3, mode="c"] out):
+        """
+        Calls C method, which copies each column cols[i] into the
+        zero-padded dense block out[i], where row i of slices holds
+        the (r1,r2,c1,c2) source slice of that column and src_cols is
+        the number of columns of the source sheet.
+        """
+        if cols.shape[0]:
+            self.thisPtr.CFBlocks(&cols[0],int(cols.shape[0]),&slices[0,0],src_cols,
+                                  int(out.shape[1]),int(out.shape[2]),&out[0,0,0])
+
+
+    def retract(self, numpy.ndarray[int, ndim=1, mode="c"] counts, numpy.ndarray[float, ndim=1, mode="c"] thresholds):
+        """
+        Calls C method, which removes the counts[j] weakest nonzero
+        weights of each column j in place, always keeping the strongest
+        one. The value of the weakest remaining weight of each column
+        is written into thresholds (zero for empty columns).
+        """
+        self.thisPtr.RetractColumns(&counts[0],&thresholds[0])
+        self.row_index_valid = False
+
+
+    # The kernels below are partitioned over columns (CFs), each of
+    # which is processed by a single thread, so their results do not
+    # depend on the number of threads. threads=0 uses the OpenMP
+    # default. The GIL is released while they run.
+
+    def Hebbian(self,numpy.ndarray[double, ndim=2, mode="c"] src_act, numpy.ndarray[double, ndim=2, mode="c"] dest_act, numpy.ndarray[double, ndim=2, mode="c"] norm_total, double lr, int threads=0):
         """
         Call C method to update weights based on Hebbian learning and
         the learning rate, also calculates the CF weight totals for
         divisive normalization.
         """
-        self.thisPtr.Hebbian(&src_act[0,0],&dest_act[0,0],&norm_total[0,0],lr)
+        cdef double* src_ptr = &src_act[0,0]
+        cdef double* dest_ptr = &dest_act[0,0]
+        cdef double* norm_ptr = &norm_total[0,0]
+        with nogil:
+            self.thisPtr.Hebbian(src_ptr,dest_ptr,norm_ptr,lr,threads)
 
 
-    def Hebbian_opt(self,numpy.ndarray[double, ndim=2, mode="c"] src_act, numpy.ndarray[double, ndim=2, mode="c"] dest_act, numpy.ndarray[double, ndim=2, mode="c"] norm_total, double lr, bool init):
+    def Hebbian_opt(self,numpy.ndarray[double, ndim=2, mode="c"] src_act, numpy.ndarray[double, ndim=2, mode="c"] dest_act, numpy.ndarray[double, ndim=2, mode="c"] norm_total, double lr, bool init, int threads=0):
         """
         Call optimized C method to update weights based on Hebbian
         learning and the learning rate, also calculates the CF weight
         totals for divisive normalization. Optimization skips inactive
         units (only provides speedup in very specific circumstances).
         """
-        if init:
-            self.thisPtr.Hebbian_opt(&src_act[0,0],&dest_act[0,0],&norm_total[0,0],lr)
-        else:
-            self.thisPtr.Hebbian(&src_act[0,0],&dest_act[0,0],&norm_total[0,0],lr)
+        cdef double* src_ptr = &src_act[0,0]
+        cdef double* dest_ptr = &dest_act[0,0]
+        cdef double* norm_ptr = &norm_total[0,0]
+        cdef bint skip_inactive = init
+        with nogil:
+            if skip_inactive:
+                self.thisPtr.Hebbian_opt(src_ptr,dest_ptr,norm_ptr,lr,threads)
+            else:
+                self.thisPtr.Hebbian(src_ptr,dest_ptr,norm_ptr,lr,threads)
 
 
-    def DotProduct(self, double strength, numpy.ndarray[double, ndim=2, mode="c"] dense, numpy.ndarray[double, ndim=2, mode="c"] out):
+    def DotProduct(self, double strength, numpy.ndarray[double, ndim=2, mode="c"] dense, numpy.ndarray[double, ndim=2, mode="c"] out, int threads=0):
         """
         Call C method to calculate the dot product sums between the input activities and CF weights.
         """
-        self.thisPtr.DotProduct(self.dest_dim[0]*self.dest_dim[1],strength,&dense[0,0],&out[0,0])
+        cdef double* input_ptr = &dense[0,0]
+        cdef double* out_ptr = &out[0,0]
+        cdef int num_cfs = self.dest_dim[0]*self.dest_dim[1]
+        with nogil:
+            self.thisPtr.DotProduct(num_cfs,strength,input_ptr,out_ptr,threads)
 
 
-    def DotProduct_opt(self, double strength, numpy.ndarray[double, ndim=2, mode="c"] dense, numpy.ndarray[double, ndim=2, mode="c"] out):
+    def DotProduct_opt(self, double strength, numpy.ndarray[double, ndim=2, mode="c"] dense, numpy.ndarray[double, ndim=2, mode="c"] out, int threads=0):
         """
         Call optimized C method to calculate the dot product sums between the input activities and CF weights.
         """
-        self.thisPtr.DotProduct_opt(self.dest_dim[0]*self.dest_dim[1],strength,&dense[0,0],&out[0,0])
+        cdef double* input_ptr = &dense[0,0]
+        cdef double* out_ptr = &out[0,0]
+        cdef int num_cfs = self.dest_dim[0]*self.dest_dim[1]
+        with nogil:
+            self.thisPtr.DotProduct_opt(num_cfs,strength,input_ptr,out_ptr,threads)
 
 
-    def DivisiveNormalizeL1(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total):
+    def Hebbian_cols(self,numpy.ndarray[double, ndim=2, mode="c"] src_act, numpy.ndarray[double, ndim=2, mode="c"] dest_act, numpy.ndarray[double, ndim=2, mode="c"] norm_total, double lr, numpy.ndarray[int, ndim=1, mode="c"] cols, int threads=0):
+        """
+        Call C method to apply Hebbian learning only to the given
+        columns (e.g. the active destination units), writing their
+        weight totals into norm_total. Other columns and their
+        norm_total entries are left untouched.
+        """
+        cdef double* src_ptr = &src_act[0,0]
+        cdef double* dest_ptr = &dest_act[0,0]
+        cdef double* norm_ptr = &norm_total[0,0]
+        cdef int* cols_ptr = &cols[0] if cols.shape[0] else NULL
+        cdef int n = cols.shape[0]
+        with nogil:
+            self.thisPtr.HebbianColumns(cols_ptr,n,src_ptr,dest_ptr,norm_ptr,lr,threads)
+
+
+    def DotProduct_rows(self, double strength, numpy.ndarray[double, ndim=2, mode="c"] dense, numpy.ndarray[int, ndim=1, mode="c"] rows, numpy.ndarray[double, ndim=2, mode="c"] out):
+        """
+        Call C method to calculate the dot product from the given
+        (nonzero) input rows only, walking them in a row-major index
+        of the weights kept alongside the column-major storage. The
+        index is rebuilt only after the sparsity structure changes,
+        so learning does not invalidate it. Single-threaded, as rows
+        scatter into shared output units.
+        """
+        cdef double* input_ptr = &dense[0,0]
+        cdef double* out_ptr = &out[0,0]
+        cdef int* rows_ptr = &rows[0] if rows.shape[0] else NULL
+        cdef int n = rows.shape[0]
+        if not self.row_index_valid:
+            self.thisPtr.buildRowIndex()
+            self.row_index_valid = True
+        with nogil:
+            self.thisPtr.DotProductRows(rows_ptr,n,strength,input_ptr,out_ptr)
+
+
+    def DivisiveNormalizeL1(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total, int threads=0):
         """
         Calls C method to apply divisive normalization on each CF in
         the sparse projection.
         """
-        self.thisPtr.DivisiveNormalizeL1(&norm_total[0,0])
+        cdef double* norm_ptr = &norm_total[0,0]
+        with nogil:
+            self.thisPtr.DivisiveNormalizeL1(norm_ptr,threads)
 
 
-    def DivisiveNormalizeL1_opt(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total, numpy.ndarray[double, ndim=2, mode="c"] dest_act, bool init):
+    def DivisiveNormalizeL1_opt(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total, numpy.ndarray[double, ndim=2, mode="c"] dest_act, bool init, int threads=0):
         """
         Calls optimized C method to apply divisive normalization on
         each CF in the sparse projection.  Optimization skips inactive
         units (only provides speedup in very specific circumstances).
         """
-        if init:
-            self.thisPtr.DivisiveNormalizeL1(&norm_total[0,0])
-        else:
-            self.thisPtr.DivisiveNormalizeL1_opt(&norm_total[0,0],&dest_act[0,0])
+        cdef double* norm_ptr = &norm_total[0,0]
+        cdef double* dest_ptr = &dest_act[0,0]
+        cdef bint normalize_all = init
+        with nogil:
+            if normalize_all:
+                self.thisPtr.DivisiveNormalizeL1(norm_ptr,threads)
+            else:
+                self.thisPtr.DivisiveNormalizeL1_opt(norm_ptr,dest_ptr,threads)
+
+
+    def DivisiveNormalizeL1_cols(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total, numpy.ndarray[int, ndim=1, mode="c"] cols, int threads=0):
+        """
+        Calls C method to apply divisive normalization only to the
+        CFs in the given columns.
+        """
+        cdef double* norm_ptr = &norm_total[0,0]
+        cdef int* cols_ptr = &cols[0] if cols.shape[0] else NULL
+        cdef int n = cols.shape[0]
+        with nogil:
+            self.thisPtr.DivisiveNormalizeL1Columns(cols_ptr,n,norm_ptr,threads)
 
 
-    def CFWeightTotals(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total):
+    def CFWeightTotals(self,numpy.ndarray[double, ndim=2, mode="c"] norm_total, int threads=0):
         """
         Method to calculate the current weight totals for each CF.
         """
-        self.thisPtr.CFWeightTotals(&norm_total[0,0])
+        cdef double* norm_ptr = &norm_total[0,0]
+        with nogil:
+            self.thisPtr.CFWeightTotals(norm_ptr,threads)
 
 
     shape = property(__getShape)
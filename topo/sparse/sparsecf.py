@@ -37,6 +37,37 @@ except:
 sparse_type = np.float32
 
 
+def _cf_triplets(blocks,slices,src_cols,cols):
+    """
+    Return (row,col,value) triplets for the nonzero weights in a list
+    of dense CF weight blocks.
+
+    slices holds the (r1,r2,c1,c2) input sheet slice of each block,
+    src_cols the number of columns of the source sheet and cols the
+    flattened destination index of each CF. The blocks are packed
+    into one zero-padded array (unless already supplied as one, as
+    returned by SparseCFProjection.get_cf_blocks) so that all indices
+    are computed in a single vectorized pass; the padding is dropped
+    together with the zero weights.
+    """
+    slices = np.asarray(slices,dtype=np.int64).reshape(-1,4)
+    heights = slices[:,1]-slices[:,0]
+    widths = slices[:,3]-slices[:,2]
+    if isinstance(blocks,np.ndarray) and blocks.ndim == 3:
+        inside = ((np.arange(blocks.shape[1]) < heights[:,None])[:,:,None] &
+                  (np.arange(blocks.shape[2]) < widths[:,None])[:,None,:])
+        padded = np.where(inside,blocks,0).astype(sparse_type)
+    else:
+        padded = np.zeros((len(slices),heights.max(),widths.max()),dtype=sparse_type)
+        for i,block in enumerate(blocks):
+            padded[i,:heights[i],:widths[i]] = block
+
+    n,r,c = padded.nonzero()
+    rows = (slices[n,0]+r)*src_cols + slices[n,2]+c
+    return (rows.astype(np.int32),np.asarray(cols,dtype=np.int32)[n],
+            padded[n,r,c])
+
+
 class CFSPLF_Plugin(param.Parameterized):
     """CFSPLearningFunction applying the specified single_cf_fn to each Sparse CF."""
 
@@ -84,7 +115,7 @@ class CFSPOF_Plugin(param.Parameterized):
 
             for cf in projection.flatcfs:
                 temp_weights = cf.weights
-                single_cf_fn(cf.weights)
+                single_cf_fn(temp_weights)
                 cf.weights = temp_weights
                 del cf.norm_total
 
@@ -113,7 +144,6 @@ class CFSPOF_Prune(CFSPOF_Plugin):
 
         elif (time % self.interval) == 0:
             for cf in projection.flatcfs:
-                dim1,dim2 = cf.weights.shape
                 temp_weights = cf.weights
                 percentile = np.percentile(temp_weights[temp_weights.nonzero()],self.percentile)
                 temp_weights[np.where(temp_weights<=percentile)] = 0.0
@@ -161,110 +191,119 @@ class CFSPOF_SproutRetract(CFSPOF_Plugin):
     disk_mask = param.Boolean(default=True,doc="""
         Limits connection sprouting to a disk.""")
 
+    chunk_size = param.Integer(default=1024,bounds=(1,None),doc="""
+        Number of CFs whose dense weights are processed at a time,
+        which bounds the memory used on large sheets.""")
+
     def __call__(self, projection, **params):
         time = math.ceil(topo.sim.time())
 
-        if self.disk_mask:
-            self.disk = ig.Disk(size=1.0,smoothing=0.0)
-
-        # Get CF and src sheet shapes
-        cf_x,cf_y = projection.dest.activity.shape
-        src_x,src_y = projection.src.activity.shape
-
-        # Initialize sparse triplet arrays
-        y_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        x_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        val_array = np.zeros((src_x*src_y*cf_y),dtype=sparse_type)
-
-        # Create new sparse matrix to accumulate into
-        sum_sparse = sparse.csarray_float(projection.src.activity.shape,projection.dest.activity.shape)
-
-        # Counters for logging
-        sprout_sum = 0; prune_sum = 0; unit_total = 0
-        self.mask_total = 0
-
         if (time == 0):
             if not hasattr(self,"initial_conns"):
                 self.initial_conns = {}
             self.initial_conns[projection.name] = projection.n_conns()
         elif (time % self.interval) == 0:
-            idx=0
-            for cidx,cf in enumerate(projection.flatcfs):
-                temp_weights = cf.weights
-                dense_unit_mask = (1.0 - (temp_weights>0.0))
-                dim1,dim2 = temp_weights.shape
-
-                sprout_count,prune_idx,nnz = self.calc_ratios(temp_weights)
-
-                self.prune(temp_weights,prune_idx)
-                nnz_pp = np.count_nonzero(temp_weights)
-                prune_sum += (nnz_pp-nnz)
-
-                if sprout_count:
-                    self.sprout(temp_weights,dense_unit_mask,sprout_count)
-                nnz_ps = np.count_nonzero(temp_weights)
-                sprout_sum += nnz_ps - nnz_pp
-                unit_total += nnz_ps
-
-                # Populate sparse array chunk
-                temp_sparse = sparse.csarray_float(projection.src.activity.shape,projection.dest.activity.shape)
-                x1,x2,y1,y2 = cf.input_sheet_slice.tolist()
-                for cnx in range(dim1):
-                    val_array[idx:idx+dim2] = temp_weights[cnx,:]
-                    x_val = (x1+cnx) * src_y + y1
-                    x_array[idx:idx+dim2] = range(x_val,x_val+dim2)
-                    y_array[idx:idx+dim2] = cidx
-                    idx += dim2
-
-                # Populate combined sparse array with sparse array chunk
-                if (cidx+1)%cf_y == 0:
-                    nnz_idx = val_array.nonzero()
-                    temp_sparse.setTriplets(x_array[nnz_idx],y_array[nnz_idx],val_array[nnz_idx])
-                    sum_sparse += temp_sparse
-                    x_array *= 0; y_array *= 0; val_array *= 0.0
-                    idx=0
-            projection.weights = sum_sparse
-            del temp_sparse, sum_sparse
-            projection.weights.compress()
-
-
-    def sprout(self, temp_weights, mask, sprout_count):
-        """
-        Applies a Gaussian blur to the existing connection field,
-        selecting the n units with the highest probabilities to sprout
-        new connections, where n is set by the sprout_count. New
-        connections are initialized at the minimal strength of the
-        current CF.
-        """
-
-        dim1,dim2 = temp_weights.shape
-        init_weight = temp_weights[temp_weights.nonzero()].min()
-        blurred_weights = gaussian_filter(temp_weights, sigma=self.kernel_sigma)
-        blurred_weights = (blurred_weights - blurred_weights.min()) / blurred_weights.max()
-        sprout_prob_map = (blurred_weights * np.random.rand(dim1,dim2)) * mask
+            src_cols = projection.src.activity.shape[1]
+            slices = projection.cf_slices
+            heights = slices[:,1]-slices[:,0]
+            widths = slices[:,3]-slices[:,2]
+            shapes = set(zip(heights,widths))
+            n_cfs = len(slices)
+
+            masked_units = np.zeros(n_cfs)
+            for dim1,dim2 in shapes:
+                masked_units[(heights==dim1)&(widths==dim2)] = self.sprout_mask(dim1,dim2).sum()
+            self.mask_total = masked_units.sum()
+
+            # Work out the connections to retract and sprout for a
+            # chunk of CFs at a time, from their dense weights before
+            # retraction, and apply them all to the sparse weights
+            # afterwards
+            prune_counts = np.zeros(n_cfs,dtype=np.int32)
+            rows,cols,vals = [],[],[]
+            buffer = np.zeros((min(self.chunk_size,n_cfs),heights.max(),widths.max()),dtype=sparse_type)
+            for start in range(0,n_cfs,self.chunk_size):
+                units = np.arange(start,min(start+self.chunk_size,n_cfs),dtype=np.int32)
+                blocks = projection.get_cf_blocks(units,out=buffer[:len(units)])
+
+                flat = blocks.reshape(len(units),-1)
+                nnz = np.count_nonzero(flat,axis=1)
+                sprout_counts,prune_counts[units] = self.calc_ratios(nnz,masked_units[units])
+
+                # The weakest weight each CF keeps, as for retract()
+                ranked = np.sort(np.where(flat != 0.0,flat,np.inf),axis=1)
+                keep = np.clip(prune_counts[units],0,np.maximum(nnz-1,0))
+                thresholds = np.where(nnz > 0,ranked[np.arange(len(units)),keep],0.0).astype(sparse_type)
+                empty = (blocks == 0.0)
+                blocks[blocks < thresholds[:,None,None]] = 0.0
+
+                # Sprout new connections, batched over CFs of the same shape
+                for dim1,dim2 in shapes:
+                    idx = np.flatnonzero((heights[units]==dim1)&(widths[units]==dim2)&
+                                         (sprout_counts>0)&(thresholds>0))
+                    if not len(idx):
+                        continue
+                    unit,r,c = self.sprout(blocks[idx,:dim1,:dim2],empty[idx,:dim1,:dim2],
+                                           sprout_counts[idx])
+                    cfs = units[idx[unit]]
+                    rows.append((slices[cfs,0]+r)*src_cols + slices[cfs,2]+c)
+                    cols.append(cfs)
+                    vals.append(thresholds[idx[unit]])
+
+            # Retract the weakest connections of every CF in place
+            projection.weights.retract(prune_counts,np.zeros(n_cfs,dtype=sparse_type))
+            if rows:
+                projection.weights.insertTriplets(np.concatenate(rows).astype(np.int32),
+                                                  np.concatenate(cols).astype(np.int32),
+                                                  np.concatenate(vals).astype(sparse_type))
+            projection.has_norm_total = False
+
+
+    def sprout_mask(self, dim1, dim2):
+        """
+        Return the mask of locations in a CF of the given shape at
+        which connections may sprout.
+        """
         if self.disk_mask:
-            sprout_prob_map *= self.disk(xdensity=dim2,ydensity=dim1)
-        sprout_inds = np.unravel_index(np.argsort(sprout_prob_map.flatten())[-sprout_count:],(dim1,dim2))
-        temp_weights[sprout_inds] = init_weight
+            return ig.Disk(size=1.0,smoothing=0.0)(xdensity=dim2,ydensity=dim1)
+        return np.ones((dim1,dim2))
 
 
-    def prune(self, temp_weights, prune_idx):
+    def sprout(self, weights, empty, sprout_counts):
         """
-        Retracts n connections with the lowest weights, where n is
-        determined by the piecewise linear function in the calc_ratios
-        method.
+        Applies a Gaussian blur to a stack of equally shaped connection
+        fields, selecting for each CF the n empty locations with the
+        highest probabilities to sprout new connections, where n is
+        set by sprout_counts. Returns the CF, row and column index of
+        each new connection. New connections are initialized at the
+        minimal strength of their CF.
         """
 
-        sorted_weights = np.sort(temp_weights.flatten())
-        threshold = sorted_weights[prune_idx]
-        temp_weights[temp_weights < threshold] = 0.0
+        n_cfs,dim1,dim2 = weights.shape
+        blurred = gaussian_filter(weights, sigma=(0,self.kernel_sigma,self.kernel_sigma))
+        blurred -= blurred.min(axis=2).min(axis=1)[:,None,None]
+        with np.errstate(divide='ignore',invalid='ignore'):
+            blurred /= blurred.max(axis=2).max(axis=1)[:,None,None]
+        sprout_prob_map = (np.nan_to_num(blurred) * np.random.rand(n_cfs,dim1,dim2)) * empty
+        sprout_prob_map *= self.sprout_mask(dim1,dim2)
+        sprout_prob_map = sprout_prob_map.reshape(n_cfs,-1)
 
+        order = np.argsort(-sprout_prob_map,axis=1)
+        ranked = sprout_prob_map[np.arange(n_cfs)[:,None],order]
+        selected = (np.arange(dim1*dim2) < sprout_counts[:,None]) & (ranked > 0)
+        unit,rank = selected.nonzero()
+        r,c = np.unravel_index(order[unit,rank],(dim1,dim2))
+        return unit,r,c
 
-    def calc_ratios(self,temp_weights):
+
+    def calc_ratios(self, nnz, masked_units):
         """
         Uses a piecewise linear function to determine the unit
         proportion of sprouting and retraction and the associated
-        turnover rates.
+        turnover rates, given arrays of the number of nonzero weights
+        and of the number of units in the sprouting mask of each CF.
+        Returns the number of connections to sprout and to retract
+        for each CF.
 
         Above the target sparsity the sprout/retract ratio scales
         linearly up to maximal density, i.e. at full density 100% of
@@ -281,29 +320,20 @@ class CFSPOF_SproutRetract(CFSPOF_Plugin):
         connections continue to sprout and retract.
         """
 
-        dim1,dim2 = temp_weights.shape
-        if self.disk_mask:
-            masked_units = len(self.disk(xdensity=dim2,ydensity=dim1).nonzero()[0])
-        else:
-            masked_units = dim1*dim2
-        self.mask_total += masked_units
-        max_units = dim1*dim2
-        nnz = np.count_nonzero(temp_weights)
-        cf_sparsity = nnz / float(masked_units)
+        cf_sparsity = nnz / np.asarray(masked_units,dtype=np.float64)
         delta_sparsity = cf_sparsity - self.target_sparsity
-        if delta_sparsity > 0:
-            relative_sparsity = delta_sparsity/(1.0 - self.target_sparsity)
-        else:
-            relative_sparsity = delta_sparsity/self.target_sparsity
+        with np.errstate(divide='ignore',invalid='ignore'):
+            relative_sparsity = np.where(delta_sparsity > 0,
+                                         delta_sparsity/(1.0 - self.target_sparsity),
+                                         delta_sparsity/self.target_sparsity)
 
         # Total number of units to modify, broken down into units for pruning and sprouting
         delta_units = (abs(self.turnover_rate * relative_sparsity) + self.residual_turnover) * masked_units
         prune_factor = 0.5 + (0.5*relative_sparsity)
-        prune_count = int(delta_units * prune_factor)
-        prune_idx = (max_units-nnz)+prune_count
-        sprout_count = int(delta_units * (1-prune_factor))
+        prune_counts = (delta_units * prune_factor).astype(int)
+        sprout_counts = (delta_units * (1-prune_factor)).astype(int)
 
-        return sprout_count, prune_idx, nnz
+        return sprout_counts, prune_counts
 
 
 
@@ -354,69 +384,116 @@ class compute_sparse_joint_norm_totals(param.ParameterizedFunction):
 
 
 
-def CFPOF_DivisiveNormalizeL1_Sparse(projection):
+class SparseKernelFn(param.ParameterizedFunction):
+    """
+    Base class for projection functions calling the multi-threaded
+    kernels of the sparse weights matrix.
+    """
+
+    __abstract = True
+
+    threads = param.Integer(default=0,bounds=(0,None),doc="""
+        Number of threads over which the CFs (sparse matrix columns)
+        are partitioned, with 0 selecting the OpenMP default. Each CF
+        is processed by a single thread, so the result does not
+        depend on the number of threads.""")
+
+
+
+class CFPOF_DivisiveNormalizeL1_Sparse(SparseKernelFn):
     """
     Sparse CF Projection output function applying L1 divisive normalization
     to individual CFs.
     """
 
-    if not projection.has_norm_total:
-        projection.norm_total *= 0.0
-        projection.weights.CFWeightTotals(projection.norm_total)
-    projection.weights.DivisiveNormalizeL1(projection.norm_total)
-    projection.has_norm_total = False
+    def __call__(self, projection, **params):
+        threads = param.ParamOverrides(self,params).threads
+        learned_units = getattr(projection,'learned_units',None)
+        if projection.has_norm_total and learned_units is not None:
+            # Only the CFs changed by learning need normalizing
+            projection.weights.DivisiveNormalizeL1_cols(projection.norm_total,learned_units,threads)
+        else:
+            if not projection.has_norm_total:
+                projection.norm_total *= 0.0
+                projection.weights.CFWeightTotals(projection.norm_total,threads)
+            projection.weights.DivisiveNormalizeL1(projection.norm_total,threads)
+        projection.has_norm_total = False
 
 
 
-def CFPLF_Hebbian_Sparse(projection):
+class CFPLF_Hebbian_Sparse(SparseKernelFn):
     """
     Sparse CF Projection learning function applying Hebbian learning
     to the weights in a projection.
     """
 
-    single_conn_lr = projection.learning_rate/projection.n_units
-    projection.norm_total *= 0.0
-    projection.weights.Hebbian(projection.src.activity,projection.dest.activity,
-                               projection.norm_total,single_conn_lr)
-    projection.has_norm_total = True
+    def __call__(self, projection, **params):
+        single_conn_lr = projection.learning_rate/projection.n_units
+        projection.norm_total *= 0.0
+        projection.weights.Hebbian(projection.src.activity,projection.dest.activity,
+                                   projection.norm_total,single_conn_lr,
+                                   param.ParamOverrides(self,params).threads)
+        projection.learned_units = None
+        projection.has_norm_total = True
 
 
-def CFPLF_Hebbian_Sparse_opt(projection):
+class CFPLF_Hebbian_Sparse_opt(CFPLF_Hebbian_Sparse):
     """
-    Sparse CF Projection learning function, which calls an optimized Hebbian
-    learning function while skipping over inactive units.
+    Sparse CF Projection learning function, which applies Hebbian
+    learning only to the CFs of the active destination units, visiting
+    just the corresponding columns of the sparse weights.
+
+    Weight totals are only computed for those CFs, and the units are
+    recorded in the projection's learned_units so that
+    CFPOF_DivisiveNormalizeL1_Sparse normalizes only them; the other
+    CFs are unchanged and remain normalized.
     """
 
-    single_conn_lr = projection.learning_rate/projection.n_units
-    projection.norm_total *= 0.0
-    projection.weights.Hebbian_opt(projection.src.activity,projection.dest.activity,
-                                   projection.norm_total,single_conn_lr,projection.initialized)
-    projection.has_norm_total = True
+    def __call__(self, projection, **params):
+        single_conn_lr = projection.learning_rate/projection.n_units
+        active_units = np.flatnonzero(projection.dest.activity).astype(np.int32)
+        projection.norm_total *= 0.0
+        projection.weights.Hebbian_cols(projection.src.activity,projection.dest.activity,
+                                        projection.norm_total,single_conn_lr,active_units,
+                                        param.ParamOverrides(self,params).threads)
+        projection.learned_units = active_units
+        projection.has_norm_total = True
 
 
 
-def CFPRF_DotProduct_Sparse(projection):
+class CFPRF_DotProduct_Sparse(SparseKernelFn):
     """
     Sparse CF Projection response function calculating the dot-product
     between incoming activities and CF weights.
     """
 
-    projection.weights.DotProduct(projection.strength, projection.input_buffer, projection.activity)
+    def __call__(self, projection, **params):
+        projection.weights.DotProduct(projection.strength, projection.input_buffer, projection.activity,
+                                      param.ParamOverrides(self,params).threads)
 
 
-def CFPRF_DotProduct_Sparse_opt(projection):
+class CFPRF_DotProduct_Sparse_opt(CFPRF_DotProduct_Sparse):
     """
     Sparse CF Projection response function calculating the dot-product
-    between incoming activities and CF weights. Optimization skips
-    inactive units if a certain percentage of neurons is inactive.
+    between incoming activities and CF weights. If only a small
+    fraction of the input units is active, the dot product visits
+    only the rows of the active inputs, using a row-major index of
+    the weights maintained alongside the column-major storage.
     """
 
-    nnz_ratio = np.count_nonzero(projection.src.activity) / len(projection.src.activity.flatten())
+    active_fraction = param.Number(default=0.1,bounds=(0.0,1.0),doc="""
+        Fraction of active input units below which only the active
+        inputs are visited.""")
 
-    if nnz_ratio < 0.1:
-        projection.weights.DotProduct_opt(projection.strength, projection.src.activity, projection.activity)
-    else:
-        projection.weights.DotProduct(projection.strength, projection.src.activity, projection.activity)
+    def __call__(self, projection, **params):
+        p = param.ParamOverrides(self,params)
+        input_activity = projection.input_buffer
+        active_inputs = np.flatnonzero(input_activity).astype(np.int32)
+
+        if len(active_inputs) < p.active_fraction*input_activity.size:
+            projection.weights.DotProduct_rows(projection.strength, input_activity, active_inputs, projection.activity)
+        else:
+            projection.weights.DotProduct(projection.strength, input_activity, projection.activity, p.threads)
 
 
 
@@ -481,13 +558,7 @@ class SparseConnectionField(param.Parameterized):
 
 
     def __get_mask(self):
-        x1,x2,y1,y2 = self.input_sheet_slice.tolist()
-        mask = np.zeros((x2-x1,y2-y1),dtype=np.bool)
-        inds = np.ravel_multi_index(np.mgrid[x1:x2,y1:y2],self.projection.src.shape).flatten()
-        nz_flat = self.projection.weights[inds,self.oned_idx].toarray()
-        nz_inds = nz_flat.reshape(x2-x1,y2-y1).nonzero()
-        mask[nz_inds] = True
-        return mask
+        return self.weights != 0
 
     mask = property(__get_mask,
         """
@@ -504,13 +575,20 @@ class SparseConnectionField(param.Parameterized):
 
     def __get_weights(self):
         """
-        get_weights accesses the sparse CF matrix and returns the CF
-        in dense form.
+        get_weights returns the CF in dense form, as a new array
+        extracted from this CF's column of the sparse matrix.
+
+        Changes to the returned array are only stored by assigning it
+        back to weights; in-place operators on the property itself
+        (e.g. cf.weights *= 2.0) do this automatically.
         """
 
         x1,x2,y1,y2 = self.src_slice
-        inds = np.ravel_multi_index(np.mgrid[x1:x2,y1:y2],self.projection.src.shape).flatten()
-        return self.projection.weights[inds,self.oned_idx].toarray().reshape(x2-x1,y2-y1)
+        weights = np.zeros((1,x2-x1,y2-y1),dtype=sparse_type)
+        self.projection.weights.CFBlocks(np.array([self.oned_idx],dtype=np.int32),
+                                         np.array([self.src_slice],dtype=np.int32),
+                                         self.projection.src.activity.shape[1],weights)
+        return weights[0]
 
     def __set_weights(self,arr):
         """
@@ -698,6 +776,7 @@ class SparseCFProjection(CFProjection):
         self.activity = np.array(self.dest.activity)
         self.norm_total = np.array(self.dest.activity,dtype=np.float64)
         self.has_norm_total = False
+        self.learned_units = None
 
         if initialize_cfs:
             self._create_cfs()
@@ -735,8 +814,10 @@ class SparseCFProjection(CFProjection):
 
     def _create_cfs(self):
         """
-        Creates the CF objects, initializing the weights one by one
-        and adding them to the sparse weights object in chunks.
+        Creates the CF objects and initializes their weights one
+        destination row at a time, collecting the nonzero weights as
+        triplets that are loaded into the sparse weights object with
+        a single setTriplets call.
         """
 
         vectorized_create_cf = simple_vectorize(self._create_cf)
@@ -745,41 +826,28 @@ class SparseCFProjection(CFProjection):
         self.weights = sparse.csarray_float(self.src.activity.shape,self.dest.activity.shape)
 
         cf_x,cf_y = self.dest.activity.shape
-        src_x,src_y = self.src.activity.shape
-
-        y_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        x_array = np.zeros((src_x*src_y*cf_y),dtype=np.int32)
-        val_array = np.zeros((src_x*src_y*cf_y),dtype=np.float32)
+        src_y = self.src.activity.shape[1]
 
-        # Iterate over the CFs
+        triplets = []
         for x in range(cf_x):
-            temp_sparse = sparse.csarray_float(self.src.activity.shape,self.dest.activity.shape)
-            idx = 0
+            blocks = []
             for y in range(cf_y):
                 cf = self.cfs[x][y]
                 label = cf.label + ('-%d' % self.seed if self.seed is not None else '')
                 name = "%s_CF (%.5f, %.5f)" % ('' if label is None else label, cf.x,cf.y)
-                x1,x2,y1,y2 = cf.input_sheet_slice.tolist()
                 if self.same_cf_shape_for_all_cfs:
                     mask_template = self.mask_template
                 else:
                     mask_template = _create_mask(self.cf_shape,self.bounds_template,
                                                  self.src,self.autosize_mask,
                                                  self.mask_threshold, name=name)
-                weights = self.cfs[x][y]._init_weights(mask_template)
-                cn_x,cn_y = weights.shape
-                y_val = x * cf_y + y
-                for cnx in range(cn_x):
-                    val_array[idx:idx+cn_y] = weights[cnx,:]
-                    x_val = (x1+cnx) * src_y + y1
-                    x_array[idx:idx+cn_y] = range(x_val,x_val+cn_y)
-                    y_array[idx:idx+cn_y] = y_val
-                    idx += cn_y
-            nnz_idx = val_array.nonzero()
-            temp_sparse.setTriplets(x_array[nnz_idx],y_array[nnz_idx],val_array[nnz_idx])
-            self.weights += temp_sparse
-            x_array *= 0; y_array *= 0; val_array *= 0.0
-        del temp_sparse
+                blocks.append(cf._init_weights(mask_template))
+            slices = [self.cfs[x][y].src_slice for y in range(cf_y)]
+            triplets.append(_cf_triplets(blocks,slices,src_y,
+                                         np.arange(x*cf_y,(x+1)*cf_y)))
+
+        rows,cols,vals = [np.ascontiguousarray(np.concatenate(t)) for t in zip(*triplets)]
+        self.weights.setTriplets(rows,cols,vals)
         self.weights.compress()
         self.debug("Sparse projection %r loaded" % self.name)
 
@@ -806,6 +874,63 @@ class SparseCFProjection(CFProjection):
 
         return CF
 
+    def __get_cf_slices(self):
+        return np.array([cf.src_slice for cf in self.flatcfs],dtype=np.int32)
+
+    cf_slices = property(__get_cf_slices,doc="""
+        Array of the (r1,r2,c1,c2) input sheet slices of all CFs,
+        indexed by flattened destination unit.""")
+
+
+    def get_cf_blocks(self,units=None,out=None):
+        """
+        Return the dense weights of the CFs of the given units
+        (flattened destination indices, default all units) as one
+        zero-padded array of shape (len(units),rows,cols), with the CF
+        of units[i] in the top-left corner of block i and rows and
+        cols the largest CF height and width.
+
+        The blocks are extracted in a single pass over the compressed
+        columns of the sparse weights. A suitably shaped float32 array
+        may be passed as out to avoid reallocating it.
+        """
+        slices = self.cf_slices
+        if units is None:
+            units = np.arange(len(slices),dtype=np.int32)
+        units = np.ascontiguousarray(units,dtype=np.int32)
+        shape = (len(units),(slices[:,1]-slices[:,0]).max(),(slices[:,3]-slices[:,2]).max())
+        if out is None:
+            out = np.zeros(shape,dtype=sparse_type)
+        assert out.shape == shape and out.dtype == sparse_type, "Output array does not match CF blocks."
+        self.weights.CFBlocks(units,np.ascontiguousarray(slices[units]),
+                              self.src.activity.shape[1],out)
+        return out
+
+
+    def set_cf_blocks(self,blocks,units=None):
+        """
+        Write back dense CF blocks, as returned by get_cf_blocks, for
+        the given units (default all units), replacing their current
+        weights. Zero weights, including any values in the padding
+        outside a CF, are not stored.
+        """
+        slices = self.cf_slices
+        if units is None:
+            units = np.arange(len(slices))
+        units = np.asarray(units,dtype=np.int32)
+        rows,cols,vals = self.weights.getTriplets()
+        keep = np.ones(len(slices),dtype=bool)
+        keep[units] = False
+        keep = keep[cols]
+        new_rows,new_cols,new_vals = _cf_triplets(blocks,slices[units],
+                                                  self.src.activity.shape[1],units)
+        self.weights.setTriplets(np.concatenate((rows[keep],new_rows)),
+                                 np.concatenate((cols[keep],new_cols)),
+                                 np.concatenate((vals[keep],new_vals)))
+        self.weights.compress()
+        self.has_norm_total = False
+
+
     def get_sheet_mask(self):
         return np.ones(self.activity.shape, dtype=self.activity.dtype)
 
@@ -840,7 +965,8 @@ class SparseCFProjection(CFProjection):
         """
         Apply the weights_output_fns to each unit.
         """
-        for of in self.weights_output_fns: of(self)
+        for of in self.weights_output_fns:
+            of(self)
 
 
     def n_bytes(self):
@@ -0,0 +1,259 @@
+"""
+Benchmark suite for tracking the speed of the standard model scripts.
+
+Each benchmark times one stage (startup, model build, training,
+settling, map measurement, or snapshot save/load) of one script at
+one cortex density. Every run happens in a fresh Topographica process
+and is repeated several times, and the statistics are appended to a
+machine-readable history file (one JSON record per line) in the
+machine-specific tests directory. compare_benchmarks() then checks
+the latest results against the earlier history and reports any
+benchmark that has become slower by more than a threshold.
+
+Typical use (run from the Topographica directory):
+
+  ./topographica -c "from topo.tests.benchmarks import run_benchmarks; run_benchmarks()"
+  ./topographica -c "from topo.tests.benchmarks import compare_benchmarks; compare_benchmarks()"
+
+Sparse versus dense projections are compared by benchmarking
+examples/gcal_sparse.ty alongside examples/gcal.ty at the same
+densities.
+"""
+
+import os, sys, json, time, socket, tempfile, shutil, subprocess, __main__
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy
+
+import param
+
+import topo
+from topo.misc.commandline import global_params
+from topo.tests.test_script import MACHINETESTSDATADIR, ensure_path_exists
+
+
+BENCHMARK_SCRIPTS = ["examples/gcal.ty",
+                     "examples/tiny.ty",
+                     "models/lissom_oo_or.ty",
+                     "examples/gcal_sparse.ty"]
+
+BENCHMARK_DENSITIES = [24,48]
+
+# Stages timed inside a process running the script; 'startup' is
+# timed separately, as the time to launch Topographica itself.
+SCRIPT_STAGES = ['build','train','settle','measure_map','snapshot_save','snapshot_load']
+BENCHMARK_STAGES = ['startup'] + SCRIPT_STAGES
+
+BENCHMARK_HISTORY = os.path.join(MACHINETESTSDATADIR,"benchmark_history.jsonl")
+
+
+
+######################################################################################
+### Timing (run in the benchmark subprocesses)
+
+def _timed(fn,*args,**kw):
+    start = default_timer()
+    fn(*args,**kw)
+    return default_timer()-start
+
+
+def _settle(iterations):
+    """Present patterns without any plasticity, restoring the state afterwards."""
+    from topo.base.sheet import Sheet
+    sheets = topo.sim.objects(Sheet).values()
+    topo.sim.state_push()
+    for sheet in sheets:
+        sheet.override_plasticity_state(new_plasticity_state=False)
+    topo.sim.run(iterations)
+    for sheet in sheets:
+        sheet.restore_plasticity_state()
+    topo.sim.state_pop()
+
+
+def _measure_map():
+    from topo.command.analysis import measure_or_pref
+    measure_or_pref(num_phase=4,num_orientation=4,frequencies=[2.4])
+
+
+def time_stages(script,results_file,density,stages=SCRIPT_STAGES,iterations=20):
+    """
+    Execute the script in __main__ at the given cortex density and
+    time each of the requested stages, writing a dictionary of the
+    times (in seconds) to results_file as JSON.
+
+    Training and settling are reported as the time per iteration;
+    stages that cannot be run (e.g. map measurement when the
+    analysis packages are missing) are left out of the results.
+    """
+    global_params.set_in_context(cortex_density=density)
+    # Class-based models take the density from the model class
+    from topo.submodel.gcal import ModelGCAL
+    ModelGCAL.cortex_density = density
+
+    times = OrderedDict()
+    times['build'] = _timed(lambda: (execfile(script,__main__.__dict__),topo.sim()))
+    topo.sim.run(1) # ensure compilations etc happen outside timing
+
+    if 'train' in stages:
+        times['train'] = _timed(topo.sim.run,iterations)/iterations
+    if 'settle' in stages:
+        times['settle'] = _timed(_settle,iterations)/iterations
+    if 'measure_map' in stages:
+        try:
+            times['measure_map'] = _timed(_measure_map)
+        except ImportError as e:
+            param.main.warning("Skipping map measurement: %s"%e)
+
+    if 'snapshot_save' in stages or 'snapshot_load' in stages:
+        from topo.command import save_snapshot, load_snapshot
+        snapshot_dir = tempfile.mkdtemp()
+        try:
+            snapshot = os.path.join(snapshot_dir,"benchmark.typ")
+            times['snapshot_save'] = _timed(save_snapshot,snapshot)
+            times['snapshot_load'] = _timed(load_snapshot,snapshot)
+        finally:
+            shutil.rmtree(snapshot_dir)
+
+    with open(results_file,'w') as f:
+        json.dump(dict((k,v) for k,v in times.items() if k in stages),f)
+
+
+
+######################################################################################
+### Running the suite
+
+def _topographica_cmd(topographica,*args):
+    return [sys.executable,topographica]+list(args)
+
+
+def _time_startup(topographica):
+    start = default_timer()
+    subprocess.check_call(_topographica_cmd(topographica,'-c','pass'))
+    return default_timer()-start
+
+
+def _run_script_stages(topographica,script,density,stages,iterations):
+    fd,results_file = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    try:
+        cmd = "from topo.tests.benchmarks import time_stages; time_stages(%r,%r,%r,%r,%r)"\
+              %(script,results_file,density,stages,iterations)
+        subprocess.check_call(_topographica_cmd(topographica,'-c',cmd))
+        with open(results_file) as f:
+            return json.load(f)
+    finally:
+        os.remove(results_file)
+
+
+def benchmark_stats(samples):
+    """Summary statistics of the repeated timings of one benchmark."""
+    samples = numpy.asarray(samples,dtype=float)
+    return OrderedDict([('median',float(numpy.median(samples))),
+                        ('mean',float(samples.mean())),
+                        ('stdev',float(samples.std(ddof=1)) if len(samples)>1 else 0.0),
+                        ('min',float(samples.min())),
+                        ('max',float(samples.max()))])
+
+
+def benchmark_key(script,density,stage):
+    if script is None:
+        return stage
+    return "%s:%s:%s"%(os.path.basename(script),density,stage)
+
+
+def run_benchmarks(scripts=BENCHMARK_SCRIPTS,densities=BENCHMARK_DENSITIES,
+                   stages=BENCHMARK_STAGES,repeats=5,iterations=20,
+                   history_file=BENCHMARK_HISTORY,topographica=None):
+    """
+    Run each stage of each script at each density repeats times, each
+    time in a new Topographica process, and append a record with the
+    statistics of every benchmark to history_file.
+
+    Scripts are given relative to the Topographica directory, and
+    topographica is the launcher to run (by default the one running
+    now). Returns the list of new records.
+    """
+    topographica = os.path.abspath(topographica or sys.argv[0])
+    script_stages = [s for s in stages if s in SCRIPT_STAGES]
+
+    samples = OrderedDict()
+    for r in range(repeats):
+        if 'startup' in stages:
+            samples.setdefault(benchmark_key(None,None,'startup'),[]).append(
+                _time_startup(topographica))
+        for script in scripts:
+            script_path = param.resolve_path(script)
+            for density in densities:
+                if not script_stages: continue
+                print "Benchmarking %s at density %s (run %s of %s)"%(script,density,r+1,repeats)
+                times = _run_script_stages(topographica,script_path,density,
+                                           script_stages,iterations)
+                for stage in script_stages:
+                    if stage in times:
+                        samples.setdefault(benchmark_key(script,density,stage),[]).append(times[stage])
+
+    info = {'timestamp':time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'host':socket.gethostname(),
+            'version':list(topo.version),
+            'release':topo.release,
+            'iterations':iterations}
+    records = []
+    for key,values in samples.items():
+        record = dict(info,benchmark=key,samples=values,stats=benchmark_stats(values))
+        records.append(record)
+        print "%-40s %s"%(key,"  ".join("%s=%.4f"%kv for kv in record['stats'].items()))
+
+    ensure_path_exists(os.path.dirname(history_file))
+    with open(history_file,'a') as f:
+        for record in records:
+            f.write(json.dumps(record)+"\n")
+    print "Appended %s benchmarks to %s"%(len(records),history_file)
+    return records
+
+
+
+######################################################################################
+### Regression tracking
+
+def load_benchmark_history(history_file=BENCHMARK_HISTORY):
+    """Return an OrderedDict of benchmark name to its records, oldest first."""
+    history = OrderedDict()
+    with open(history_file) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                history.setdefault(record['benchmark'],[]).append(record)
+    return history
+
+
+def compare_benchmarks(history_file=BENCHMARK_HISTORY,threshold=10.0,window=5,
+                       statistic='median',fail=True):
+    """
+    Compare the latest record of each benchmark in history_file
+    against the earlier ones, flagging a regression when the latest
+    statistic is more than threshold percent above the baseline (the
+    median of that statistic over the previous window records).
+
+    Returns a list of (benchmark, baseline, latest, percent change)
+    for the regressions found; if fail is True, an AssertionError
+    listing them is raised instead (so that a runtests target fails).
+    """
+    regressions = []
+    for key,records in load_benchmark_history(history_file).items():
+        if len(records)<2:
+            print "%-40s no earlier results"%key
+            continue
+        latest = records[-1]['stats'][statistic]
+        baseline = float(numpy.median([r['stats'][statistic] for r in records[-window-1:-1]]))
+        percent_change = 100.0*(latest-baseline)/baseline if baseline>0 else 0.0
+        flag = percent_change>threshold
+        print "%-40s  Before: %.4f s  Now: %.4f s  (%+.1f percent)%s"\
+              %(key,baseline,latest,percent_change,"  REGRESSION" if flag else "")
+        if flag:
+            regressions.append((key,baseline,latest,percent_change))
+
+    if regressions and fail:
+        raise AssertionError("%s benchmarks slowed by more than %s percent: %s"
+                             %(len(regressions),threshold,", ".join(r[0] for r in regressions)))
+    return regressions
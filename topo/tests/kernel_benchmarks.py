@@ -0,0 +1,247 @@
+"""
+Microbenchmarks for the CF projection kernels.
+
+Times the response (dot product), Hebbian learning, trace learning,
+homeostatic learning, outstar learning, L1 divisive normalization
+and joint normalization kernels on their own, for each available
+implementation: the Python plugin versions, the
+weave-optimized (_opt) versions, the Cython versions, and the
+equivalents for SparseCFProjection. Every variant works on
+identical synthetic projections of configurable sheet density, CF
+radius and input sparsity, is checked against the Python plugin
+version, and is reported as time per call and throughput in
+connections per second.
+
+Typical use:
+
+  ./topographica -c "from topo.tests.kernel_benchmarks import run_kernel_benchmarks; run_kernel_benchmarks(density=48,cf_radius=0.25,input_sparsity=0.9)"
+
+Variants whose optimized implementation is not available (e.g.
+because weave cannot be imported) are reported as such, rather
+than silently timing their unoptimized fallback.
+"""
+
+from collections import OrderedDict
+from timeit import default_timer
+
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection, CFPRF_Plugin, CFPLF_Plugin, CFPOF_Plugin
+from topo.base.functionfamily import DotProduct, Hebbian
+from topo.transferfn import DivisiveNormalizeL1
+from topo.misc import inlinec, pyxhandler
+from topo import optimized
+from topo.responsefn.optimized import CFPRF_DotProduct_opt, CFPRF_DotProduct_cyopt
+from topo.learningfn.projfn import CFPLF_Trace, HomeoSynaptic, CFPLF_OutstarHebbian
+from topo.learningfn.optimized import CFPLF_Hebbian_opt, CFPLF_Trace_opt, HomeoSynaptic_opt, \
+     CFPLF_OutstarHebbian_opt
+from topo.transferfn.optimized import CFPOF_DivisiveNormalizeL1_opt
+from topo.sheet import compute_joint_norm_totals
+from topo.sheet.optimized import compute_joint_norm_totals_opt
+from topo.sparse.sparsecf import use_sparse, SparseCFProjection, CFSPRF_Plugin, \
+     CFSPLF_Plugin, CFSPOF_Plugin, CFPRF_DotProduct_Sparse, CFPRF_DotProduct_Sparse_opt, \
+     CFPLF_Hebbian_Sparse, CFPLF_Hebbian_Sparse_opt, CFPOF_DivisiveNormalizeL1_Sparse, \
+     compute_sparse_joint_norm_totals
+
+
+cython_available = not optimized.CFPRF_DotProduct_cython.__module__.endswith('unoptimized')
+
+
+# For each kernel, the variants as (name, sparse, available, factory).
+# The first variant is the reference the others are checked against.
+KERNELS = OrderedDict([
+    ('response',[
+        ('python',False,True,lambda: CFPRF_Plugin(single_cf_fn=DotProduct())),
+        ('weave',False,inlinec.optimized,CFPRF_DotProduct_opt),
+        ('cython',False,cython_available,optimized.CFPRF_DotProduct_cython),
+        ('cyopt',False,pyxhandler.pyximported,CFPRF_DotProduct_cyopt),
+        ('sparse_python',True,use_sparse,CFSPRF_Plugin),
+        ('sparse',True,use_sparse,CFPRF_DotProduct_Sparse.instance),
+        ('sparse_opt',True,use_sparse,CFPRF_DotProduct_Sparse_opt.instance)]),
+    ('learning',[
+        ('python',False,True,lambda: CFPLF_Plugin(single_cf_fn=Hebbian())),
+        ('weave',False,inlinec.optimized,CFPLF_Hebbian_opt),
+        ('cython',False,cython_available,optimized.CFPLF_Hebbian_cython),
+        ('sparse_python',True,use_sparse,CFSPLF_Plugin),
+        ('sparse',True,use_sparse,CFPLF_Hebbian_Sparse.instance),
+        ('sparse_opt',True,use_sparse,CFPLF_Hebbian_Sparse_opt.instance)]),
+    ('trace',[
+        ('python',False,True,CFPLF_Trace),
+        ('weave',False,inlinec.optimized,CFPLF_Trace_opt),
+        ('cython',False,cython_available,optimized.CFPLF_Trace_cython)]),
+    ('homeosynaptic',[
+        ('python',False,True,HomeoSynaptic),
+        ('weave',False,inlinec.optimized,HomeoSynaptic_opt),
+        ('cython',False,cython_available,optimized.HomeoSynaptic_cython)]),
+    ('outstar',[
+        ('python',False,True,CFPLF_OutstarHebbian),
+        ('weave',False,inlinec.optimized,CFPLF_OutstarHebbian_opt),
+        ('cython',False,cython_available,optimized.CFPLF_OutstarHebbian_cython)]),
+    ('normalize',[
+        ('python',False,True,lambda: CFPOF_Plugin(single_cf_fn=DivisiveNormalizeL1())),
+        ('weave',False,inlinec.optimized,CFPOF_DivisiveNormalizeL1_opt),
+        ('cython',False,cython_available,optimized.CFPOF_DivisiveNormalize_L1_cython),
+        ('sparse_python',True,use_sparse,lambda: CFSPOF_Plugin(single_cf_fn=DivisiveNormalizeL1())),
+        ('sparse',True,use_sparse,CFPOF_DivisiveNormalizeL1_Sparse.instance)]),
+    ('joint_norm',[
+        ('python',False,True,lambda: compute_joint_norm_totals),
+        ('weave',False,inlinec.optimized,lambda: compute_joint_norm_totals_opt),
+        ('cython',False,cython_available,lambda: optimized.compute_joint_norm_totals_cython),
+        ('sparse',True,use_sparse,lambda: compute_sparse_joint_norm_totals)])])
+
+
+
+def kernel_projections(sparse=False,density=48,cf_radius=0.25,input_sparsity=0.0,
+                       n_projections=2,seed=0,cf_shape=None):
+    """
+    Return a list of n_projections projections between two new sheets
+    of the given density, with CFs of the given radius and cf_shape
+    (the CFProjection default if None).
+
+    The weights, the input activity and the destination activity are
+    uniform random values, drawn from the given seed so that dense
+    and sparse projections made with the same arguments are
+    identical. A fraction input_sparsity of the input and destination
+    units is set to zero. The learning rate is 1.0.
+    """
+    sim = Simulation()
+    for name in ('Src','Dest'):
+        sim[name] = CFSheet(nominal_density=density,nominal_bounds=BoundingBox(radius=0.5))
+    projection_type = SparseCFProjection if sparse else CFProjection
+    shape = {} if cf_shape is None else dict(cf_shape=cf_shape)
+    projs = [sim.connect('Src','Dest',name='Kernel%d'%i,connection_type=projection_type,
+                         nominal_bounds_template=BoundingBox(radius=cf_radius),
+                         weights_generator=imagen.Constant(),learning_rate=1.0,
+                         apply_output_fns_init=False,**shape)
+             for i in range(n_projections)]
+
+    rs = numpy.random.RandomState(seed)
+    for proj in projs:
+        blocks = [rs.uniform(0.1,1.0,cf.mask.shape)*cf.mask for cf in proj.flatcfs]
+        if sparse:
+            proj.set_cf_blocks(blocks)
+        else:
+            for cf,block in zip(proj.flatcfs,blocks):
+                cf.weights[:] = block
+    for sheet in (sim['Src'],sim['Dest']):
+        activity = rs.uniform(size=sheet.activity.shape)
+        activity[rs.uniform(size=activity.shape)<input_sparsity] = 0.0
+        sheet.activity[:] = activity
+    for proj in projs:
+        proj.input_buffer = proj.src.activity
+    return projs
+
+
+def _reset_norm_totals(projs):
+    for proj in projs:
+        if hasattr(proj,'has_norm_total'):
+            proj.has_norm_total = False
+            proj.learned_units = None
+        else:
+            for cf in proj.flatcfs:
+                del cf.norm_total
+
+
+# The dense kernels skip the CFs of inactive units when learning and
+# normalizing, while the sparse ones may not, so weights and norm
+# totals are only compared for the active units.
+
+def _weights(proj):
+    active = proj.dest.activity.ravel()!=0
+    return numpy.concatenate([numpy.asarray(cf.weights).ravel()
+                              for cf,a in zip(proj.flatcfs,active) if a])
+
+
+def _norm_totals(proj):
+    active = proj.dest.activity.ravel()!=0
+    if hasattr(proj,'has_norm_total'):
+        return proj.norm_total.ravel()[active]
+    return numpy.array([cf.norm_total for cf,a in zip(proj.flatcfs,active) if a])
+
+
+def _run_kernel(kernel,fn,projs):
+    """Call the kernel once, returning the array it computes."""
+    proj = projs[0]
+    if kernel=='response':
+        proj.response_fn = fn
+        proj.activate(proj.src.activity)
+        return proj.activity.copy()
+    elif kernel in ('learning','trace','homeosynaptic'):
+        proj.learning_fn = fn
+        proj.learn()
+        return _weights(proj)
+    elif kernel=='outstar':
+        proj.learning_fn = fn
+        proj.learn()
+        return numpy.concatenate([_weights(proj),fn.outstar_wsum.ravel()])
+    elif kernel=='normalize':
+        proj.weights_output_fns = [fn]
+        proj.apply_learn_output_fns()
+        return _weights(proj)
+    elif kernel=='joint_norm':
+        fn(projs,True)
+        return _norm_totals(proj)
+    raise ValueError("Unknown kernel %r"%kernel)
+
+
+def time_kernel(kernel,fn,projs,repeats=10):
+    """
+    Return the result of the first call of the kernel on projs, and
+    the mean time per call over repeats calls. Norm totals are reset
+    before each call, outside the timing, so that every call does the
+    full amount of work.
+    """
+    total = 0.0
+    result = None
+    for r in range(repeats):
+        _reset_norm_totals(projs)
+        start = default_timer()
+        out = _run_kernel(kernel,fn,projs)
+        total += default_timer()-start
+        if result is None:
+            result = out
+    return result,total/repeats
+
+
+def run_kernel_benchmarks(kernels=None,density=48,cf_radius=0.25,input_sparsity=0.0,
+                          repeats=10,rtol=1e-4,atol=1e-6,seed=0,cf_shape=None):
+    """
+    Time each available variant of each kernel (all of KERNELS by
+    default) and check it against the first, Python plugin variant.
+    A cf_shape such as imagen.Disk() gives CFs with masked-out
+    weights, which the default square CFs do not exercise.
+
+    Throughput counts every connection of the projections involved
+    per call, including those skipped because their input or unit is
+    inactive, so that variants exploiting sparsity show a higher
+    rate. Returns a list of dictionaries, one per variant.
+    """
+    results = []
+    for kernel in (kernels or KERNELS.keys()):
+        n_projections = 2 if kernel=='joint_norm' else 1
+        reference = None
+        for name,sparse,available,factory in KERNELS[kernel]:
+            row = OrderedDict([('kernel',kernel),('variant',name)])
+            results.append(row)
+            if not available:
+                row['available'] = False
+                print "%-13s %-14s not available"%(kernel,name)
+                continue
+            projs = kernel_projections(sparse,density,cf_radius,input_sparsity,
+                                       n_projections,seed,cf_shape)
+            conns = sum(CFProjection.n_conns(p) for p in projs)
+            result,seconds = time_kernel(kernel,factory(),projs,repeats)
+            if reference is None:
+                reference = result
+            row.update(available=True,seconds=seconds,connections=conns,
+                       connections_per_second=conns/seconds if seconds>0 else float('inf'),
+                       max_difference=float(numpy.abs(result-reference).max()),
+                       equivalent=bool(numpy.allclose(result,reference,rtol=rtol,atol=atol)))
+            print "%-13s %-14s %10.6f s %12.4g conn/s  max diff %.2g%s"\
+                  %(kernel,name,seconds,row['connections_per_second'],row['max_difference'],
+                    "" if row['equivalent'] else "  MISMATCH")
+    return results
@@ -178,6 +178,12 @@ for script in STARTUPSPEEDSCRIPTS:
     speedtarget['startupspeedtests'].append(topographica_script +  ''' -c "from topo.tests.test_script import compare_startup_speed_data;compare_startup_speed_data(script=%(script_path)s)"'''%dict(script_path=repr(script_path)))
 
 
+# Repeated stage-by-stage timings of several scripts and densities,
+# with history and regression checks (see benchmarks.py).
+speedtarget['benchmarks'] = []
+speedtarget['benchmarks'].append(topographica_script + ''' -c "from topo.tests.benchmarks import run_benchmarks, compare_benchmarks; run_benchmarks(); compare_benchmarks()"''')
+
+
 
 ##### snapshot-tests
 target['snapshots'] = []
@@ -0,0 +1,84 @@
+import unittest
+import os
+import sys
+import glob
+import json
+import shutil
+import tempfile
+
+from param import normalize_path
+
+import topo
+from topo.command import run_batch
+
+# A small network for run_batch to build
+SCRIPT = """
+import topo
+from holoviews import BoundingBox
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection
+from topo.base.generatorsheet import GeneratorSheet
+
+topo.sim = Simulation()
+topo.sim['Retina'] = GeneratorSheet(nominal_density=6,nominal_bounds=BoundingBox(radius=0.5),
+                                    period=1.0,phase=0.05)
+topo.sim['V1'] = CFSheet(nominal_density=4,nominal_bounds=BoundingBox(radius=0.5))
+topo.sim.connect('Retina','V1',delay=0.05,connection_type=CFProjection,
+                 nominal_bounds_template=BoundingBox(radius=0.3))
+"""
+
+
+class TestBatchStatus(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.script = os.path.join(self.dir,'statustest.ty')
+        with open(self.script,'w') as f:
+            f.write(SCRIPT)
+        self.stdout = sys.stdout
+        self.prefix = normalize_path.prefix
+
+    def tearDown(self):
+        sys.stdout = self.stdout
+        normalize_path.prefix = self.prefix
+        shutil.rmtree(self.dir)
+
+    def run_batch(self,status_format):
+        run_batch(self.script,output_directory=os.path.join(self.dir,'Output'),
+                  times=[2,4],status_format=status_format,analysis_fn=lambda: None,
+                  snapshot=False,vc_info=False,save_global_params=False,
+                  save_script_repr=None,progress_bar='disabled',progress_interval=1)
+        filename = 'status.json' if status_format=='json' else 'status.prom'
+        paths = glob.glob(os.path.join(self.dir,'Output','*',filename))
+        self.assertEqual(len(paths),1)
+        # Replaced atomically, leaving no temporary file behind
+        self.assertFalse(os.path.exists(paths[0]+'.tmp'))
+        with open(paths[0]) as f:
+            return f.read()
+
+    def test_json(self):
+        status = json.loads(self.run_batch('json'))
+        self.assertEqual(status['state'],'finished')
+        self.assertEqual(status['sim_time'],4.0)
+        self.assertEqual(status['target_time'],4.0)
+        self.assertEqual(status['progress'],1.0)
+        self.assertEqual(status['last_checkpoint_sim_time'],4.0)
+        self.assertEqual(status['connections'],topo.sim['V1'].projections().values()[0].n_conns())
+        self.assertTrue(status['connections']>0)
+        self.assertTrue(status['run'].endswith('statustest_'))
+        self.assertTrue(status['mean_iterations_per_second']>0)
+
+    def test_prometheus(self):
+        lines = self.run_batch('prometheus').splitlines()
+        samples = dict(line.split(' ') for line in lines if not line.startswith('#'))
+        run = [name for name in samples if name.startswith('topographica_sim_time')][0]
+        labels = run[len('topographica_sim_time'):]
+        self.assertTrue(labels.startswith('{run="'))
+        self.assertEqual(float(samples['topographica_state_finished'+labels]),1.0)
+        self.assertEqual(float(samples['topographica_sim_time'+labels]),4.0)
+        self.assertEqual(float(samples['topographica_last_checkpoint_sim_time'+labels]),4.0)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,96 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFProjection,CFSheet
+from topo.base.arrayutil import centroid,centroids,pack_cfs
+from topo.analysis.command import cf_cogs
+
+
+class TestCentroids(unittest.TestCase):
+
+    def test_centroids_match_centroid(self):
+        """Compare the vectorized centroids() with centroid() on each array"""
+        stack = numpy.random.RandomState(1).uniform(size=(20,7,5))
+        row_centroids,col_centroids = centroids(stack)
+        for i in range(len(stack)):
+            r,c = centroid(stack[i])
+            self.assertAlmostEqual(r,row_centroids[i])
+            self.assertAlmostEqual(c,col_centroids[i])
+
+    def test_padding_does_not_alter_centroids(self):
+        stack = numpy.random.RandomState(2).uniform(size=(4,3,3))
+        padded = numpy.zeros((4,6,8))
+        padded[:,:3,:3] = stack
+        numpy.testing.assert_array_almost_equal(centroids(stack),centroids(padded))
+
+
+
+class TestCFCoG(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = Simulation()
+        self.sim['Src'] = CFSheet(nominal_density=12,nominal_bounds=BoundingBox(radius=0.5))
+        self.sim['Dest'] = CFSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5))
+        # Edge CFs are cropped, so the CFs have several different shapes
+        self.sim.connect('Src','Dest',name='Wide',connection_type=CFProjection,
+                         nominal_bounds_template=BoundingBox(radius=0.3),
+                         weights_generator=imagen.random.UniformRandom())
+        self.sim.connect('Src','Dest',name='Narrow',connection_type=CFProjection,
+                         nominal_bounds_template=BoundingBox(radius=0.1),
+                         weights_generator=imagen.random.UniformRandom())
+
+    def _loop_cog(self,proj):
+        """The original unit-by-unit CoG calculation from measure_cog."""
+        rows,cols = proj.dest.activity.shape
+        xcog = numpy.zeros((rows,cols),numpy.float64)
+        ycog = numpy.zeros((rows,cols),numpy.float64)
+        for r in xrange(rows):
+            for c in xrange(cols):
+                cf = proj.cfs[r,c]
+                r1,r2,c1,c2 = cf.input_sheet_slice
+                row_centroid,col_centroid = centroid(cf.weights)
+                xcog[r][c],ycog[r][c] = proj.src.matrix2sheet(r1+row_centroid+0.5,
+                                                              c1+col_centroid+0.5)
+        return xcog,ycog
+
+    def test_cf_cogs_match_loop(self):
+        projs = [self.sim['Dest'].projections()[name] for name in ('Wide','Narrow')]
+        for proj,(xcog,ycog) in zip(projs,cf_cogs(projs)):
+            loop_xcog,loop_ycog = self._loop_cog(proj)
+            numpy.testing.assert_array_almost_equal(xcog,loop_xcog,decimal=5)
+            numpy.testing.assert_array_almost_equal(ycog,loop_ycog,decimal=5)
+
+    def test_cf_cogs_chunks(self):
+        """Packing the CFs a few at a time should not change the CoGs"""
+        projs = [self.sim['Dest'].projections()[name] for name in ('Wide','Narrow')]
+        for (xcog,ycog),(chunk_xcog,chunk_ycog) in zip(cf_cogs(projs),cf_cogs(projs,chunk_size=7)):
+            numpy.testing.assert_array_equal(xcog,chunk_xcog)
+            numpy.testing.assert_array_equal(ycog,chunk_ycog)
+
+    def test_pack_cfs(self):
+        """Each CF's weights, shape and offset, zero-padded; null CFs left empty"""
+        cfs = list(self.sim['Dest'].projections()['Wide'].flatcfs[:10])+[None]
+        packed,shapes,offsets = pack_cfs(cfs)
+        self.assertEqual(packed.shape,(11,)+tuple(shapes.max(axis=0)))
+        for i,cf in enumerate(cfs[:-1]):
+            rows,cols = cf.weights.shape
+            self.assertEqual(tuple(shapes[i]),(rows,cols))
+            self.assertEqual(tuple(offsets[i]),tuple(cf.input_sheet_slice[[0,2]]))
+            numpy.testing.assert_array_equal(packed[i,:rows,:cols],cf.weights)
+            self.assertEqual(packed[i].sum(),cf.weights.sum(dtype=numpy.float64))
+        self.assertEqual(tuple(shapes[-1]),(0,0))
+        self.assertFalse(packed[-1].any())
+        # Packing into a reused buffer clears the previous contents
+        buffer = numpy.ones((20,)+packed.shape[1:],dtype=numpy.float32)
+        into,_,_ = pack_cfs(cfs,out=buffer)
+        self.assertEqual(len(into),11)
+        numpy.testing.assert_array_almost_equal(into,packed)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
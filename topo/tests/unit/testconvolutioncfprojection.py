@@ -0,0 +1,109 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFIter, CFPRF_Plugin, CFPLF_Plugin, CFPLF_Identity
+from topo.projection import SharedWeightCFProjection, ConvolutionCFProjection, _correlate_valid
+from topo.responsefn.projfn import CFPRF_EuclideanDistance
+from topo.learningfn import Oja
+
+
+def shared_weight_sim(dest_density,connection_type,**params):
+    sim = Simulation()
+    sim['Src'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+    sim['Dest'] = CFSheet(nominal_density=dest_density,nominal_bounds=BoundingBox(radius=0.5))
+    proj = sim.connect('Src','Dest',name='Shared',connection_type=connection_type,
+                       nominal_bounds_template=BoundingBox(radius=0.25),
+                       weights_generator=imagen.Gaussian(aspect_ratio=2.0,size=0.2,
+                                                         orientation=0.5),
+                       **params)
+    return sim,proj
+
+
+
+class TestConvolutionCFProjection(unittest.TestCase):
+
+    def setUp(self):
+        self.input = numpy.random.RandomState(3).uniform(size=(10,10))
+
+    def test_response_matches_shared_weight_cfs(self):
+        """Edge CFs are cropped, so this also checks the zero padding"""
+        for dest_density in (10,5):
+            sim,ref = shared_weight_sim(dest_density,SharedWeightCFProjection)
+            ref.activate(self.input)
+            for method in ('direct','fft'):
+                sim,proj = shared_weight_sim(dest_density,ConvolutionCFProjection,
+                                             convolution_method=method)
+                proj.activate(self.input)
+                numpy.testing.assert_array_almost_equal(proj.activity,ref.activity)
+
+    def test_cfs_created_on_access(self):
+        sim,ref = shared_weight_sim(10,SharedWeightCFProjection)
+        n_conns = ref.n_conns()
+        slices = [list(cf.input_sheet_slice) for cf in ref.flatcfs]
+        sim,proj = shared_weight_sim(10,ConvolutionCFProjection,learning_rate=0.5)
+        proj.activate(self.input)
+        proj.learn()
+        self.assertEqual(proj.n_conns(),n_conns)
+        self.assertTrue(proj._cfs is None)
+        self.assertEqual(proj.cfs.shape,ref.cfs.shape)
+        self.assertEqual([list(cf.input_sheet_slice) for cf in proj.flatcfs],slices)
+
+    def test_learning_accumulates_hebbian_updates(self):
+        sim,ref = shared_weight_sim(10,SharedWeightCFProjection)
+        activity = numpy.random.RandomState(4).uniform(size=ref.dest.activity.shape)
+        ref.dest.activity[:] = activity
+        rate = 0.5/ref.n_units
+        for cf,i in CFIter(ref)():
+            cf.weights += rate*activity.flat[i]*cf.get_input_matrix(self.input)
+        ref.shared_cf.weights *= ref.shared_cf.mask
+
+        for method in ('direct','fft'):
+            sim,proj = shared_weight_sim(10,ConvolutionCFProjection,learning_rate=0.5,
+                                         convolution_method=method)
+            proj.activate(self.input)
+            proj.dest.activity[:] = activity
+            proj.learn()
+            numpy.testing.assert_array_almost_equal(proj.shared_cf.weights,
+                                                    ref.shared_cf.weights)
+            # Every unit's CF is a view of the shared weights
+            numpy.testing.assert_array_equal(proj.cfs[0,0].weights,
+                                             proj.shared_cf.weights[-proj.cfs[0,0].weights.shape[0]:,
+                                                                    -proj.cfs[0,0].weights.shape[1]:])
+
+    def test_unsupported_functions_rejected(self):
+        sim,proj = shared_weight_sim(10,ConvolutionCFProjection,learning_rate=0.5,
+                                     response_fn=CFPRF_EuclideanDistance())
+        self.assertRaises(ValueError,proj.activate,self.input)
+        proj.response_fn = CFPRF_Plugin()
+        proj.activate(self.input)
+        proj.learning_fn = CFPLF_Plugin(single_cf_fn=Oja())
+        self.assertRaises(ValueError,proj.learn)
+
+    def test_identity_learning_fn(self):
+        sim,proj = shared_weight_sim(10,ConvolutionCFProjection,learning_rate=0.5,
+                                     learning_fn=CFPLF_Identity())
+        weights = proj.shared_cf.weights.copy()
+        proj.activate(self.input)
+        proj.dest.activity[:] = 1.0
+        proj.learn()
+        numpy.testing.assert_array_equal(proj.shared_cf.weights,weights)
+
+    def test_correlate_valid(self):
+        rng = numpy.random.RandomState(5)
+        a = rng.uniform(size=(9,12))
+        # Kernels smaller and larger than the output
+        for b in (rng.uniform(size=(3,4)),rng.uniform(size=(6,8))):
+            expected = numpy.array([[(b*a[i:i+b.shape[0],j:j+b.shape[1]]).sum()
+                                     for j in range(a.shape[1]-b.shape[1]+1)]
+                                    for i in range(a.shape[0]-b.shape[0]+1)])
+            numpy.testing.assert_array_almost_equal(_correlate_valid(a,b),expected)
+            numpy.testing.assert_array_almost_equal(_correlate_valid(a,b,fft=True),expected)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
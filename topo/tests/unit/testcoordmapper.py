@@ -0,0 +1,83 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet
+from topo.base.functionfamily import IdentityMF
+from topo.projection import OneToOneProjection
+from topo.misc.util import rowcol2idx
+from topo.coordmapper import ConstantMapper, Pipeline, Grid, Polar2Cartesian, \
+     Cartesian2Polar, AffineTransform, Translate2dMat, Rotate2dMat, Rotate2d, \
+     MagnifyingMapper, ReducingMapper, OttesSCMotorMapper, OttesSCSenseMapper, Jitter
+
+
+class TestVectorizedMappers(unittest.TestCase):
+
+    def setUp(self):
+        rs = numpy.random.RandomState(5)
+        self.x = rs.uniform(-0.5,0.5,(6,7))
+        self.y = rs.uniform(-0.5,0.5,(6,7))
+
+    def _check(self,mapper):
+        """Mapping whole arrays should match mapping each point"""
+        self.assertTrue(mapper.vectorized)
+        x_out,y_out = mapper.map_arrays(self.x,self.y)
+        self.assertEqual(x_out.shape,self.x.shape)
+        for x,y,xo,yo in zip(self.x.flat,self.y.flat,x_out.flat,y_out.flat):
+            xp,yp = mapper(x,y)
+            self.assertAlmostEqual(xp,xo)
+            self.assertAlmostEqual(yp,yo)
+
+    def test_mappers(self):
+        for mapper in (IdentityMF(),
+                       ConstantMapper(x_cons=0.1,y_cons=-0.2),
+                       Grid(xdensity=3,ydensity=4),
+                       Polar2Cartesian(),Polar2Cartesian(degrees=False),
+                       Cartesian2Polar(),Cartesian2Polar(negative_radii=True),
+                       AffineTransform(matrix=Translate2dMat(0.1,0.2)*Rotate2dMat(0.3)),
+                       MagnifyingMapper(k=2.0),ReducingMapper(k=2.0),
+                       MagnifyingMapper(k=1.5,remap_dimension='xy'),
+                       OttesSCMotorMapper(),OttesSCSenseMapper(),
+                       Pipeline(mappers=[Rotate2d(angle=0.5),MagnifyingMapper()])):
+            self._check(mapper)
+
+    def test_unvectorized_mapper_applied_per_point(self):
+        mapper = Jitter(scale=0.0)
+        self.assertFalse(mapper.vectorized)
+        self.assertFalse(Pipeline(mappers=[IdentityMF(),mapper]).vectorized)
+        x_out,y_out = mapper.map_arrays(self.x,self.y)
+        numpy.testing.assert_array_almost_equal(x_out,self.x)
+        numpy.testing.assert_array_almost_equal(y_out,self.y)
+
+
+
+class TestOneToOneProjection(unittest.TestCase):
+
+    def test_src_idxs_match_per_unit_mapping(self):
+        sim = Simulation()
+        sim['Src'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        sim['Dest'] = CFSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5))
+        mapper = MagnifyingMapper(k=2.0,in_range=0.4,out_range=0.6)
+        proj = sim.connect('Src','Dest',name='OneToOne',connection_type=OneToOneProjection,
+                           coord_mapper=mapper)
+
+        src, dest = sim['Src'], sim['Dest']
+        dest_idxs, src_idxs = [], []
+        for i,(y,x) in enumerate((y,x) for y in reversed(dest.sheet_rows())
+                                 for x in dest.sheet_cols()):
+            r,c = src.sheet2matrixidx(*mapper(x,y))
+            if 0 <= r < src.activity.shape[0] and 0 <= c < src.activity.shape[1]:
+                dest_idxs.append(i)
+                src_idxs.append(rowcol2idx(r,c,src.activity.shape))
+
+        # Some of the dest units map outside the src sheet
+        self.assertTrue(0 < len(dest_idxs) < dest.activity.size)
+        numpy.testing.assert_array_equal(proj.dest_idxs,dest_idxs)
+        numpy.testing.assert_array_equal(proj.src_idxs,src_idxs)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,58 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+import topo
+from topo.base.cf import CFSheet, CFProjection
+from topo.base.generatorsheet import GeneratorSheet
+from topo.sheet import SettlingCFSheet
+from topo.misc.distributed import run_distributed
+
+
+def build():
+    """Two pathways, sharing a second-level sheet"""
+    bounds = BoundingBox(radius=0.5)
+    for eye in ('Left','Right'):
+        topo.sim[eye+'Retina'] = GeneratorSheet(nominal_density=8,nominal_bounds=bounds,period=1.0,
+                                                phase=0.05,input_generator=imagen.Gaussian(size=0.2))
+        topo.sim[eye+'V1'] = SettlingCFSheet(nominal_density=8,nominal_bounds=bounds,tsettle=2)
+        topo.sim.connect(eye+'Retina',eye+'V1',name='Afferent',delay=0.05,
+                         connection_type=CFProjection,learning_rate=0.5)
+        topo.sim.connect(eye+'V1',eye+'V1',name='Lateral',delay=0.01,
+                         connection_type=CFProjection,learning_rate=0.5)
+    topo.sim['V2'] = CFSheet(nominal_density=8,nominal_bounds=bounds)
+    for eye in ('Left','Right'):
+        topo.sim.connect(eye+'V1','V2',name=eye+'Afferent',delay=0.05,
+                         connection_type=CFProjection,learning_rate=0.5)
+
+
+def lateral_weights(sim):
+    return dict((name,sim[name].projections('Lateral').cfs[3,3].weights.copy())
+                for name in sim.objects() if name.endswith('V1'))
+
+
+
+class TestDistributed(unittest.TestCase):
+
+    def test_matches_single_process(self):
+        build()
+        topo.sim.run(2.0)
+        serial_weights = lateral_weights(topo.sim)
+
+        results = run_distributed(build,[['LeftRetina','LeftV1'],['RightRetina','RightV1'],['V2']],
+                                  2.0,collect=lateral_weights)
+        self.assertEqual([sorted(activities) for activities,weights in results],
+                         [['LeftRetina','LeftV1'],['RightRetina','RightV1'],['V2']])
+        for activities,weights in results:
+            for name,activity in activities.items():
+                numpy.testing.assert_array_equal(activity,topo.sim[name].activity)
+            for name,w in weights.items():
+                numpy.testing.assert_array_equal(w,serial_weights[name])
+        self.assertTrue(results[2][0]['V2'].any())
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,163 @@
+import unittest
+import numpy
+import tempfile
+import shutil
+import pickle
+from collections import OrderedDict
+
+from holoviews import BoundingBox
+import imagen
+import numbergen
+
+from topo.base.simulation import Simulation
+from topo.base.generatorsheet import GeneratorSheet, ChannelGeneratorSheet, render_pattern_store, \
+     _random_stream_states, _set_random_stream_states
+
+
+def gaussian_sim(**params):
+    sim = Simulation()
+    sim['GS'] = GeneratorSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5),
+                               period=1.0,phase=0.05,
+                               input_generator=imagen.Gaussian(
+                                   x=numbergen.UniformRandom(lbound=-0.4,ubound=0.4,seed=3),
+                                   orientation=numbergen.UniformRandom(ubound=3.14,seed=4)),
+                               **params)
+    return sim
+
+
+def record_activities(sim,steps=6,push_before=None):
+    """
+    Run the simulation, recording each pattern of its GeneratorSheet.
+    If push_before is given, another input_generator is pushed,
+    replaced and popped before that step, as when measuring maps.
+    """
+    activities = []
+    for i in range(steps):
+        if i==push_before:
+            sim['GS'].push_input_generator()
+            sim['GS'].set_input_generator(imagen.Constant(scale=0.5))
+            sim['GS'].pop_input_generator()
+        sim.run(1.0)
+        activities.append(sim['GS'].activity.copy())
+    sim['GS'].stop_prefetch()
+    return activities
+
+
+
+class TestGeneratorSheetPrefetch(unittest.TestCase):
+
+    def test_prefetched_patterns_match(self):
+        """Prefetched patterns should be those generated at the presentation times"""
+        for expected,prefetched in zip(record_activities(gaussian_sim()),
+                                       record_activities(gaussian_sim(prefetch=3))):
+            numpy.testing.assert_array_equal(expected,prefetched)
+
+    def test_push_pop_continues_random_streams(self):
+        """Pushing and popping mid-run should not replay patterns already presented"""
+        expected = record_activities(gaussian_sim(),steps=8)
+        for push_before in (1,4):
+            prefetched = record_activities(gaussian_sim(prefetch=3),steps=8,push_before=push_before)
+            for a,b in zip(expected,prefetched):
+                numpy.testing.assert_array_equal(a,b)
+
+    def test_random_stream_states(self):
+        """Only the states of the random streams are passed back from the workers"""
+        def composite():
+            return imagen.Composite(generators=[
+                imagen.Gaussian(x=numbergen.UniformRandom(seed=1)),
+                imagen.Gaussian(y=numbergen.UniformRandom(seed=2),
+                                orientation=numbergen.UniformRandom(seed=3))])
+        original = composite()
+        copy = pickle.loads(pickle.dumps(original))
+        for generator in copy.generators:
+            generator.x,generator.y,generator.orientation
+        states = _random_stream_states(copy)
+        self.assertEqual([t for t,state in states],[numbergen.UniformRandom]*3)
+        _set_random_stream_states(original,states)
+        self.assertEqual([(g.x,g.y,g.orientation) for g in original.generators],
+                         [(g.x,g.y,g.orientation) for g in copy.generators])
+
+    def test_new_generator_restarts_prefetch(self):
+        sim = Simulation()
+        sim['GS'] = GeneratorSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5),
+                                   prefetch=2)
+        sim.run(2.0)
+        self.assertTrue(sim['GS']._prefetcher is not None)
+        sim['GS'].set_input_generator(imagen.Constant(scale=0.5))
+        self.assertTrue(sim['GS']._prefetcher is None)
+        sim.run(1.0)
+        numpy.testing.assert_array_equal(sim['GS'].activity,0.5)
+        sim['GS'].stop_prefetch()
+
+
+
+class TestPatternStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_stored_patterns_match(self):
+        """Patterns read from the store should match the generated ones"""
+        store = render_pattern_store(gaussian_sim(),self.path,6)
+        self.assertEqual(store.sheet_names(),['GS'])
+        self.assertEqual(len(store.times('GS')),6)
+
+        expected_activities = record_activities(gaussian_sim())
+        sim = gaussian_sim(pattern_store=store)
+        sim['GS'].set_input_generator(imagen.Constant(scale=0.5))
+        for expected,stored in zip(expected_activities,record_activities(sim)):
+            numpy.testing.assert_array_equal(expected,stored)
+        # Beyond the stored times the input_generator is used
+        sim.run(1.0)
+        numpy.testing.assert_array_equal(sim['GS'].activity,0.5)
+
+
+
+class ThreeChannels(imagen.Constant):
+    """Constant pattern split over three channels of different strength."""
+
+    def num_channels(self):
+        return 3
+
+    def channels(self, use_cached=False, **params_to_override):
+        channels = [self(**params_to_override)*f for f in (0.2,0.4,0.6)]
+        return OrderedDict([('Mean',sum(channels)/3.0)]+list(enumerate(channels)))
+
+
+
+class TestChannelGeneratorSheet(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = Simulation()
+        self.sheet = ChannelGeneratorSheet(nominal_density=4,nominal_bounds=BoundingBox(radius=0.5),
+                                           input_generator=ThreeChannels(),
+                                           constant_mean_total_channels_output=0.2)
+        self.sim['CGS'] = self.sheet
+        self.sent = []
+        self.sheet.send_output = lambda src_port=None,data=None,deep_copy=True: \
+            self.sent.append((src_port,data))
+
+    def test_channels(self):
+        self.sheet.generate()
+        self.assertEqual(self.sheet.src_ports,['Activity','Activity0','Activity1','Activity2'])
+        self.assertEqual(self.sheet._channel_data.shape,(3,)+self.sheet.activity.shape)
+        # Mean channel value rescaled from 0.4 to 0.2
+        for i,f in enumerate((0.2,0.4,0.6)):
+            numpy.testing.assert_array_almost_equal(self.sheet._channel_data[i],f*1.5/3)
+
+    def test_channel_events_share_readonly_buffer(self):
+        self.sheet.generate()
+        channel_data = [data for port,data in self.sent if port!='Activity']
+        self.assertEqual(len(channel_data),3)
+        for data in channel_data:
+            self.assertFalse(data.flags.writeable)
+            self.assertTrue(data.base is channel_data[0].base)
+            self.assertFalse(numpy.may_share_memory(data,self.sheet._channel_data))
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,30 @@
+import unittest
+
+import imagen
+
+from topo.tests.kernel_benchmarks import KERNELS, run_kernel_benchmarks
+
+
+class TestKernelBenchmarks(unittest.TestCase):
+
+    def test_available_variants_are_equivalent(self):
+        results = run_kernel_benchmarks(density=10,cf_radius=0.2,input_sparsity=0.5,repeats=1)
+        self.assertEqual(len(results),sum(len(v) for v in KERNELS.values()))
+        for row in results:
+            if row['available']:
+                self.assertTrue(row['equivalent'],"%(kernel)s %(variant)s"%row)
+                self.assertTrue(row['connections_per_second']>0)
+        # The Python plugin versions are always available
+        self.assertTrue(all(row['available'] for row in results if row['variant']=='python'))
+
+    def test_masked_cfs_are_equivalent(self):
+        results = run_kernel_benchmarks(density=10,cf_radius=0.2,input_sparsity=0.5,repeats=1,
+                                        cf_shape=imagen.Disk(smoothing=0.0,size=0.4))
+        for row in results:
+            if row['available']:
+                self.assertTrue(row['equivalent'],"%(kernel)s %(variant)s"%row)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,95 @@
+import unittest
+
+import param
+
+from topo.misc import inlinec
+from topo.misc.precompile import OPTIMIZED_MODULES, _run
+
+
+class TestPrecompile(unittest.TestCase):
+
+    def setUp(self):
+        for module in OPTIMIZED_MODULES:
+            __import__(module)
+
+    def test_components_registered(self):
+        self.assertTrue('topo.responsefn.optimized.CFPRF_DotProduct_opt' in inlinec.optimized_components)
+        self.assertTrue('topo.sheet.optimized.compute_joint_norm_totals_opt' in inlinec.optimized_components)
+
+    def test_every_kernel_is_run(self):
+        """The unoptimized equivalents take the same arguments, and run without weave"""
+        for name,(optimized,unoptimized) in inlinec.optimized_components.items():
+            ran = _run(name,unoptimized)
+            if name.endswith('SettlingCFSheet_Opt'):
+                self.assertFalse(ran)
+            else:
+                self.assertTrue(ran,name)
+
+
+
+class TestFallback(unittest.TestCase):
+    """Components switch to their unoptimized equivalents when their code cannot be compiled"""
+
+    def setUp(self):
+        self.optimized = inlinec.optimized
+        inlinec.optimized = True
+        self.calls = []
+
+    def tearDown(self):
+        inlinec.optimized = self.optimized
+        for name in ('fallbacktest.fn_opt','fallbacktest.Trace_opt'):
+            inlinec.optimized_components.pop(name,None)
+            inlinec.unavailable_components.discard(name)
+
+    def provide(self,optimized,unoptimized):
+        namespace = {'__name__':'fallbacktest',optimized.__name__:optimized,
+                     unoptimized.__name__:unoptimized}
+        inlinec.provide_unoptimized_equivalent(optimized.__name__,unoptimized.__name__,namespace)
+        return namespace[optimized.__name__]
+
+    def test_function(self):
+        def fn_opt(x):
+            self.calls.append('optimized')
+            raise inlinec.CompilationError("no compiler")
+        def fn(x):
+            self.calls.append('unoptimized')
+            return x+1
+        fn_opt = self.provide(fn_opt,fn)
+        self.assertEqual(fn_opt(1),2)
+        self.assertEqual(fn_opt(2),3)
+        self.assertEqual(self.calls,['optimized','unoptimized','unoptimized'])
+        self.assertTrue('fallbacktest.fn_opt' in inlinec.unavailable_components)
+
+    def test_compiled_function(self):
+        def fn_opt(x):
+            return x+1
+        def fn(x):
+            raise AssertionError
+        fn_opt = self.provide(fn_opt,fn)
+        self.assertEqual(fn_opt(1),2)
+        self.assertFalse('fallbacktest.fn_opt' in inlinec.unavailable_components)
+
+    def test_class(self):
+        class Trace(param.Parameterized):
+            def __init__(self,**params):
+                super(Trace,self).__init__(**params)
+                self.trace = 0
+            def __call__(self,x):
+                self.trace += x
+                return self.trace
+        class Trace_opt(Trace):
+            def __call__(self,x):
+                self.trace += x
+                raise inlinec.CompilationError("no compiler")
+        Trace_opt = self.provide(Trace_opt,Trace)
+        trace = Trace_opt()
+        # The unoptimized method starts from the state before the optimized one ran
+        self.assertEqual(trace(1),1)
+        self.assertEqual(trace(1),2)
+        self.assertTrue(isinstance(trace,Trace_opt))
+        self.assertTrue('fallbacktest.Trace_opt' in inlinec.unavailable_components)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
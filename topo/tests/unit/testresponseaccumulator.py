@@ -0,0 +1,82 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+import topo
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection
+from topo.base.generatorsheet import GeneratorSheet
+from topo.analysis.featureresponses import ResponseAccumulator, measure_rfs_streaming, pattern_response
+
+
+class TestResponseAccumulator(unittest.TestCase):
+
+    def test_matches_stored_responses(self):
+        """Streaming sums should match reverse correlation over stored responses"""
+        rs = numpy.random.RandomState(3)
+        stimuli = rs.uniform(size=(50,4,5))
+        responses = rs.uniform(size=(50,3,2))
+        responses[:,0,0] = 0.0 # a unit that never responds
+
+        accumulator = ResponseAccumulator(batch_size=8)
+        for stimulus,response in zip(stimuli,responses):
+            accumulator(1.0,{'Retina':stimulus},{'V1':response})
+        accumulator.flush()
+        self.assertEqual(accumulator.presentations,50)
+
+        rfs = accumulator.rfs('Retina','V1',1.0)
+        self.assertEqual(rfs.shape,(3,2,4,5))
+        for r in range(3):
+            for c in range(2):
+                weights = responses[:,r,c]
+                if weights.sum() == 0:
+                    expected = numpy.zeros((4,5))
+                else:
+                    expected = numpy.tensordot(weights,stimuli,axes=1)/weights.sum()
+                numpy.testing.assert_array_almost_equal(rfs[r,c],expected,decimal=5)
+
+    def test_float64(self):
+        accumulator = ResponseAccumulator(batch_size=4,dtype=numpy.float64)
+        accumulator(1.0,{'Retina':numpy.ones((2,2))},{'V1':numpy.ones((1,3))})
+        accumulator.flush()
+        self.assertEqual(accumulator.rfs('Retina','V1',1.0).dtype,numpy.float64)
+
+
+
+class TestMeasureRFsStreaming(unittest.TestCase):
+
+    def setUp(self):
+        topo.sim = Simulation()
+        topo.sim['Retina'] = GeneratorSheet(nominal_density=6,nominal_bounds=BoundingBox(radius=0.5),
+                                            period=1.0,phase=0.05)
+        topo.sim['V1'] = CFSheet(nominal_density=4,nominal_bounds=BoundingBox(radius=0.5))
+        topo.sim.connect('Retina','V1',delay=0.05,connection_type=CFProjection,
+                         nominal_bounds_template=BoundingBox(radius=0.3),
+                         weights_generator=imagen.Gaussian(size=0.3))
+
+    def test_matches_stored_responses(self):
+        """Streaming RFs should match reverse correlation over stored responses"""
+        accumulator = measure_rfs_streaming(presentations=20,inputs=['Retina'],outputs=['V1'],
+                                            batch_size=8,seed=5)
+
+        # The same white noise, presented with all responses stored
+        noise = imagen.random.UniformRandom(random_generator=numpy.random.RandomState(seed=5))
+        stimuli,responses = [],[]
+        for i in range(20):
+            stored = pattern_response(inputs={'Retina':noise},outputs=['Retina','V1'],
+                                      durations=[1.0],progress_bar=False)
+            stimuli.append(stored[('Retina',1.0)])
+            responses.append(stored[('V1',1.0)])
+        stimuli,responses = numpy.array(stimuli),numpy.array(responses)
+        self.assertTrue(len(numpy.unique(stimuli[:,0,0]))>1 and responses.all())
+
+        expected = (numpy.tensordot(responses,stimuli,axes=(0,0)) /
+                    responses.sum(axis=0)[:,:,numpy.newaxis,numpy.newaxis])
+        numpy.testing.assert_array_almost_equal(accumulator.rfs('Retina','V1',1.0),expected,decimal=5)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,111 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen, numbergen
+
+import topo
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet, CFProjection, CFPOF_Plugin
+from topo.base.generatorsheet import GeneratorSheet
+from topo.sheet import SettlingCFSheet
+from topo.transferfn import DivisiveNormalizeL1, PiecewiseLinear
+from topo.misc.distributed import run_distributed
+from topo.misc.rowstripes import decompose_rows, stripe_names, gather_rows, RowConnection
+
+STRIPES = 3
+
+
+def build():
+    """A V1 with afferent and lateral projections of different sizes"""
+    topo.sim['Retina'] = GeneratorSheet(nominal_density=12,nominal_bounds=BoundingBox(radius=0.75),
+        period=1.0,phase=0.05,input_generator=imagen.Gaussian(size=0.2,
+            x=numbergen.UniformRandom(lbound=-0.4,ubound=0.4,seed=1),
+            y=numbergen.UniformRandom(lbound=-0.4,ubound=0.4,seed=2)))
+    topo.sim['V1'] = SettlingCFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5),
+        tsettle=3,output_fns=[PiecewiseLinear(lower_bound=0.0,upper_bound=0.5)])
+    normalize = [CFPOF_Plugin(single_cf_fn=DivisiveNormalizeL1())]
+    topo.sim.connect('Retina','V1',name='Afferent',delay=0.05,connection_type=CFProjection,
+                     nominal_bounds_template=BoundingBox(radius=0.25),learning_rate=0.5,
+                     weights_generator=imagen.Gaussian(size=0.3,aspect_ratio=0.4,orientation=0.5),
+                     weights_output_fns=normalize)
+    for name,radius,strength in (('LateralExcitatory',0.1,0.9),('LateralInhibitory',0.3,-0.9)):
+        topo.sim.connect('V1','V1',name=name,delay=0.01,connection_type=CFProjection,
+                         nominal_bounds_template=BoundingBox(radius=radius),strength=strength,
+                         learning_rate=0.5,weights_output_fns=normalize)
+
+
+def build_striped():
+    build()
+    decompose_rows('V1',STRIPES)
+
+
+def weights(sim):
+    """The weights of each CF of each projection of V1 (or of its stripes, stacked)"""
+    if 'V1' in sim.objects():
+        projs = dict((p.name,p.cfs) for p in sim['V1'].in_connections)
+    else:
+        stripes = [sim[name] for name in stripe_names('V1',STRIPES) if name in sim.objects()]
+        if not stripes:
+            return {}
+        projs = dict((p.name,numpy.vstack([s.projections(p.name).cfs for s in stripes]))
+                     for p in stripes[0].in_connections)
+    return dict((name,[cf.weights.copy() for cf in cfs.flat]) for name,cfs in projs.items())
+
+
+
+class TestRowStripes(unittest.TestCase):
+
+    def setUp(self):
+        topo.sim = Simulation()
+        build()
+        topo.sim.run(2.0)
+        self.activity = topo.sim['V1'].activity.copy()
+        self.weights = weights(topo.sim)
+        topo.sim = Simulation()
+
+    def assertWeightsEqual(self,w):
+        self.assertEqual(sorted(w),sorted(self.weights))
+        for name in w:
+            for a,b in zip(w[name],self.weights[name]):
+                numpy.testing.assert_array_equal(a,b)
+
+    def test_matches_original(self):
+        build_striped()
+        self.assertFalse('V1' in topo.sim.objects())
+        # Each halo holds only the rows its stripe's CFs need
+        for name in stripe_names('V1',STRIPES):
+            self.assertTrue(topo.sim[name+'V1Halo'].shape[0]<10)
+            self.assertTrue(topo.sim[name+'RetinaHalo'].shape[0]<18)
+        topo.sim.run(2.0)
+        numpy.testing.assert_array_equal(gather_rows('V1'),self.activity)
+        self.assertWeightsEqual(weights(topo.sim))
+
+    def test_distributed(self):
+        results = run_distributed(build_striped,[['Retina']]+[[name] for name in stripe_names('V1',STRIPES)],
+                                  2.0,collect=weights)
+        numpy.testing.assert_array_equal(gather_rows('V1',results),self.activity)
+        # Each worker has only its own stripe's CFs
+        for i,(activities,w) in enumerate(results[1:]):
+            self.assertEqual(sorted(activities),sorted(
+                name%i for name in ('V1Stripe%d','V1Stripe%dRetinaHalo','V1Stripe%dV1Halo')))
+            self.assertEqual(len(w['Afferent']),activities['V1Stripe%d'%i].size)
+        self.assertWeightsEqual(dict((name,sum([w[name] for a,w in results[1:]],[]))
+                                     for name in self.weights))
+
+    def test_select_rows(self):
+        conn = RowConnection(rows=(2,5))
+        data = numpy.arange(8)
+        numpy.testing.assert_array_equal(conn.select(data),[2,3,4])
+        numpy.testing.assert_array_equal(conn.select(conn.select(data)),[2,3,4])
+
+    def test_outgoing_projection(self):
+        build()
+        topo.sim['V2'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        topo.sim.connect('V1','V2',connection_type=CFProjection)
+        self.assertRaises(NotImplementedError,decompose_rows,'V1',STRIPES)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -5,12 +5,20 @@ Unit test for Simulation
 import unittest
 import copy
 import pickle
+import os
+import json
+import shutil
+import tempfile
 
 import numpy as np
-from topo.base.simulation import Simulation,EPConnection,EPConnectionEvent,Event
+from topo.base.simulation import Simulation,EPConnection,EPConnectionEvent,Event,EventProcessor,_held_events
 from topo.base.ep import *
 
 from topo.base.cf import CFSheet, CFProjection
+from topo.base.generatorsheet import GeneratorSheet
+from topo.sheet import SettlingCFSheet
+from holoviews import BoundingBox
+import imagen
 
 from topo.tests.utils import new_simulation
 
@@ -145,6 +153,168 @@ class TestSimulation(unittest.TestCase):
         assert s.events[4] == e2a
 
 
+    def test_time_resolution(self):
+        """Integer-tick time should deliver the same events at the same times"""
+        class Recorder(EventProcessor):
+            dest_ports = None
+            def __init__(self,**params):
+                super(Recorder,self).__init__(**params)
+                self.log = []
+            def input_event(self,conn,data):
+                self.log.append((self.simulation.time(),conn.name,data))
+
+        logs = []
+        for resolution in (None,1000,20):
+            s = Simulation(register=False,time_resolution=resolution)
+            s['pulse1'] = PulseGenerator(period=1,phase=0.05)
+            s['pulse2'] = PulseGenerator(period=0.3)
+            s['sum_unit'] = SumUnit()
+            s['recorder'] = Recorder()
+            s.connect('pulse1','sum_unit',delay=0.05)
+            s.connect('pulse2','sum_unit',delay=0.1)
+            s.connect('sum_unit','recorder',delay=0.05)
+            s.run(2.5)
+            s.event_push()
+            s.run(1.0)
+            s.event_pop()
+            s.run(1.5)
+            self.assertEqual(s.time(),4)
+            self.assertAlmostEqual(float(s.next_event_time()),4.05)
+            logs.append(s['recorder'].log)
+
+        self.assertEqual(logs[0],logs[1])
+        self.assertEqual(logs[0],logs[2])
+
+
+    def test_component_timings(self):
+        s = Simulation()
+        s['Retina'] = GeneratorSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5),
+                                     period=1.0,phase=0.05)
+        s['V1'] = CFSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5))
+        s.connect('Retina','V1',name='Afferent',delay=0.05,connection_type=CFProjection,
+                  learning_rate=0.1)
+
+        s.timings.clear()
+        s.run(1.0)
+        self.assertEqual(s.timings.rows(),[])
+
+        s.timings.enabled = True
+        try:
+            s.run(3.0)
+        finally:
+            s.timings.enabled = False
+        calls = dict(((component,stage),calls)
+                     for component,stage,calls,total in s.timings.rows())
+        self.assertEqual(calls[('V1','input_event')],3)
+        self.assertEqual(calls[('Retina','send_output')],3)
+        for stage in ('input_fns','response_fn','output_fns','learning_fn','weights_output_fns'):
+            self.assertEqual(calls[('V1.Afferent',stage)],3)
+        self.assertTrue(('V1','process_current_time') in calls)
+        self.assertTrue(('Simulation','event_queue') in calls)
+        self.assertTrue('response_fn' in s.timings.table())
+
+
+    def test_tracer(self):
+        s = Simulation()
+        s['Retina'] = GeneratorSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5),
+                                     period=1.0,phase=0.05)
+        s['V1'] = SettlingCFSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5),
+                                  tsettle=2)
+        s.connect('Retina','V1',name='Afferent',delay=0.05,connection_type=CFProjection)
+        s.connect('V1','V1',name='Lateral',delay=0.01,connection_type=CFProjection)
+
+        # Without a file, only the most recent spans are kept
+        s.tracer.start(capacity=4)
+        s.run(1.0)
+        s.tracer.stop()
+        records,names = s.tracer.records()
+        self.assertEqual(len(records),4)
+        self.assertEqual(names[records[-1]['stage']],'run')
+
+        path = tempfile.mkdtemp()
+        try:
+            trace = os.path.join(path,'sim.trace')
+            s.tracer.start(trace,capacity=4)
+            s.run(2.0)
+            s.tracer.stop()
+            records,names = s.tracer.records()
+            spans = [(names[r['component']],names[r['stage']]) for r in records]
+            self.assertEqual(spans.count(('Simulation','run')),1)
+            # Each input settles for tsettle steps and then learns
+            self.assertEqual(spans.count(('V1','activate')),4)
+            self.assertEqual(spans.count(('V1','learn')),2)
+            self.assertEqual(spans.count(('V1','process_current_time')),6)
+            self.assertTrue(all(records['sim_time']>=1.0))
+            self.assertTrue(all(records['duration']>=0))
+
+            s.tracer.export(trace+'.json')
+            with open(trace+'.json') as f:
+                events = json.load(f)['traceEvents']
+            self.assertEqual(len(events),len(records))
+            self.assertEqual(events[-1]['name'],'Simulation run')
+            self.assertEqual(events[-1]['ph'],'X')
+        finally:
+            shutil.rmtree(path)
+
+
+    def test_parallel_threads(self):
+        def hierarchical_sim(**params):
+            s = Simulation(register=False,**params)
+            for i in range(3):
+                s['Retina%d'%i] = GeneratorSheet(nominal_density=8,period=1.0,phase=0.05,
+                                                 nominal_bounds=BoundingBox(radius=0.5),
+                                                 input_generator=imagen.Gaussian(x=0.1*i,size=0.2))
+                s['V1%d'%i] = SettlingCFSheet(nominal_density=8,tsettle=2,
+                                              nominal_bounds=BoundingBox(radius=0.5))
+                s.connect('Retina%d'%i,'V1%d'%i,name='Afferent',delay=0.05,
+                          connection_type=CFProjection,learning_rate=0.5)
+                s.connect('V1%d'%i,'V1%d'%i,name='Lateral',delay=0.01,
+                          connection_type=CFProjection,learning_rate=0.5)
+            # Processed together with V10
+            s['V2'] = CFSheet(nominal_density=8,nominal_bounds=BoundingBox(radius=0.5))
+            s.connect('V10','V2',name='Afferent',delay=0,connection_type=CFProjection)
+            return s
+
+        # The events sent are enqueued in the same order
+        def queue(s):
+            return [(e.time,type(e),e.conn.name,e.conn.dest.name) if hasattr(e,'conn')
+                    else (e.time,type(e)) for e in s.events]
+
+        # The Simulations share the clock, so each starts at the same time
+        start = Simulation(register=False).time()
+        for time_resolution in (None,1000):
+            serial = hierarchical_sim(time_resolution=time_resolution)
+            serial.run(3.0)
+            serial.time(start)
+            parallel = hierarchical_sim(parallel_threads=3,time_resolution=time_resolution)
+            self.assertEqual(sorted(sorted(ep.name for ep in group) for group in parallel._independent_groups()),
+                             [['Retina0'],['Retina1'],['Retina2'],['V10','V2'],['V11'],['V12']])
+            parallel.run(3.0)
+            parallel.time(start)
+            for name in serial.objects():
+                np.testing.assert_array_equal(serial[name].activity,parallel[name].activity)
+            for name in ['V10','V11','V12']:
+                np.testing.assert_array_equal(serial[name].projections('Lateral').cfs[3,3].weights,
+                                              parallel[name].projections('Lateral').cfs[3,3].weights)
+            self.assertEqual(queue(serial),queue(parallel))
+            if time_resolution is not None:
+                self.assertEqual(parallel._event_ticks,[e.time for e in parallel.events])
+
+        # Events sent over connections (as by CFSheets with a
+        # time_resolution) are held back too, rather than enqueued from
+        # several threads at once
+        conn = parallel['V11'].projections('Lateral')
+        queued = len(parallel.events)
+        parallel._holding_events = True
+        _held_events.events = []
+        try:
+            parallel.enqueue_connection_event(conn,parallel['V11'].activity)
+        finally:
+            parallel._holding_events = False
+        self.assertEqual(len(parallel.events),queued)
+        self.assertEqual(len(_held_events.events),1)
+
+
     def test_get_objects(self):
         s = Simulation()
 
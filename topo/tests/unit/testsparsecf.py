@@ -0,0 +1,360 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFSheet
+from topo.base.generatorsheet import GeneratorSheet
+
+from nose.plugins.skip import SkipTest
+from topo.sparse import sparsecf
+if not sparsecf.use_sparse:
+    raise SkipTest("Sparse extension not compiled: testsparsecf skipped")
+
+from topo.sparse import sparse
+from topo.sparse.sparsecf import SparseCFProjection, CFSPOF_SproutRetract, _cf_triplets, \
+     CFPRF_DotProduct_Sparse, CFPLF_Hebbian_Sparse, CFPOF_DivisiveNormalizeL1_Sparse, \
+     CFPRF_DotProduct_Sparse_opt, CFPLF_Hebbian_Sparse_opt
+
+
+def sparse_sim(**params):
+    """A GeneratorSheet projecting to a CFSheet through a SparseCFProjection"""
+    params.setdefault('weights_generator',imagen.Gaussian(size=0.3,aspect_ratio=0.5))
+    sim = Simulation()
+    sim['Src'] = GeneratorSheet(nominal_density=12,nominal_bounds=BoundingBox(radius=0.5))
+    sim['Dest'] = CFSheet(nominal_density=6,nominal_bounds=BoundingBox(radius=0.5))
+    sim.connect('Src','Dest',name='Proj',connection_type=SparseCFProjection,
+                nominal_bounds_template=BoundingBox(radius=0.2),**params)
+    return sim
+
+
+
+class TestSparseConnectionField(unittest.TestCase):
+
+    def setUp(self):
+        self.proj = sparse_sim()['Dest'].projections('Proj')
+
+    def test_weights_writable(self):
+        cf,other = self.proj.flatcfs[7],self.proj.flatcfs[8]
+        weights,other_weights = cf.weights.copy(),other.weights.copy()
+        cf.weights *= 2.0
+        numpy.testing.assert_array_almost_equal(cf.weights,2*weights)
+        numpy.testing.assert_array_equal(other.weights,other_weights)
+
+    def test_weights_match_blocks(self):
+        blocks = self.proj.get_cf_blocks()
+        for i,cf in enumerate(self.proj.flatcfs):
+            rows,cols = cf.weights.shape
+            numpy.testing.assert_array_equal(cf.weights,blocks[i,:rows,:cols])
+            numpy.testing.assert_array_equal(cf.mask,blocks[i,:rows,:cols]!=0)
+
+    def test_weights_setter(self):
+        cf = self.proj.flatcfs[0]
+        new_weights = numpy.arange(cf.weights.size,dtype=numpy.float32).reshape(cf.weights.shape)
+        cf.weights = new_weights
+        numpy.testing.assert_array_equal(cf.weights,new_weights)
+        self.assertFalse(cf.mask[0,0])
+
+
+
+class TestCFBlocks(unittest.TestCase):
+
+    def setUp(self):
+        self.proj = sparse_sim()['Dest'].projections('Proj')
+
+    def test_round_trip(self):
+        weights = self.proj.weights.toarray()
+        blocks = self.proj.get_cf_blocks()
+        self.assertEqual(blocks.dtype,numpy.float32)
+        self.proj.set_cf_blocks(blocks)
+        numpy.testing.assert_array_equal(self.proj.weights.toarray(),weights)
+
+    def test_units_subset(self):
+        units = numpy.array([3,0,20])
+        blocks = self.proj.get_cf_blocks(units)
+        for block,unit in zip(blocks,units):
+            rows,cols = self.proj.flatcfs[unit].weights.shape
+            numpy.testing.assert_array_equal(block[:rows,:cols],self.proj.flatcfs[unit].weights)
+            self.assertFalse(block[rows:].any() or block[:,cols:].any())
+        # Reusing the output array
+        out = numpy.ones_like(blocks)
+        self.assertTrue(self.proj.get_cf_blocks(units,out=out) is out)
+        numpy.testing.assert_array_equal(out,blocks)
+
+    def test_set_units_subset(self):
+        weights = self.proj.weights.toarray()
+        units = numpy.array([5,9])
+        self.proj.set_cf_blocks(2*self.proj.get_cf_blocks(units),units)
+        weights[:,units] *= 2
+        numpy.testing.assert_array_equal(self.proj.weights.toarray(),weights)
+
+
+
+def per_cf_weights(proj):
+    """
+    Dense (source units x destination units) weights of a
+    SparseCFProjection, initialized and placed one CF at a time.
+    """
+    dense = numpy.zeros((proj.src.activity.size,proj.dest.activity.size),dtype=numpy.float32)
+    for cf in proj.flatcfs:
+        x1,x2,y1,y2 = cf.src_slice
+        rows = numpy.ravel_multi_index(numpy.mgrid[x1:x2,y1:y2],proj.src.activity.shape)
+        dense[rows.flat,cf.oned_idx] = cf._init_weights(proj.mask_template).flat
+    return dense
+
+
+
+class TestSparseCFProjectionCreation(unittest.TestCase):
+
+    def test_weights_match_per_cf(self):
+        """Weights loaded from the batched triplets should match those created CF by CF"""
+        proj = sparse_sim(weights_output_fns=[])['Dest'].projections('Proj')
+        # CFs at the edges are cropped, so the blocks differ in shape
+        self.assertTrue(len(set(cf.weights.shape for cf in proj.flatcfs))>1)
+        numpy.testing.assert_array_equal(proj.weights.toarray(),per_cf_weights(proj))
+
+    def test_cf_triplets(self):
+        blocks = [numpy.array([[1,0],[2,3]]),numpy.array([[0,4,5]])]
+        slices = [(1,3,0,2),(0,1,2,5)]
+        expected = [(4,7,1),(8,7,2),(9,7,3),(3,2,4),(4,2,5)]
+        rows,cols,vals = _cf_triplets(blocks,slices,4,[7,2])
+        self.assertEqual(sorted(zip(rows,cols,vals)),sorted(expected))
+        # Blocks already packed into one zero-padded array, with
+        # values in the padding ignored
+        padded = numpy.array([[[1,0,9],[2,3,9]],[[0,4,5],[9,9,9]]])
+        rows,cols,vals = _cf_triplets(padded,slices,4,[7,2])
+        self.assertEqual(sorted(zip(rows,cols,vals)),sorted(expected))
+
+
+
+class TestSparseKernelThreads(unittest.TestCase):
+    """The sparse kernels should give identical results for any number of threads"""
+
+    thread_counts = (1,2,4,0)
+
+    def setUp(self):
+        self.proj = sparse_sim(learning_rate=1.0)['Dest'].projections('Proj')
+        rng = numpy.random.RandomState(7)
+        self.proj.input_buffer = rng.rand(*self.proj.src.activity.shape)
+        self.proj.src.activity[:] = self.proj.input_buffer
+        self.proj.dest.activity[:] = rng.rand(*self.proj.dest.activity.shape)
+        self.weights = self.proj.weights.copy()
+
+    def assertSameForAllThreads(self,fn,attrs):
+        """
+        Apply fn to fresh copies of the weights with each thread
+        count, checking that the given attributes of the projection
+        come out the same.
+        """
+        results = []
+        for threads in self.thread_counts:
+            self.proj.weights = self.weights.copy()
+            self.proj.activity *= 0.0
+            self.proj.has_norm_total = False
+            fn(self.proj,threads=threads)
+            results.append([self.proj.weights.toarray() if a=='weights' else
+                            getattr(self.proj,a).copy() for a in attrs])
+        for result in results[1:]:
+            for a,b in zip(results[0],result):
+                numpy.testing.assert_array_equal(a,b)
+        return results[0]
+
+    def test_dot_product(self):
+        activity, = self.assertSameForAllThreads(CFPRF_DotProduct_Sparse,['activity'])
+        self.assertTrue(activity.all())
+
+    def test_hebbian(self):
+        weights,norm_total = self.assertSameForAllThreads(CFPLF_Hebbian_Sparse,['weights','norm_total'])
+        self.assertFalse((weights==self.weights.toarray()).all())
+
+    def test_divisive_normalize(self):
+        weights,norm_total = self.assertSameForAllThreads(CFPOF_DivisiveNormalizeL1_Sparse,
+                                                          ['weights','norm_total'])
+        numpy.testing.assert_array_almost_equal(weights.sum(axis=0),1.0,decimal=5)
+
+
+
+class TestSparseKernelsOpt(unittest.TestCase):
+    """
+    The optimized sparse kernels should match the dense computations
+    they replace.
+    """
+
+    def setUp(self):
+        self.proj = sparse_sim(learning_rate=1.0)['Dest'].projections('Proj')
+        self.rng = numpy.random.RandomState(11)
+        # Inputs and outputs with few active units
+        self.input_activity = self.sparse_activity(self.proj.src.activity.shape,0.05)
+        self.proj.input_buffer = self.input_activity
+        self.proj.src.activity[:] = self.input_activity
+        self.proj.dest.activity[:] = self.sparse_activity(self.proj.dest.activity.shape,0.3)
+
+    def sparse_activity(self,shape,fraction):
+        activity = self.rng.rand(*shape)
+        activity[self.rng.rand(*shape)>=fraction] = 0.0
+        self.assertTrue(0<numpy.count_nonzero(activity)<fraction*activity.size)
+        return activity
+
+    def dense_dot_product(self):
+        return self.proj.strength*numpy.dot(self.input_activity.flat,self.proj.weights.toarray()
+                                            ).reshape(self.proj.activity.shape)
+
+    def test_hebbian_and_normalize_cols(self):
+        weights = self.proj.weights.toarray().astype(numpy.float64)
+        dest = self.proj.dest.activity.ravel()
+        active = dest!=0
+        CFPLF_Hebbian_Sparse_opt(self.proj)
+        numpy.testing.assert_array_equal(self.proj.learned_units,numpy.flatnonzero(active))
+        CFPOF_DivisiveNormalizeL1_Sparse(self.proj)
+
+        # Hebbian learning of the existing connections of active
+        # units only, followed by their L1 normalization
+        lr = self.proj.learning_rate/self.proj.n_units
+        expected = weights + lr*numpy.outer(self.input_activity.ravel(),dest)*(weights!=0)
+        expected[:,active] /= expected[:,active].sum(axis=0)
+        numpy.testing.assert_array_almost_equal(self.proj.weights.toarray(),expected,decimal=6)
+        numpy.testing.assert_array_equal(self.proj.weights.toarray()[:,~active],weights[:,~active])
+
+    def test_hebbian_cols_matches_all_cols(self):
+        """Only the learned columns differ from learning on all columns"""
+        weights = self.proj.weights.copy()
+        CFPLF_Hebbian_Sparse_opt(self.proj)
+        CFPOF_DivisiveNormalizeL1_Sparse(self.proj)
+        learned = self.proj.weights.toarray()
+        self.proj.weights = weights
+        CFPLF_Hebbian_Sparse(self.proj)
+        CFPOF_DivisiveNormalizeL1_Sparse(self.proj)
+        active = self.proj.dest.activity.ravel()!=0
+        numpy.testing.assert_array_almost_equal(learned[:,active],
+                                                self.proj.weights.toarray()[:,active],decimal=6)
+
+    def test_dot_product_rows(self):
+        active_inputs = numpy.flatnonzero(self.input_activity).astype(numpy.int32)
+        self.proj.weights.DotProduct_rows(self.proj.strength,self.input_activity,
+                                          active_inputs,self.proj.activity)
+        numpy.testing.assert_array_almost_equal(self.proj.activity,self.dense_dot_product())
+
+    def test_dot_product_opt_sparse_input(self):
+        """Below active_fraction, the row-wise dot product should match the full one"""
+        self.assertTrue(numpy.count_nonzero(self.input_activity) <
+                        CFPRF_DotProduct_Sparse_opt.active_fraction*self.input_activity.size)
+        CFPRF_DotProduct_Sparse_opt(self.proj)
+        rows_activity = self.proj.activity.copy()
+        self.proj.activity *= 0.0
+        CFPRF_DotProduct_Sparse(self.proj)
+        numpy.testing.assert_array_almost_equal(rows_activity,self.proj.activity)
+        numpy.testing.assert_array_almost_equal(rows_activity,self.dense_dot_product())
+
+    def test_row_index_after_changes(self):
+        """The row index should follow changes to the weights"""
+        CFPRF_DotProduct_Sparse_opt(self.proj)
+        # Learning changes only the values
+        self.proj.dest.activity[:] = 1.0
+        CFPLF_Hebbian_Sparse(self.proj)
+        self.proj.activity *= 0.0
+        CFPRF_DotProduct_Sparse_opt(self.proj)
+        numpy.testing.assert_array_almost_equal(self.proj.activity,self.dense_dot_product())
+        # Retraction and sprouting change the structure
+        thresholds = numpy.zeros(self.proj.dest.activity.size,dtype=numpy.float32)
+        self.proj.weights.retract(numpy.repeat(numpy.int32(5),len(thresholds)),thresholds)
+        self.proj.activity *= 0.0
+        CFPRF_DotProduct_Sparse_opt(self.proj)
+        numpy.testing.assert_array_almost_equal(self.proj.activity,self.dense_dot_product())
+        active_inputs = numpy.flatnonzero(self.input_activity).astype(numpy.int32)
+        new_rows = active_inputs[self.proj.weights.toarray()[active_inputs,0]==0]
+        self.proj.weights.insertTriplets(new_rows,numpy.zeros_like(new_rows),
+                                         numpy.ones(len(new_rows),dtype=numpy.float32))
+        self.proj.activity *= 0.0
+        CFPRF_DotProduct_Sparse_opt(self.proj)
+        numpy.testing.assert_array_almost_equal(self.proj.activity,self.dense_dot_product())
+
+
+
+def column_nnz(weights,n_cols):
+    """Number of stored weights in each column of a csarray_float"""
+    rows,cols,vals = weights.getTriplets()
+    return numpy.bincount(cols,minlength=n_cols)
+
+
+
+class TestSproutRetract(unittest.TestCase):
+
+    def setUp(self):
+        # Four columns of 16 rows, holding 0, 1, 5 and 16 weights
+        self.weights = sparse.csarray_float((4,4),(2,2))
+        rows = numpy.array([0]+range(5)+range(16),dtype=numpy.int32)
+        cols = numpy.array([1]+[2]*5+[3]*16,dtype=numpy.int32)
+        vals = numpy.arange(1,len(rows)+1,dtype=numpy.float32)
+        self.weights.setTriplets(rows,cols,vals)
+        self.weights.compress()
+
+    def test_retract(self):
+        thresholds = numpy.zeros(4,dtype=numpy.float32)
+        self.weights.retract(numpy.array([2,2,2,20],dtype=numpy.int32),thresholds)
+        # The strongest weight of each nonempty column is always kept
+        numpy.testing.assert_array_equal(column_nnz(self.weights,4),[0,1,3,1])
+        numpy.testing.assert_array_equal(thresholds,[0,1,4,22])
+
+    def test_retract_then_insert(self):
+        thresholds = numpy.zeros(4,dtype=numpy.float32)
+        self.weights.retract(numpy.array([0,0,3,10],dtype=numpy.int32),thresholds)
+        numpy.testing.assert_array_equal(column_nnz(self.weights,4),[0,1,2,6])
+        # Sprout into the locations just retracted, and into an empty column
+        rows = numpy.array([0,1,2,0,1,15],dtype=numpy.int32)
+        cols = numpy.array([2,2,2,3,3,0],dtype=numpy.int32)
+        self.weights.insertTriplets(rows,cols,thresholds[cols])
+        numpy.testing.assert_array_equal(column_nnz(self.weights,4),[1,1,5,8])
+        dense = self.weights.toarray()
+        self.assertEqual(dense[15,0],0.0)
+        self.assertEqual(dense[1,2],thresholds[2])
+        self.assertEqual(dense[4,2],6.0)
+
+    def test_negative_sprout_count(self):
+        """CFs with negative sprout counts should not sprout at all"""
+        weights = numpy.zeros((3,5,5))
+        weights[:,2,2] = 1.0
+        unit,r,c = CFSPOF_SproutRetract(disk_mask=False).sprout(weights,weights==0,
+                                                                numpy.array([-4,0,3]))
+        numpy.testing.assert_array_equal(unit,[2,2,2])
+        self.assertTrue((weights[unit,r,c]==0).all())
+
+    def test_chunks(self):
+        """Processing the CFs in chunks retracts and sprouts the same numbers of connections"""
+        results = []
+        for chunk_size in (1,7,1024):
+            sim = sparse_sim()
+            proj = sim['Dest'].projections('Proj')
+            # Leave room to sprout
+            blocks = proj.get_cf_blocks()
+            blocks[:,:,::2] = 0.0
+            proj.set_cf_blocks(blocks)
+            before = proj.weights.toarray()
+            fn = CFSPOF_SproutRetract(interval=1,chunk_size=chunk_size,turnover_rate=0.5)
+            fn(proj)
+            sim.time(1)
+            fn(proj)
+            after = proj.weights.toarray()
+            # Connections sprout only where there were none before
+            sprouted = (before == 0) & (after != 0)
+            results.append((numpy.where(before != 0,after,0),sprouted.sum(axis=0)))
+            sim.time(0)
+        self.assertTrue((results[0][0] != before).any())
+        self.assertTrue(results[0][1].any())
+        for kept,n_sprouted in results[1:]:
+            numpy.testing.assert_array_equal(kept,results[0][0])
+            numpy.testing.assert_array_equal(n_sprouted,results[0][1])
+
+    def test_calc_ratios(self):
+        """Above full density, sprout counts go negative"""
+        sr = CFSPOF_SproutRetract(target_sparsity=0.5,turnover_rate=0.5,residual_turnover=0.0)
+        sprout_counts,prune_counts = sr.calc_ratios(numpy.array([0,50,100,200]),
+                                                    numpy.array([100,100,100,100]))
+        numpy.testing.assert_array_equal(sprout_counts,[50,0,0,-150])
+        numpy.testing.assert_array_equal(prune_counts,[0,0,50,300])
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
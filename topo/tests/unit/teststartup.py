@@ -0,0 +1,59 @@
+"""
+Startup benchmark: checks that launching Topographica stays quick,
+i.e. that the slow optional packages are not imported until used.
+"""
+
+import os, sys, subprocess, unittest
+from timeit import default_timer
+
+import topo
+from topo.misc.util import LazyModule
+
+
+# Modules that must not be imported by a plain startup
+LAZY_MODULES = ['topo.analysis','topo.command','topo.plotting','topo.tkgui',
+                'matplotlib.pyplot','featuremapper']
+
+# Generous limit, in seconds, to catch gross slowdowns only
+MAX_STARTUP_TIME = 10.0
+
+
+def run_topographica(command):
+    """Run command in a new Topographica process, returning its output and the time taken."""
+    topographica = os.path.join(topo._root_path,'topographica')
+    start = default_timer()
+    output = subprocess.check_output([sys.executable,topographica,'-c',command])
+    return output,default_timer()-start
+
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_startup_time(self):
+        output,seconds = run_topographica("pass")
+        self.assertTrue(seconds<MAX_STARTUP_TIME,"Startup took %.1f s"%seconds)
+
+    def test_optional_packages_not_imported(self):
+        output,seconds = run_topographica(
+            "import sys; print ' '.join(m for m in sys.modules if sys.modules[m])")
+        modules = output.split()
+        for name in LAZY_MODULES:
+            self.assertFalse(name in modules,"%s imported at startup"%name)
+
+    def test_compilation_deferred(self):
+        """Weave's compilation test is run only by the first optimized component"""
+        output,seconds = run_topographica("from topo.misc import inlinec; print inlinec.compiled")
+        self.assertEqual(output.split()[-1],'None')
+
+    def test_lazy_module(self):
+        lazy = LazyModule('topo.misc.fixedpoint')
+        import topo.misc.fixedpoint
+        self.assertTrue(lazy.FixedPoint is topo.misc.fixedpoint.FixedPoint)
+        lazy.test_attribute = 1
+        self.assertEqual(topo.misc.fixedpoint.test_attribute,1)
+        del topo.misc.fixedpoint.test_attribute
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -0,0 +1,81 @@
+import unittest
+import numpy
+
+from holoviews import BoundingBox
+import imagen
+
+from topo.base.simulation import Simulation
+from topo.base.cf import CFProjection,CFSheet
+from topo.analysis.weights import ProjectionWeightStatistics, circular_dist
+
+
+class TestProjectionWeightStatistics(unittest.TestCase):
+
+    def setUp(self):
+        self.sim = Simulation()
+        self.sim['V1'] = CFSheet(nominal_density=10,nominal_bounds=BoundingBox(radius=0.5))
+        self.proj = self.sim.connect('V1','V1',name='Lateral',connection_type=CFProjection,
+                                     nominal_bounds_template=BoundingBox(radius=0.25),
+                                     weights_generator=imagen.random.UniformRandom())
+        rs = numpy.random.RandomState(7)
+        shape = self.sim['V1'].activity.shape
+        self.orientation = rs.uniform(0,numpy.pi,shape)
+        self.selectivity = rs.uniform(size=shape)
+        self.xpref = rs.uniform(-0.5,0.5,shape)
+        self.ypref = rs.uniform(-0.5,0.5,shape)
+
+    def _situated(self,cf):
+        situated = numpy.zeros(self.proj.src.activity.shape)
+        r1,r2,c1,c2 = cf.input_sheet_slice
+        situated[r1:r2,c1:c2] = cf.weights
+        return situated.ravel()
+
+    def test_isotropy_matches_per_cf(self):
+        """Compare against the per-CF computation used by WeightIsotropy"""
+        azimuths, weights = [], []
+        sel = self.selectivity.ravel()
+        for i,cf in enumerate(self.proj.flatcfs):
+            weight_arr = self._situated(cf)
+            mask = weight_arr>numpy.percentile(weight_arr,70)
+            weight = weight_arr[mask]*sel[i]*sel[mask]
+            dx = self.xpref.ravel()[mask]-self.xpref.flat[i]
+            dy = self.ypref.ravel()[mask]-self.ypref.flat[i]
+            far = numpy.sqrt(dx**2+dy**2)>0.1
+            delta = numpy.arctan2(dy,dx)-self.orientation.flat[i]
+            delta[delta<0] += numpy.pi*2
+            azimuths += [delta[far],((delta+numpy.pi)%(numpy.pi*2))[far]]
+            weights += [weight[far]]*2
+        expected,_ = numpy.histogram(numpy.concatenate(azimuths),range=(0,2*numpy.pi),
+                                     bins=20,weights=numpy.concatenate(weights))
+
+        for threads in (1,3):
+            stats = ProjectionWeightStatistics(self.proj,chunk_size=17,threads=threads)
+            hists,edges = stats.isotropy(self.orientation,self.selectivity,
+                                         self.xpref,self.ypref)
+            self.assertEqual(hists.shape,(len(self.proj.flatcfs),20))
+            numpy.testing.assert_array_almost_equal(hists.sum(axis=0),expected,decimal=4)
+
+    def test_feature_distribution_matches_per_cf(self):
+        """Compare against the per-CF computation used by WeightDistribution"""
+        deltas, weights = [], []
+        for i,cf in enumerate(self.proj.flatcfs):
+            weight_arr = self._situated(cf)
+            feature_slice = self.orientation.ravel()[weight_arr>0]
+            deltas.append(circular_dist(self.orientation.flat[i],feature_slice,numpy.pi))
+            weights.append(weight_arr[weight_arr>0])
+        expected,_ = numpy.histogram(numpy.concatenate(deltas),range=(0,numpy.pi/2),
+                                     bins=10,weights=numpy.concatenate(weights))
+
+        hists,edges = ProjectionWeightStatistics(self.proj).feature_distribution(
+            self.orientation,period=numpy.pi)
+        numpy.testing.assert_array_almost_equal(hists.sum(axis=0),expected,decimal=4)
+
+    def test_distance_histograms_cover_all_weights(self):
+        hists,edges = ProjectionWeightStatistics(self.proj).distance_histograms()
+        for i,cf in enumerate(self.proj.flatcfs):
+            self.assertAlmostEqual(hists[i].sum(),cf.weights.sum(),places=4)
+
+
+if __name__ == "__main__":
+	import nose
+	nose.runmodule()
@@ -745,7 +745,7 @@ class TopoConsole(tk.AppWindow,tk.TkParameterized):
 
         # JPALERT: This should really use .run_and_time() but it doesn't support
         # run(until=...)
-        topo.sim.run(until=topo.sim.events[0].time)
+        topo.sim.run(until=topo.sim.next_event_time())
         self.auto_refresh()
 
     def set_step_button_state(self):